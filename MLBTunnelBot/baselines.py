@@ -0,0 +1,333 @@
+import polars as pl
+
+from typing import Any, Optional
+import datetime
+import json
+import time
+import os
+
+from .consts import ARSENAL_BASELINE_DIR, BASELINE_MIN_PAIRS, TUNNEL_DISTANCE_FLOOR
+from .store import scan_scored_pairs
+
+# The arsenal baseline table has one row per pitcher x pitch type pair and
+# holds running sums for three pair geometries, each one the (x, z) offset of
+# a pitch from the previous pitch in the at bat:
+#
+#   release  release point                 (release_pos_x, release_pos_z)
+#   tunnel   location with no movement     (plate_x_no_movement, plate_z_no_movement)
+#   plate    actual location at the plate  (plate_x, plate_z)
+#
+# Sums, sums of squares and cross products merge by addition, so a new day is
+# folded in with one group by over (table + today) no matter how many seasons
+# are already in it. Means and covariances are materialized on every update so
+# scoring is a single hash join with no work at lookup time.
+#
+#   <baseline_dir>/dates.json                        {"table": ..., "dates": [...]}
+#   <baseline_dir>/arsenal_baselines.<version>.arrow the table dates.json names
+#
+# Every fold writes a new table version and then replaces dates.json, which is
+# the single commit point: a crash before it leaves the old table and dates,
+# a crash after it leaves the new ones, so a day is never folded in twice.
+BASELINE_KEYS: list[str] = ["pitcher", "prev_pitch_type", "pitch_type"]
+
+GEOMETRIES: dict[str, tuple[str, str]] = {
+    "release": ("release_pos_x", "release_pos_z"),
+    "tunnel": ("plate_x_no_movement", "plate_z_no_movement"),
+    "plate": ("plate_x", "plate_z"),
+}
+
+SUM_SUFFIXES: list[str] = ["sum_x", "sum_z", "sum_xx", "sum_xz", "sum_zz"]
+
+BASELINE_PREFIX = "arsenal_baselines"
+# the unversioned table written before dates.json named its table
+BASELINE_FILE = f"{BASELINE_PREFIX}.arrow"
+DATES_FILE = "dates.json"
+
+
+def _sum_cols() -> list[str]:
+    return [f"{geom}_{suffix}" for geom in GEOMETRIES for suffix in SUM_SUFFIXES]
+
+
+def _stat_cols() -> list[str]:
+    return [
+        f"{geom}_{stat}"
+        for geom in GEOMETRIES
+        for stat in ["mean_x", "mean_z", "cov_xx", "cov_xz", "cov_zz", "rms"]
+    ]
+
+
+def _pair_deltas(scored_df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Adds the (x, z) offset from the previous pitch for every geometry.
+    """
+    return scored_df.with_columns(
+        [
+            (pl.col(x) - pl.col(f"prev_{x}")).alias(f"{geom}_dx")
+            for geom, (x, _) in GEOMETRIES.items()
+        ]
+        + [
+            (pl.col(z) - pl.col(f"prev_{z}")).alias(f"{geom}_dz")
+            for geom, (_, z) in GEOMETRIES.items()
+        ]
+    )
+
+
+def _daily_sums(scored_df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Sufficient statistics of one batch of scored pitch pairs.
+    """
+    aggs: list[pl.Expr] = [pl.len().cast(pl.Int64).alias("n_pairs")]
+    for geom in GEOMETRIES:
+        dx, dz = pl.col(f"{geom}_dx"), pl.col(f"{geom}_dz")
+        aggs += [
+            dx.sum().alias(f"{geom}_sum_x"),
+            dz.sum().alias(f"{geom}_sum_z"),
+            (dx * dx).sum().alias(f"{geom}_sum_xx"),
+            (dx * dz).sum().alias(f"{geom}_sum_xz"),
+            (dz * dz).sum().alias(f"{geom}_sum_zz"),
+        ]
+    return _pair_deltas(scored_df).group_by(BASELINE_KEYS).agg(aggs)
+
+
+def _with_stats(sums_df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Materializes mean, covariance and root mean square offset length for every
+    geometry. The RMS length sqrt(|mean|^2 + trace(cov)) is this pitcher's
+    typical distance between the two pitch types.
+    """
+    n = pl.col("n_pairs")
+    stats: list[pl.Expr] = []
+    for geom in GEOMETRIES:
+        mean_x = pl.col(f"{geom}_sum_x") / n
+        mean_z = pl.col(f"{geom}_sum_z") / n
+        cov_xx = pl.col(f"{geom}_sum_xx") / n - mean_x * mean_x
+        cov_xz = pl.col(f"{geom}_sum_xz") / n - mean_x * mean_z
+        cov_zz = pl.col(f"{geom}_sum_zz") / n - mean_z * mean_z
+        stats += [
+            mean_x.alias(f"{geom}_mean_x"),
+            mean_z.alias(f"{geom}_mean_z"),
+            cov_xx.alias(f"{geom}_cov_xx"),
+            cov_xz.alias(f"{geom}_cov_xz"),
+            cov_zz.alias(f"{geom}_cov_zz"),
+            ((pl.col(f"{geom}_sum_xx") + pl.col(f"{geom}_sum_zz")) / n)
+            .sqrt()
+            .alias(f"{geom}_rms"),
+        ]
+    return sums_df.with_columns(stats)
+
+
+def _read_manifest(baseline_dir: str) -> dict[str, Any]:
+    """
+    Reads dates.json: the name of the current table and the dates folded
+    into it.
+    """
+    dates_path = os.path.join(baseline_dir, DATES_FILE)
+    if not os.path.exists(dates_path):
+        return dict(table=None, dates=[])
+    with open(dates_path) as f:
+        manifest = json.load(f)
+    if isinstance(manifest, list):
+        # written before dates.json named its table
+        return dict(table=BASELINE_FILE, dates=manifest)
+    return manifest
+
+
+def _table_path(baseline_dir: str) -> Optional[str]:
+    table = _read_manifest(baseline_dir)["table"]
+    return os.path.join(baseline_dir, table) if table is not None else None
+
+
+def load_baselines(
+    baseline_dir: str = ARSENAL_BASELINE_DIR,
+    min_pairs: int = BASELINE_MIN_PAIRS,
+) -> Optional[pl.DataFrame]:
+    """
+    Reads the arsenal baseline table, keeping only the pairs that have been
+    seen at least min_pairs times.
+
+    @params
+        baseline_dir: directory the baseline table lives in.
+        min_pairs: minimum number of pitch pairs behind a baseline row.
+
+    @returns
+        polars dataframe keyed by BASELINE_KEYS, or None if there is no table yet.
+    """
+    table_path = _table_path(baseline_dir)
+    if table_path is None or not os.path.exists(table_path):
+        return None
+    return (
+        pl.read_ipc(table_path, memory_map=False)
+        .filter(pl.col("n_pairs") >= min_pairs)
+        .select(BASELINE_KEYS + ["n_pairs"] + _stat_cols())
+    )
+
+
+def _folded_dates(baseline_dir: str) -> list[str]:
+    return _read_manifest(baseline_dir)["dates"]
+
+
+def _fold(sums_df: pl.DataFrame, new_dates: list[str], baseline_dir: str) -> None:
+    """
+    Adds sufficient statistics to the table and records which dates they
+    came from. The merged table is written as a new version, then dates.json
+    is replaced to point at it and list the new dates in one rename, and the
+    old versions are removed.
+    """
+    os.makedirs(baseline_dir, exist_ok=True)
+    manifest = _read_manifest(baseline_dir)
+    table_path = _table_path(baseline_dir)
+
+    frames = [sums_df]
+    if table_path is not None and os.path.exists(table_path):
+        frames.insert(
+            0, pl.read_ipc(table_path, memory_map=False).select(frames[0].columns)
+        )
+
+    merged = (
+        pl.concat(frames, how="vertical_relaxed")
+        .group_by(BASELINE_KEYS)
+        .agg(pl.col(["n_pairs"] + _sum_cols()).sum())
+        .sort(BASELINE_KEYS)
+    )
+
+    # nothing points at the new version until dates.json is replaced
+    new_table = f"{BASELINE_PREFIX}.{time.time_ns()}.{os.getpid()}.arrow"
+    _with_stats(merged).write_ipc(
+        os.path.join(baseline_dir, new_table), compression="uncompressed"
+    )
+
+    dates_path = os.path.join(baseline_dir, DATES_FILE)
+    tmp_dates_path = f"{dates_path}.{os.getpid()}.tmp"
+    with open(tmp_dates_path, "w") as f:
+        json.dump(
+            dict(table=new_table, dates=sorted(manifest["dates"] + new_dates)), f
+        )
+    os.replace(tmp_dates_path, dates_path)
+
+    # old versions, and any left by a fold that crashed before its commit
+    for name in os.listdir(baseline_dir):
+        if (
+            name.startswith(BASELINE_PREFIX)
+            and name.endswith(".arrow")
+            and name != new_table
+        ):
+            os.remove(os.path.join(baseline_dir, name))
+
+
+def update_baselines(
+    scored_df: pl.DataFrame,
+    game_date: datetime.date,
+    baseline_dir: str = ARSENAL_BASELINE_DIR,
+) -> bool:
+    """
+    Folds one day of scored pitch pairs into the arsenal baseline table.
+    Days that were already folded in are skipped, so re-running a day does
+    not count it twice.
+
+    @params
+        scored_df: polars dataframe of scored pitch pairs
+                   (see compute_tscore.score_pitches).
+        game_date: the date the pitches were thrown.
+        baseline_dir: directory the baseline table lives in.
+
+    @returns
+        True if the table was updated, False if game_date was already in it.
+    """
+    if str(game_date) in _folded_dates(baseline_dir):
+        return False
+    _fold(_daily_sums(scored_df), [str(game_date)], baseline_dir)
+    return True
+
+
+def backfill_baselines(
+    store_dir: str,
+    baseline_dir: str = ARSENAL_BASELINE_DIR,
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+) -> list[str]:
+    """
+    Folds every day in the scored pair store (see store.py) between start and
+    end that is not in the baseline table yet. All new days are summed in one
+    pass and merged with a single table rewrite.
+
+    @params
+        store_dir: root directory of the scored pair store.
+        baseline_dir: directory the baseline table lives in.
+        start: first game date to fold in, None for no lower bound.
+        end: last game date to fold in, None for no upper bound.
+
+    @returns
+        list of the dates that were folded in.
+    """
+    folded = [datetime.date.fromisoformat(day) for day in _folded_dates(baseline_dir)]
+    cols = list(
+        dict.fromkeys(
+            ["game_date"]
+            + BASELINE_KEYS
+            + [c for cols in GEOMETRIES.values() for c in cols]
+            + [f"prev_{c}" for cols in GEOMETRIES.values() for c in cols]
+        )
+    )
+
+    new_pairs = (
+        scan_scored_pairs(store_dir, start=start, end=end, columns=cols)
+        .with_columns(game_date=pl.col("game_date").cast(pl.Date))
+        .filter(~pl.col("game_date").is_in(folded))
+        .collect()
+    )
+    if new_pairs.is_empty():
+        return []
+
+    new_dates = sorted(
+        str(day) for day in new_pairs.get_column("game_date").unique().to_list()
+    )
+    _fold(_daily_sums(new_pairs), new_dates, baseline_dir)
+    return new_dates
+
+
+def score_relative(
+    scored_df: pl.DataFrame,
+    baselines: pl.DataFrame,
+    distance_floor: float = TUNNEL_DISTANCE_FLOOR,
+) -> pl.DataFrame:
+    """
+    Scores pitch pairs relative to the pitcher's own arsenal baseline with a
+    single left join on BASELINE_KEYS. Each distance is divided by the RMS
+    distance the pitcher usually has between those two pitch types, which
+    takes unusual arm slots and big movement profiles out of the score:
+
+        relative tunnel score = log_2((actual / actual_rms)
+                                      / (max(tunnel, floor) / tunnel_rms)
+                                      - (release / release_rms))
+
+    Pairs without a baseline, or where the value inside the log is not
+    finite and positive, get a null relative_tunnel_score.
+
+    @params
+        scored_df: polars dataframe with the tunnel score distance columns
+                   (see compute_tscore._compute_tunnel_score).
+        baselines: arsenal baseline table (see load_baselines).
+        distance_floor: smallest tunnel distance (feet) used in the division.
+
+    @returns
+        the same dataframe with an added "relative_tunnel_score" column.
+    """
+    rms_cols = [f"{geom}_rms" for geom in GEOMETRIES]
+    joined = scored_df.join(
+        baselines.select(BASELINE_KEYS + rms_cols),
+        on=BASELINE_KEYS,
+        how="left",
+    )
+    raw_relative = (
+        (pl.col("actual_distance") / pl.col("plate_rms"))
+        / (
+            pl.max_horizontal(pl.col("tunnel_distance"), pl.lit(distance_floor))
+            / pl.col("tunnel_rms")
+        )
+    ) - (pl.col("release_distance") / pl.col("release_rms"))
+
+    return joined.with_columns(
+        relative_tunnel_score=pl.when(raw_relative.is_finite() & (raw_relative > 0))
+        .then(raw_relative.log(base=2))
+        .otherwise(None),
+    ).drop(rms_cols)
@@ -7,20 +7,44 @@ os.environ["TQDM_DISABLE"] = "1"
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
 
-import math
 import polars as pl
 import pandas as pd
 import numpy as np
 import datetime
 import pybaseball
-from typing import Any
+from typing import Any, Optional
 
 from .exceptions import EmptyStatcastDFException
-from .consts import KEEPER_COLS
+from .consts import (
+    KEEPER_COLS,
+    AT_BAT_COLS,
+    SCORE_COLS,
+    TUNNEL_DISTANCE_FLOOR,
+    MIN_PITCHER_PITCHES,
+)
+from .store import append_scored_pairs
+from .baselines import load_baselines, update_baselines, score_relative
+from .sequences import append_sequence_counts
 
 MLB_FILMROOM_URL = "https://www.mlb.com/video/?q=Season+%3D+%5B{year}%5D+AND+Date+%3D+%5B%22{yesterday}%22%5D+AND+PitcherId+%3D+%5B{pitcher_id}%5D+AND+TopBottom+%3D+%5B%22{top_bot}%22%5D+AND+Outs+%3D+%5B{outs}%5D+AND+Balls+%3D+%5B{balls}%5D+AND+Strikes+%3D+%5B{strikes}%5D+AND+Inning+%3D+%5B{inning}%5D+AND+PlayerId+%3D+%5B{hitter_id}%5D+AND+PitchType+%3D+%5B%22{pitch_type}%22%5D+Order+By+Timestamp+DESC"
 
 
+def _fetch_statcast(start_dt: str, end_dt: str) -> pd.DataFrame:
+    """
+    The only place statcast pitch data is requested from Baseball Savant,
+    kept separate so it can be recorded and replayed (see replay.py).
+    """
+    return pybaseball.statcast(start_dt=start_dt, end_dt=end_dt, verbose=False)
+
+
+def _lookup_players(player_ids: list[int]) -> pd.DataFrame:
+    """
+    The only place players are looked up in the Chadwick register, kept
+    separate so it can be recorded and replayed (see replay.py).
+    """
+    return pybaseball.playerid_reverse_lookup(player_ids, key_type="mlbam")
+
+
 def _get_yesterdays_pitches(yesterdays_date: datetime.date) -> pl.DataFrame:
     """
     Retrieves yesterday's statcast pitch data using pybaseball's statcast function.
@@ -32,10 +56,9 @@ def _get_yesterdays_pitches(yesterdays_date: datetime.date) -> pl.DataFrame:
         polars dataframe containing yesterdays statcast pitch data.
     """
     yesterday_df: pl.DataFrame = pl.from_pandas(
-        pybaseball.statcast(
+        _fetch_statcast(
             start_dt=f"{yesterdays_date}",
             end_dt=f"{yesterdays_date}",
-            verbose=False,
         )
     )
 
@@ -51,7 +74,10 @@ def _tie_pitches_to_previous(pitches_df: pl.DataFrame) -> pl.DataFrame:
     """
     Takes in a polars dataframe of statcast pitch data and sorts it so that
     we have the pitches in descending order from most recently thrown to oldest
-    thrown. Then, we add columns for the previous pitch in the at bat.
+    thrown. Then, we add columns for the previous pitch in the at bat. The at
+    bat is identified by game as well, so pairs never cross a game boundary
+    (a pitcher can have the same at_bat_number in both games of a double
+    header, or on different days when more than one day is passed in).
 
     @params
         pitches_df: polars dataframe of statcast pitch data.
@@ -66,14 +92,15 @@ def _tie_pitches_to_previous(pitches_df: pl.DataFrame) -> pl.DataFrame:
         descending=True,
     )
 
-    for col_name in sorted_pitches.columns:
-        sorted_pitches = sorted_pitches.with_columns(
+    return sorted_pitches.with_columns(
+        [
             pl.col(col_name)
             .shift(-1)
-            .over(["pitcher", "at_bat_number"])
+            .over(AT_BAT_COLS)
             .alias(f"prev_{col_name}")
-        )
-    return sorted_pitches
+            for col_name in sorted_pitches.columns
+        ]
+    )
 
 
 def _get_player_names(pitches_df: pl.DataFrame) -> pl.DataFrame:
@@ -90,14 +117,12 @@ def _get_player_names(pitches_df: pl.DataFrame) -> pl.DataFrame:
     @returns
         the same polars dataframe but with player names added to it.
     """
-    pitchers = pybaseball.playerid_reverse_lookup(
+    pitchers = _lookup_players(
         [pitcher["pitcher"] for pitcher in pitches_df.iter_rows(named=True)],
-        key_type="mlbam",
     )
 
-    hitters = pybaseball.playerid_reverse_lookup(
+    hitters = _lookup_players(
         [batter["batter"] for batter in pitches_df.iter_rows(named=True)],
-        key_type="mlbam",
     )
     pitchers["pitcher_name"] = (
         pitchers["name_first"] + " " + pitchers["name_last"]
@@ -119,20 +144,39 @@ def _get_player_names(pitches_df: pl.DataFrame) -> pl.DataFrame:
     )
 
 
-def _compute_tunnel_score(statcast_pitches_df: pl.DataFrame) -> pl.DataFrame:
+def _compute_tunnel_score(
+    statcast_pitches_df: pl.DataFrame,
+    baselines: Optional[pl.DataFrame] = None,
+    distance_floor: float = TUNNEL_DISTANCE_FLOOR,
+    min_pitcher_pitches: int = MIN_PITCHER_PITCHES,
+) -> pl.DataFrame:
     """
-    Tunnel Score = (actualdistance / tunneldistance) - releasedistance
+    Tunnel Score = log_2((actualdistance / max(tunneldistance, distance_floor))
+                         - releasedistance)
+
+    Everything is computed as polars expressions over the whole frame. The
+    distance floor keeps pitches that tunnel (almost) perfectly from dividing
+    by zero and producing inf or huge scores. A pitch pair is only valid if
+    the value inside the log is finite and positive and the pitcher threw at
+    least min_pitcher_pitches pitches in the game, invalid pairs get a null
+    tunnel score and "tunnel_score_valid" set to false.
 
     @params
         statcast_pitches_df: polars dataframe of statcast pitch data that
                             has columns describing the previous pitch (see _tie_pitches_to_previous).
+        baselines: optional arsenal baseline table (see baselines.load_baselines),
+                   when given "relative_tunnel_score" is added as well.
+        distance_floor: smallest tunnel distance (feet) used in the division.
+        min_pitcher_pitches: pitchers with fewer pitches in the game are not scored.
 
     @returns
         the same dataframe but with added columns that are included in the
         calculation of tunnel score, and tunnel score itself. This includes
         "plate_x_no_movement", "plate_z_no_movement", "prev_plate_x_no_movement",
         "prev_plate_z_no_movement", "tunnel_distance", "actual_distance",
-        "release_distance" and "tunnel_score".
+        "release_distance", "raw_tunnel_score" (before the log),
+        "tunnel_score_valid", "tunnel_score" and "relative_tunnel_score" when
+        baselines are given.
     """
 
     def _euclidean_distance(point1: tuple[pl.Expr, ...], point2: tuple[pl.Expr, ...]):
@@ -168,15 +212,128 @@ def _compute_tunnel_score(statcast_pitches_df: pl.DataFrame) -> pl.DataFrame:
         ),
         release_distance=_euclidean_distance(
             point1=(pl.col("release_pos_x"), pl.col("release_pos_z")),
-            point2=(pl.col("prev_release_pos_x"), pl.col("release_pos_z")),
+            point2=(pl.col("prev_release_pos_x"), pl.col("prev_release_pos_z")),
         ),
     )
-    return statcast_with_distances.with_columns(
-        tunnel_score=(pl.col("actual_distance") / pl.col("tunnel_distance"))
+    statcast_with_raw_score = statcast_with_distances.with_columns(
+        raw_tunnel_score=(
+            pl.col("actual_distance")
+            / pl.max_horizontal(pl.col("tunnel_distance"), pl.lit(distance_floor))
+        )
         - pl.col("release_distance"),
+        pitcher_game_pitches=pl.len().over(["game_pk", "pitcher"]),
+    )
+
+    statcast_with_valid = statcast_with_raw_score.with_columns(
+        tunnel_score_valid=(
+            pl.col("raw_tunnel_score").is_finite()
+            & (pl.col("raw_tunnel_score") > 0)
+            & (pl.col("pitcher_game_pitches") >= min_pitcher_pitches)
+        ).fill_null(False),
+    ).drop("pitcher_game_pitches")
+
+    # take log_2 of the raw score to get the final value, once, for every row
+    statcast_with_score = statcast_with_valid.with_columns(
+        tunnel_score=pl.when(pl.col("tunnel_score_valid"))
+        .then(pl.col("raw_tunnel_score").log(base=2))
+        .otherwise(None),
+    )
+
+    if baselines is None:
+        return statcast_with_score
+    return score_relative(statcast_with_score, baselines, distance_floor)
+
+
+def score_pitch_pairs(
+    pitches_df: pl.DataFrame,
+    baselines: Optional[pl.DataFrame] = None,
+    distance_floor: float = TUNNEL_DISTANCE_FLOOR,
+    min_pitcher_pitches: int = MIN_PITCHER_PITCHES,
+) -> pl.DataFrame:
+    """
+    Runs the tie/score pipeline on raw statcast pitch data and keeps every
+    pitch, valid or not. Pitch sequences are counted from this, everything
+    else wants score_pitches.
+
+    @params
+        see score_pitches.
+
+    @returns
+        polars dataframe with one row per pitch, with the previous pitch tied
+        to it and the "tunnel_score_valid" mask (see _compute_tunnel_score).
+    """
+    tied_df: pl.DataFrame = _tie_pitches_to_previous(pitches_df)
+    return _compute_tunnel_score(
+        tied_df,
+        baselines=baselines,
+        distance_floor=distance_floor,
+        min_pitcher_pitches=min_pitcher_pitches,
     )
 
 
+def fetch_pitch_pairs(
+    game_date: datetime.date,
+    distance_floor: float = TUNNEL_DISTANCE_FLOOR,
+    min_pitcher_pitches: int = MIN_PITCHER_PITCHES,
+) -> pl.DataFrame:
+    """
+    Fetches one day of statcast pitch data and runs score_pitch_pairs on it.
+    Raises EmptyStatcastDFException when there were no games.
+    """
+    return score_pitch_pairs(
+        _get_yesterdays_pitches(game_date),
+        distance_floor=distance_floor,
+        min_pitcher_pitches=min_pitcher_pitches,
+    )
+
+
+def _keep_valid_pairs(tunnel_df: pl.DataFrame, relative: bool) -> pl.DataFrame:
+    """
+    Drops invalid pitch pairs and missing values from the output of
+    score_pitch_pairs (see score_pitches).
+    """
+    extra_cols = ["relative_tunnel_score"] if relative else []
+    return (
+        tunnel_df.filter(pl.col("tunnel_score_valid"))
+        .drop_nulls(subset=KEEPER_COLS)
+        .select(KEEPER_COLS + extra_cols)
+    )
+
+
+def score_pitches(
+    pitches_df: pl.DataFrame,
+    baselines: Optional[pl.DataFrame] = None,
+    distance_floor: float = TUNNEL_DISTANCE_FLOOR,
+    min_pitcher_pitches: int = MIN_PITCHER_PITCHES,
+) -> pl.DataFrame:
+    """
+    Runs the tie/score pipeline on raw statcast pitch data and keeps only
+    the valid pitch pairs (see _compute_tunnel_score) that have every column
+    we care about. Every downstream step (top k, leaderboards, aggregates)
+    works on the finite log_2 "tunnel_score" column this returns.
+
+    @params
+        pitches_df: polars dataframe of raw statcast pitch data.
+        baselines: optional arsenal baseline table (see baselines.load_baselines).
+        distance_floor: smallest tunnel distance (feet) used in the division
+                        (see _compute_tunnel_score).
+        min_pitcher_pitches: pitchers with fewer pitches in a game than this
+                             are not scored.
+
+    @returns
+        polars dataframe with one row per scored pitch pair, restricted
+        to the columns in consts.KEEPER_COLS (plus "relative_tunnel_score",
+        which can be null, when baselines are given).
+    """
+    tunnel_df: pl.DataFrame = score_pitch_pairs(
+        pitches_df,
+        baselines=baselines,
+        distance_floor=distance_floor,
+        min_pitcher_pitches=min_pitcher_pitches,
+    )
+    return _keep_valid_pairs(tunnel_df, relative=baselines is not None)
+
+
 def _get_film_room_videos(
     pitch: pl.DataFrame, yesterday: datetime.date
 ) -> tuple[str, str]:
@@ -241,7 +398,15 @@ def _get_film_room_videos(
     return tunneled_filmroom_link, previous_filmroom_link
 
 
-def yesterdays_top_tunnel(yesterday: datetime.date) -> dict[str, Any]:
+def yesterdays_top_tunnel(
+    yesterday: datetime.date,
+    store_dir: Optional[str] = None,
+    baseline_dir: Optional[str] = None,
+    sequence_dir: Optional[str] = None,
+    distance_floor: float = TUNNEL_DISTANCE_FLOOR,
+    min_pitcher_pitches: int = MIN_PITCHER_PITCHES,
+    score: str = "raw",
+) -> dict[str, Any]:
     """
     Acts as the main function for this compute_tscore.py module. Takes in
     yesterday's date, then uses the functions above to retrieve yesterdays
@@ -250,27 +415,55 @@ def yesterdays_top_tunnel(yesterday: datetime.date) -> dict[str, Any]:
 
     @params
         yesterday: datetime.date object for yesterday's date
+        store_dir: if given, every scored pitch pair from yesterday is
+                   appended to the scored pair store in this directory.
+        baseline_dir: if given, pitch pairs are also scored relative to the
+                      arsenal baselines in this directory, and yesterday's
+                      pairs are folded into them afterwards.
+        sequence_dir: if given, yesterday's pitch sequence counts are written
+                      to the sequence store in this directory.
+        distance_floor: see score_pitches.
+        min_pitcher_pitches: see score_pitches.
+        score: "raw" picks the pitch pair with the highest tunnel score,
+               "relative" the one with the highest relative tunnel score
+               (needs baseline_dir, see consts.SCORE_COLS).
 
     @returns
         dictionary object containing all of the useful information about the pitch
         so that we can tweet about it.
     """
-    yesterdays_df: pl.DataFrame = _get_yesterdays_pitches(yesterday)
-
-    tied_df: pl.DataFrame = _tie_pitches_to_previous(yesterdays_df)
-    tunnel_df: pl.DataFrame = _compute_tunnel_score(tied_df)
-
-    # drop missing values from tunnel_df
-    tunnel_df = tunnel_df.drop_nulls(subset=KEEPER_COLS).select(
-        KEEPER_COLS,
+    assert score in SCORE_COLS, f"unknown score {score}"
+    assert score == "raw" or baseline_dir is not None, (
+        "ranking by the relative tunnel score needs baseline_dir"
     )
 
-    tunnel_df = (
-        tunnel_df.drop_nulls(subset=KEEPER_COLS)
-        .select(KEEPER_COLS)
-        .sort("tunnel_score", descending=True)
-        .head(1)
+    yesterdays_df: pl.DataFrame = _get_yesterdays_pitches(yesterday)
+    baselines = load_baselines(baseline_dir) if baseline_dir is not None else None
+    # every pair, the sequence counts include the ones that are not scored
+    pairs_df: pl.DataFrame = score_pitch_pairs(
+        yesterdays_df,
+        baselines=baselines,
+        distance_floor=distance_floor,
+        min_pitcher_pitches=min_pitcher_pitches,
     )
+    tunnel_df = _keep_valid_pairs(pairs_df, relative=baselines is not None)
+
+    if store_dir is not None:
+        _ = append_scored_pairs(tunnel_df, yesterday, store_dir=store_dir)
+    if baseline_dir is not None:
+        # after scoring, so yesterday is not scored against itself
+        _ = update_baselines(tunnel_df, yesterday, baseline_dir=baseline_dir)
+    if sequence_dir is not None:
+        _ = append_sequence_counts(pairs_df, yesterday, sequence_dir=sequence_dir)
+
+    # pairs without a baseline have no relative score, they come last and are
+    # ranked by raw score among themselves. Before the first day is folded
+    # into the baselines there is no relative score at all, so it is all raw.
+    score_col = SCORE_COLS[score]
+    sort_cols = ["tunnel_score"]
+    if score_col != "tunnel_score" and score_col in tunnel_df.columns:
+        sort_cols.insert(0, score_col)
+    tunnel_df = tunnel_df.sort(sort_cols, descending=True, nulls_last=True).head(1)
 
     tunnel_df = _get_player_names(tunnel_df)  # add player names to the dataframe
 
@@ -284,10 +477,8 @@ def yesterdays_top_tunnel(yesterday: datetime.date) -> dict[str, Any]:
         yesterday=yesterday,
     )
 
-    # take log_2 of tunnel score to get the final value. This is being
-    # done in order to avoid infinite tunnel score values when the denominator
-    # is really small.
-    tunnel_score = math.log(tunnel_df.select("tunnel_score").item(), 2)
+    # already log_2, see _compute_tunnel_score
+    tunnel_score = tunnel_df.select("tunnel_score").item()
 
     return dict(
         yesterday=yesterday,
@@ -297,6 +488,12 @@ def yesterdays_top_tunnel(yesterday: datetime.date) -> dict[str, Any]:
         home_team=tunnel_df.select("home_team").item(),
         away_team=tunnel_df.select("away_team").item(),
         tunnel_score=tunnel_score,
+        relative_tunnel_score=(
+            tunnel_df.select("relative_tunnel_score").item()
+            if "relative_tunnel_score" in tunnel_df.columns
+            else None
+        ),
+        score=score,
         hitter_id=tunnel_df.select("hitter_id").item(),
         hitter_name=tunnel_df.select("hitter_name").item(),
         tunneled_filmroom_link=tunneled_filmroom_link,
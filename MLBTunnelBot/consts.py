@@ -6,6 +6,16 @@ TUNNEL_PLOT_DIR = os.path.join(ASSET_DIR, "tunnel_plot.png")
 PROFILE_PIC_DIR = os.path.join(ASSET_DIR, "profile_pic.jpg")
 DEFAULT_PROFILE_PIC_DIR = os.path.join(ASSET_DIR, "default_profile_pic.png")
 
+# X counts characters in these code point ranges as 1 and everything else
+# (e.g. "→" and emoji) as 2, against a limit of 280
+TWEET_MAX_LENGTH = 280
+TWEET_LIGHT_CHAR_RANGES: list[tuple[int, int]] = [
+    (0, 4351),
+    (8192, 8205),
+    (8208, 8223),
+    (8242, 8247),
+]
+
 BUILD_TWEET_ARGS: list[str] = [
     "yesterday",
     "pitcher_name",
@@ -18,7 +28,11 @@ BUILD_TWEET_ARGS: list[str] = [
     "tunnel_df",
 ]
 
+# columns that identify one at bat, pitch pairs never cross these
+AT_BAT_COLS: list[str] = ["game_pk", "pitcher", "at_bat_number"]
+
 KEEPER_COLS: list[str] = [
+    "game_pk",
     "pitcher",
     "batter",
     "home_team",
@@ -98,3 +112,98 @@ HASHTAG_MAP: dict[str, str] = {
     "TEX": "StraightUpTX",
     "TOR": "TOTHECORE",
 }
+
+# tunnel score guards (see compute_tscore._compute_tunnel_score).
+# statcast plate locations are in feet, so the floor is one inch
+TUNNEL_DISTANCE_FLOOR = 1 / 12
+MIN_PITCHER_PITCHES = 10
+
+# every day's scored pitch pairs (see MLBTunnelBot/store.py)
+SCORED_PAIRS_STORE_DIR = os.path.join("data", "scored_pairs")
+
+# per pitcher x pitch type pair arsenal baselines (see MLBTunnelBot/baselines.py)
+ARSENAL_BASELINE_DIR = os.path.join("data", "arsenal_baselines")
+BASELINE_MIN_PAIRS = 10
+# the score the daily tweet and leaderboards rank by: the raw log_2 tunnel
+# score, or the score relative to the pitcher's arsenal baselines, which does
+# not favor pitchers with unusual arm slots
+SCORE_COLS: dict[str, str] = {
+    "raw": "tunnel_score",
+    "relative": "relative_tunnel_score",
+}
+
+# memory bounded game partitioned processing (see MLBTunnelBot/streaming.py)
+STREAM_MEMORY_BUDGET_MB = 512
+STREAM_TOP_K = 50
+
+# publishing queue (see MLBTunnelBot/publish.py)
+PUBLISH_QUEUE_DIR = os.path.join("data", "publish_queue")
+PUBLISH_MAX_ATTEMPTS = 5
+PUBLISH_UPLOAD_WORKERS = 4
+# X media ids expire after 24 hours, reuse them for a little less than that
+MEDIA_ID_TTL_SECONDS = 23 * 60 * 60
+
+# pitch pair video overlays (see MLBTunnelBot/video.py)
+OVERLAY_DIR = os.path.join(ASSET_DIR, "overlay.gif")
+OVERLAY_ALPHA = 0.5
+OVERLAY_CHUNK_FRAMES = 32
+RELEASE_SEARCH_FRAMES = 240
+OVERLAY_WORKERS = 4
+
+# sharded season processing (see MLBTunnelBot/shard.py)
+SHARD_ROOT_DIR = os.path.join("data", "shards")
+SHARD_DAYS_PER_UNIT = 7
+SHARD_TOP_K = 50
+SHARD_LEASE_SECONDS = 300.0
+SHARD_STRAGGLER_SECONDS = 900.0
+SHARD_MAX_ATTEMPTS = 3
+
+# log_2 tunnel score histogram edges used for the mergeable score sketch
+SKETCH_BIN_EDGES: list[float] = [-10.0 + 0.1 * i for i in range(301)]
+
+# record/replay fixtures of the write() path (see MLBTunnelBot/replay.py)
+REPLAY_FIXTURE_DIR = os.path.join("data", "replay_fixtures")
+# typical per call latency of each boundary, in seconds
+REPLAY_LATENCY: dict[str, float] = {
+    "statcast": 2.0,
+    "player_lookup": 0.5,
+    "headshot": 0.15,
+    "media_upload": 0.6,
+    "create_tweet": 0.3,
+}
+
+# pitch type sequence mining (see MLBTunnelBot/sequences.py)
+SEQUENCE_DIR = os.path.join("data", "pitch_sequences")
+SEQUENCE_LENGTHS: list[int] = [2, 3]
+# statcast pitch types, a pitch type's code is its position in this list + 1
+PITCH_TYPE_CODES: list[str] = [
+    "FF",
+    "SI",
+    "FC",
+    "SL",
+    "ST",
+    "SV",
+    "CU",
+    "KC",
+    "CS",
+    "CH",
+    "FS",
+    "FO",
+    "SC",
+    "KN",
+    "EP",
+    "FA",
+    "PO",
+]
+WHIFF_DESCRIPTIONS: list[str] = [
+    "swinging_strike",
+    "swinging_strike_blocked",
+    "foul_tip",
+]
+SWING_DESCRIPTIONS: list[str] = WHIFF_DESCRIPTIONS + [
+    "foul",
+    "foul_bunt",
+    "missed_bunt",
+    "bunt_foul_tip",
+    "hit_into_play",
+]
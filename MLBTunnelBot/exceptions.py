@@ -6,3 +6,40 @@ class EmptyStatcastDFException(Exception):
     """
 
     pass
+
+
+class PostNotSentException(Exception):
+    """
+    Raised when a post that went through the publishing queue
+    could not be sent to X. It stays in the queue as failed.
+    """
+
+    pass
+
+
+class ShardQueueIncompleteException(Exception):
+    """
+    Raised when the sharded reducer is asked to merge partial results
+    while some work units are still pending, claimed or have failed.
+    """
+
+    pass
+
+
+class FixtureMissingException(Exception):
+    """
+    Raised when a replay session is asked for a response
+    that was never recorded (see replay.py).
+    """
+
+    pass
+
+
+class ClipFrameRateMismatchException(Exception):
+    """
+    Raised when the two clips of a pitch pair overlay do not
+    have the same frame rate, so their frames cannot be blended
+    one to one (see video.py).
+    """
+
+    pass
@@ -0,0 +1,199 @@
+import requests
+import tweepy
+
+from typing import Any, Optional
+import threading
+import hashlib
+import math
+import random
+import json
+import time
+import os
+
+# A local stand-in for the two X endpoints the publishing queue calls, so the
+# queue (see publish.py) can be exercised offline: its backoff, rate limit
+# scheduling, media id reuse, thread chaining and crash resume. It is passed
+# to publish() as both api (tweepy.API's media_upload) and client (a
+# tweepy.Client made with return_type=requests.Response).
+#
+# Errors are the same tweepy exceptions X would cause, and every response
+# carries x-rate-limit-* headers. Failures can be scripted per endpoint (a
+# list of status codes returned by the next calls), injected at random for
+# benchmarks, or tied to a media file for uploads that always fail.
+UPLOAD_ENDPOINT = "media_upload"
+TWEET_ENDPOINT = "create_tweet"
+
+REASONS: dict[int, str] = {
+    400: "Bad Request",
+    401: "Unauthorized",
+    403: "Forbidden",
+    404: "Not Found",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+ERRORS: dict[int, type[tweepy.HTTPException]] = {
+    400: tweepy.BadRequest,
+    401: tweepy.Unauthorized,
+    403: tweepy.Forbidden,
+    404: tweepy.NotFound,
+    429: tweepy.TooManyRequests,
+}
+
+
+def _response(
+    status_code: int, headers: dict[str, str], payload: Any
+) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response.reason = REASONS.get(status_code, "OK")
+    response.headers.update(headers)
+    response._content = json.dumps(payload).encode()
+    return response
+
+
+class _Media:
+    def __init__(self, media_id: str) -> None:
+        self.media_id = media_id
+
+
+class FakeX:
+    """
+    Stand-in for tweepy.API and tweepy.Client, only what publish() uses.
+
+    @params
+        failures: per endpoint, status codes the next calls fail with, in
+                  order, e.g. {"create_tweet": [503, 429]}.
+        media_failures: sha256 of a media file -> status code every upload
+                        of that file fails with.
+        failure_rate: per endpoint, probability of a random 429 or 503.
+        rate_limit: per endpoint, requests allowed per window. Once the
+                    window is used up the endpoint answers 429 until it resets.
+        window_seconds: length of a rate limit window.
+        retry_after: seconds until reset sent with a scripted or random 429.
+        latency: per endpoint, seconds every call takes.
+        jitter: fraction the latency is randomly varied by, e.g. 0.2 for +/- 20%.
+        seed: seed of the random failures and latency jitter.
+    """
+
+    def __init__(
+        self,
+        failures: Optional[dict[str, list[int]]] = None,
+        media_failures: Optional[dict[str, int]] = None,
+        failure_rate: Optional[dict[str, float]] = None,
+        rate_limit: Optional[dict[str, int]] = None,
+        window_seconds: float = 15 * 60,
+        retry_after: float = 30.0,
+        latency: Optional[dict[str, float]] = None,
+        jitter: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        self.failures = {
+            endpoint: list(codes) for endpoint, codes in (failures or {}).items()
+        }
+        self.media_failures = media_failures or {}
+        self.failure_rate = failure_rate or {}
+        self.rate_limit = rate_limit or {}
+        self.window_seconds = window_seconds
+        self.retry_after = retry_after
+        self.latency = latency or {}
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+        self.windows: dict[str, tuple[float, int]] = {}
+        self.calls: dict[str, int] = {UPLOAD_ENDPOINT: 0, TWEET_ENDPOINT: 0}
+        self.uploads: list[str] = []
+        self.tweets: list[dict[str, Any]] = []
+        self.last_response: Optional[requests.Response] = None
+
+    def _headers(self, endpoint: str, remaining: int, reset: float) -> dict[str, str]:
+        limit = self.rate_limit.get(endpoint, 1_000_000)
+        return {
+            "x-rate-limit-limit": str(limit),
+            "x-rate-limit-remaining": str(max(remaining, 0)),
+            "x-rate-limit-reset": str(math.ceil(reset)),
+        }
+
+    def _raise(self, status_code: int, headers: dict[str, str]) -> None:
+        response = _response(
+            status_code,
+            headers,
+            {"errors": [{"message": REASONS.get(status_code, "Error")}]},
+        )
+        raise ERRORS.get(status_code, tweepy.TwitterServerError)(response)
+
+    def _call(self, endpoint: str, media_digest: Optional[str] = None) -> dict:
+        """
+        Decides how a call goes. Raises the tweepy exception of a failure,
+        otherwise returns the rate limit headers of the success.
+        """
+        if self.latency.get(endpoint, 0) > 0:
+            with self.lock:
+                spread = self.rng.uniform(-self.jitter, self.jitter)
+            time.sleep(max(self.latency[endpoint] * (1 + spread), 0.0))
+
+        with self.lock:
+            self.calls[endpoint] += 1
+            now = time.time()
+            window_start, used = self.windows.get(endpoint, (now, 0))
+            if now - window_start >= self.window_seconds:
+                window_start, used = now, 0
+            reset = window_start + self.window_seconds
+            limit = self.rate_limit.get(endpoint)
+
+            scripted = self.failures.get(endpoint)
+            status_code = scripted.pop(0) if scripted else None
+            if status_code is None and media_digest in self.media_failures:
+                status_code = self.media_failures[media_digest]
+            if status_code is None and limit is not None and used >= limit:
+                status_code = 429
+            if status_code is None and self.rng.random() < self.failure_rate.get(
+                endpoint, 0
+            ):
+                status_code = self.rng.choice([429, 503])
+
+            if status_code is None:
+                used += 1
+            self.windows[endpoint] = (window_start, used)
+            remaining = limit - used if limit is not None else 1_000_000 - used
+
+        if status_code == 429 and (limit is None or used < limit):
+            # a scripted or random 429, reset after retry_after
+            reset = now + self.retry_after
+        if status_code is not None:
+            self._raise(status_code, self._headers(endpoint, 0, reset))
+        return self._headers(endpoint, remaining, reset)
+
+    def media_upload(self, filename: str, **kwargs) -> _Media:
+        with open(filename, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+
+        headers = self._call(UPLOAD_ENDPOINT, media_digest=digest)
+        with self.lock:
+            self.uploads.append(os.path.basename(filename))
+            media_id = str(1_000 + len(self.uploads))
+            # tweepy.API keeps the raw response of its last request
+            self.last_response = _response(200, headers, {"media_id": media_id})
+        return _Media(media_id)
+
+    def create_tweet(
+        self,
+        text: Optional[str] = None,
+        media_ids: Optional[list[str]] = None,
+        in_reply_to_tweet_id: Optional[str] = None,
+        **kwargs,
+    ) -> requests.Response:
+        headers = self._call(TWEET_ENDPOINT)
+        with self.lock:
+            tweet_id = str(9_000 + len(self.tweets))
+            self.tweets.append(
+                dict(
+                    id=tweet_id,
+                    text=text,
+                    media_ids=media_ids,
+                    in_reply_to_tweet_id=in_reply_to_tweet_id,
+                )
+            )
+        return _response(201, headers, {"data": {"id": tweet_id, "text": text}})
@@ -0,0 +1,165 @@
+import polars as pl
+import pandas as pd
+
+from typing import Optional
+import datetime
+
+from . import compute_tscore
+from .store import scan_scored_pairs, scored_pair_files
+from .consts import SCORED_PAIRS_STORE_DIR, SCORE_COLS
+
+# the pitcher's team is the home team in the top of the inning
+PITCHER_TEAM_EXPR: pl.Expr = (
+    pl.when(pl.col("inning_topbot") == "Top")
+    .then(pl.col("home_team"))
+    .otherwise(pl.col("away_team"))
+)
+
+GROUP_BY_COLS: dict[str, list[str]] = {
+    "pitcher": ["pitcher"],
+    "team": ["pitcher_team"],
+    "pitch_pair": ["prev_pitch_type", "pitch_type"],
+    "pitcher_pitch_pair": ["pitcher", "prev_pitch_type", "pitch_type"],
+    "game_date": ["game_date"],
+}
+
+LEADERBOARD_COLS: list[str] = [
+    "game_date",
+    "pitcher",
+    "home_team",
+    "away_team",
+    "inning_topbot",
+    "inning",
+    "at_bat_number",
+    "pitch_number",
+    "prev_pitch_type",
+    "pitch_type",
+    "prev_pitch_name",
+    "pitch_name",
+    "description",
+    "tunnel_score",
+]
+
+# only in the days that were scored with arsenal baselines (see baselines.py)
+OPTIONAL_LEADERBOARD_COLS: list[str] = ["relative_tunnel_score"]
+
+
+def query_leaderboard(
+    store_dir: str = SCORED_PAIRS_STORE_DIR,
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+    team: Optional[str] = None,
+    pitcher: Optional[int] = None,
+    pitch_type: Optional[str] = None,
+    prev_pitch_type: Optional[str] = None,
+    top_n: int = 10,
+    group_by: Optional[str] = None,
+    min_pairs: int = 1,
+    score: str = "raw",
+) -> pl.DataFrame:
+    """
+    Answers leaderboard questions like "best tunnel of the week", "top 20 for
+    NYY in June" or "best SL -> CH pair this season" from the scored pair
+    store (see store.py) without rescoring anything. The date range prunes
+    which files are opened, and the filters and the column projection are
+    pushed down into the memory mapped scans.
+
+    @params
+        store_dir: root directory of the scored pair store.
+        start: first game date to include, None for no lower bound.
+        end: last game date to include, None for no upper bound.
+        team: only pitch pairs thrown by this team's pitchers.
+        pitcher: only pitch pairs thrown by this pitcher (mlbam id).
+        pitch_type: only pairs where the tunneled pitch is this type.
+        prev_pitch_type: only pairs where the previous pitch is this type.
+        top_n: number of rows to return.
+        group_by: one of GROUP_BY_COLS to aggregate instead of listing pairs.
+        min_pairs: groups with fewer pitch pairs than this are left out.
+        score: "raw" ranks by tunnel score, "relative" by relative tunnel
+               score (see consts.SCORE_COLS). Pitch pairs without a relative
+               score are left out of a relative leaderboard.
+
+    @returns
+        polars dataframe of the top_n pitch pairs (or groups), best first.
+        Groups have <score column>_mean and <score column>_max columns.
+    """
+    assert group_by is None or group_by in GROUP_BY_COLS, f"unknown group_by {group_by}"
+    assert score in SCORE_COLS, f"unknown score {score}"
+    score_col = SCORE_COLS[score]
+
+    if not scored_pair_files(store_dir, start=start, end=end):
+        return pl.DataFrame()
+
+    lazy_df = scan_scored_pairs(store_dir, start=start, end=end)
+    columns = LEADERBOARD_COLS + [
+        col for col in OPTIONAL_LEADERBOARD_COLS if col in lazy_df.schema
+    ]
+    if score_col not in columns:
+        return pl.DataFrame()
+
+    lazy_df = lazy_df.select(columns).with_columns(
+        game_date=pl.col("game_date").cast(pl.Date),
+        pitcher_team=PITCHER_TEAM_EXPR,
+    )
+
+    if team is not None:
+        # on the stored columns rather than pitcher_team, so the filter is
+        # pushed down into the scans
+        lazy_df = lazy_df.filter(
+            ((pl.col("inning_topbot") == "Top") & (pl.col("home_team") == team))
+            | ((pl.col("inning_topbot") == "Bot") & (pl.col("away_team") == team))
+        )
+    if pitcher is not None:
+        lazy_df = lazy_df.filter(pl.col("pitcher") == pitcher)
+    if pitch_type is not None:
+        lazy_df = lazy_df.filter(pl.col("pitch_type") == pitch_type)
+    if prev_pitch_type is not None:
+        lazy_df = lazy_df.filter(pl.col("prev_pitch_type") == prev_pitch_type)
+    if score_col != "tunnel_score":
+        lazy_df = lazy_df.filter(pl.col(score_col).is_not_null())
+
+    if group_by is None:
+        return lazy_df.sort(score_col, descending=True).head(top_n).collect()
+
+    return (
+        lazy_df.group_by(GROUP_BY_COLS[group_by])
+        .agg(
+            n_pairs=pl.len(),
+            **{
+                f"{score_col}_mean": pl.col(score_col).mean(),
+                f"{score_col}_max": pl.col(score_col).max(),
+            },
+        )
+        .filter(pl.col("n_pairs") >= min_pairs)
+        .sort(f"{score_col}_max", descending=True)
+        .head(top_n)
+        .collect()
+    )
+
+
+def add_pitcher_names(leaderboard_df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Adds a "pitcher_name" column to a leaderboard that has a "pitcher" column,
+    looking up only the pitchers that made it onto the leaderboard.
+    """
+    if "pitcher" not in leaderboard_df.columns or leaderboard_df.is_empty():
+        return leaderboard_df
+
+    pitchers = compute_tscore._lookup_players(
+        leaderboard_df.get_column("pitcher").unique().to_list(),
+    )
+    pitchers["pitcher_name"] = (
+        pitchers["name_first"] + " " + pitchers["name_last"]
+    ).str.title()
+    subset = pitchers[["key_mlbam", "pitcher_name"]]
+
+    assert isinstance(subset, pd.DataFrame), "name subset is not a dataframe."
+
+    return leaderboard_df.join(
+        other=pl.from_pandas(subset).with_columns(
+            pl.col("key_mlbam").cast(leaderboard_df.schema["pitcher"])
+        ),
+        left_on="pitcher",
+        right_on="key_mlbam",
+        how="left",
+    )
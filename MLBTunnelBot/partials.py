@@ -0,0 +1,166 @@
+import polars as pl
+import numpy as np
+
+from .consts import SKETCH_BIN_EDGES
+
+# tunnel score first, then enough columns to make the ordering of tied
+# scores deterministic no matter how the input was split up.
+TOP_K_SORT_COLS: list[str] = [
+    "tunnel_score",
+    "game_date",
+    "pitcher",
+    "at_bat_number",
+    "pitch_number",
+]
+
+PITCHER_AGG_COLS: list[str] = [
+    "pitcher",
+    "n_pairs",
+    "tunnel_score_sum",
+    "tunnel_score_sq_sum",
+    "tunnel_score_max",
+]
+
+
+def top_k(scored_df: pl.DataFrame, k: int) -> pl.DataFrame:
+    """
+    Keeps the k best scored pitch pairs.
+
+    @params
+        scored_df: polars dataframe of scored pitch pairs
+                   (see compute_tscore.score_pitches).
+        k: number of rows to keep.
+
+    @returns
+        the k rows with the highest tunnel score, ties broken deterministically.
+    """
+    return scored_df.sort(
+        TOP_K_SORT_COLS,
+        descending=[True] + [False] * (len(TOP_K_SORT_COLS) - 1),
+        nulls_last=True,
+    ).head(k)
+
+
+def merge_top_k(top_k_frames: list[pl.DataFrame], k: int) -> pl.DataFrame:
+    """
+    Merges several partial top k frames into one. Because every partial
+    already holds its own best k rows, the best k of the concatenation is
+    the same as the best k of all of the underlying data.
+    """
+    frames = [frame for frame in top_k_frames if not frame.is_empty()]
+    if not frames:
+        return pl.DataFrame()
+    return top_k(pl.concat(frames, how="diagonal_relaxed"), k)
+
+
+def pitcher_aggregates(scored_df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Computes per pitcher sufficient statistics of tunnel score. Counts, sums
+    and maxes can be merged by summing/maxing, so partial aggregates from
+    different shards combine exactly.
+
+    @params
+        scored_df: polars dataframe of scored pitch pairs.
+
+    @returns
+        polars dataframe with the columns in PITCHER_AGG_COLS.
+    """
+    return (
+        scored_df.group_by("pitcher")
+        .agg(
+            n_pairs=pl.len(),
+            tunnel_score_sum=pl.col("tunnel_score").sum(),
+            tunnel_score_sq_sum=(pl.col("tunnel_score") ** 2).sum(),
+            tunnel_score_max=pl.col("tunnel_score").max(),
+        )
+        .select(PITCHER_AGG_COLS)
+    )
+
+
+def merge_pitcher_aggregates(agg_frames: list[pl.DataFrame]) -> pl.DataFrame:
+    """
+    Merges partial per pitcher aggregates (see pitcher_aggregates).
+    """
+    frames = [
+        frame.select(PITCHER_AGG_COLS) for frame in agg_frames if not frame.is_empty()
+    ]
+    if not frames:
+        return pl.DataFrame(
+            schema={
+                "pitcher": pl.Int64,
+                "n_pairs": pl.UInt32,
+                "tunnel_score_sum": pl.Float64,
+                "tunnel_score_sq_sum": pl.Float64,
+                "tunnel_score_max": pl.Float64,
+            }
+        )
+    return (
+        pl.concat(frames, how="vertical_relaxed")
+        .group_by("pitcher")
+        .agg(
+            n_pairs=pl.col("n_pairs").sum(),
+            tunnel_score_sum=pl.col("tunnel_score_sum").sum(),
+            tunnel_score_sq_sum=pl.col("tunnel_score_sq_sum").sum(),
+            tunnel_score_max=pl.col("tunnel_score_max").max(),
+        )
+        .sort("pitcher")
+    )
+
+
+def summarize_pitcher_aggregates(agg_df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Adds the mean and standard deviation of tunnel score to merged
+    per pitcher aggregates.
+    """
+    mean = pl.col("tunnel_score_sum") / pl.col("n_pairs")
+    return agg_df.with_columns(
+        tunnel_score_mean=mean,
+        tunnel_score_std=(
+            (pl.col("tunnel_score_sq_sum") / pl.col("n_pairs")) - mean**2
+        )
+        .clip(lower_bound=0.0)
+        .sqrt(),
+    )
+
+
+def score_sketch(scored_df: pl.DataFrame) -> np.ndarray:
+    """
+    Builds a fixed bin histogram of tunnel score (which is already log_2).
+    The bins are the same for every shard (consts.SKETCH_BIN_EDGES) so
+    sketches merge by adding them together. Scores outside the edges land
+    in the end bins.
+
+    @params
+        scored_df: polars dataframe of scored pitch pairs.
+
+    @returns
+        numpy array of bin counts, one shorter than SKETCH_BIN_EDGES.
+    """
+    scores = scored_df.get_column("tunnel_score").to_numpy()
+    edges = np.asarray(SKETCH_BIN_EDGES)
+    counts, _ = np.histogram(np.clip(scores, edges[0], edges[-1]), bins=edges)
+    return counts.astype(np.int64)
+
+
+def merge_score_sketches(sketches: list[np.ndarray]) -> np.ndarray:
+    """
+    Merges partial score sketches (see score_sketch).
+    """
+    merged = np.zeros(len(SKETCH_BIN_EDGES) - 1, dtype=np.int64)
+    for sketch in sketches:
+        merged += sketch
+    return merged
+
+
+def sketch_quantile(sketch: np.ndarray, q: float) -> float:
+    """
+    Approximates the q-th quantile of log_2 tunnel score from a sketch,
+    accurate to the width of one bin.
+    """
+    total = sketch.sum()
+    if total == 0:
+        return float("nan")
+    edges = np.asarray(SKETCH_BIN_EDGES)
+    idx = int(np.searchsorted(np.cumsum(sketch), q * total, side="left"))
+    idx = min(idx, len(sketch) - 1)
+    return float((edges[idx] + edges[idx + 1]) / 2)
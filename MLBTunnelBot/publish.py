@@ -0,0 +1,421 @@
+import requests
+import tweepy
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+import threading
+import hashlib
+import logging
+import shutil
+import json
+import time
+import uuid
+import os
+
+from .consts import (
+    PUBLISH_QUEUE_DIR,
+    PUBLISH_MAX_ATTEMPTS,
+    PUBLISH_UPLOAD_WORKERS,
+    MEDIA_ID_TTL_SECONDS,
+)
+
+# The publishing queue is a directory, one json file per post, so a crash
+# at any point leaves every post either pending, sending or sent on disk and
+# publish() picks up where it left off.
+#
+#   <queue_dir>/posts/<post_id>.json   text, media paths, status, tweet_id
+#   <queue_dir>/media/<sha256>.<ext>   copies of the media, taken at enqueue time
+#   <queue_dir>/media_cache.json       sha256 of media -> media id, upload time
+#   <queue_dir>/rate_limits.json       endpoint -> remaining, reset
+#
+# Posts in a thread are sent in order, each one replying to the one before
+# it. A post is marked "sending" right before the call to X, so a crash in
+# the middle of that call means it is sent again on resume (at least once).
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+UPLOAD_ENDPOINT = "media_upload"
+TWEET_ENDPOINT = "create_tweet"
+
+
+def _write_json_atomic(path: str, payload: Any) -> None:
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str, default: Any) -> Any:
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def _posts_dir(queue_dir: str) -> str:
+    return os.path.join(queue_dir, "posts")
+
+
+def _file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _copy_media(path: str, queue_dir: str) -> str:
+    """
+    Copies a media file into the queue under its content hash. The bot
+    overwrites the same plot file every day, so a post that is resumed later
+    has to keep its own copy of the image it was queued with.
+    """
+    media_dir = os.path.join(queue_dir, "media")
+    os.makedirs(media_dir, exist_ok=True)
+    queued_path = os.path.join(
+        media_dir, f"{_file_digest(path)}{os.path.splitext(path)[1]}"
+    )
+    if not os.path.exists(queued_path):
+        shutil.copyfile(path, queued_path)
+    return queued_path
+
+
+def enqueue_thread(
+    posts: list[tuple[str, list[str]]], queue_dir: str = PUBLISH_QUEUE_DIR
+) -> str:
+    """
+    Adds a thread to the publishing queue. A single post is a thread of one.
+
+    @params
+        posts: list of (tweet text, list of media file paths), in thread order.
+        queue_dir: directory of the publishing queue.
+
+    @returns
+        the id of the thread.
+    """
+    assert posts, "cannot enqueue an empty thread."
+    os.makedirs(_posts_dir(queue_dir), exist_ok=True)
+
+    thread_id = uuid.uuid4().hex
+    created = time.time_ns()
+    for position, (text, media) in enumerate(posts):
+        post_id = f"{created}_{thread_id}_{position:03d}"
+        _write_json_atomic(
+            os.path.join(_posts_dir(queue_dir), f"{post_id}.json"),
+            dict(
+                post_id=post_id,
+                thread_id=thread_id,
+                position=position,
+                text=text,
+                media=[_copy_media(path, queue_dir) for path in media],
+                status=PENDING,
+                attempts=0,
+                tweet_id=None,
+            ),
+        )
+    return thread_id
+
+
+def enqueue_batch(
+    posts: list[tuple[str, list[str]]], queue_dir: str = PUBLISH_QUEUE_DIR
+) -> list[str]:
+    """
+    Adds independent posts (for example the top k, or one post per team) to
+    the publishing queue.
+
+    @returns
+        the thread ids of the posts.
+    """
+    return [enqueue_thread([post], queue_dir=queue_dir) for post in posts]
+
+
+class _RateLimits:
+    """
+    Tracks the x-rate-limit-* headers X sends back per endpoint and sleeps
+    until the window resets instead of sending a request that would fail.
+    Persisted so a restarted publisher keeps respecting an exhausted window.
+    """
+
+    def __init__(self, queue_dir: str) -> None:
+        self.path = os.path.join(queue_dir, "rate_limits.json")
+        self.limits: dict[str, dict[str, float]] = _read_json(self.path, {})
+        self.lock = threading.Lock()
+
+    def record(self, endpoint: str, headers: Optional[Any]) -> None:
+        if not headers or "x-rate-limit-remaining" not in headers:
+            return
+        with self.lock:
+            self.limits[endpoint] = dict(
+                remaining=float(headers["x-rate-limit-remaining"]),
+                reset=float(headers.get("x-rate-limit-reset", time.time())),
+            )
+            _write_json_atomic(self.path, self.limits)
+
+    def wait(self, endpoint: str) -> None:
+        with self.lock:
+            limit = self.limits.get(endpoint)
+            delay = 0.0
+            if limit is not None and limit["remaining"] <= 0:
+                delay = limit["reset"] - time.time()
+        if delay > 0:
+            logging.info(f"Rate limit on {endpoint}, waiting {delay:.0f}s.")
+            time.sleep(delay)
+
+
+def _response_headers(response: Any) -> Optional[Any]:
+    return getattr(response, "headers", None)
+
+
+def _tweet_id(response: Any) -> str:
+    # tweepy.Response, or requests.Response from a client made with
+    # return_type=requests.Response (which keeps the rate limit headers)
+    if isinstance(response, requests.Response):
+        return str(response.json()["data"]["id"])
+    return str(response.data["id"])
+
+
+def _with_retries(
+    endpoint: str,
+    call: Any,
+    rate_limits: _RateLimits,
+    max_attempts: int,
+    response_of: Any = lambda result: result,
+) -> Any:
+    """
+    Calls X, waiting out rate limits and backing off exponentially on server
+    errors. Client errors (bad request, duplicate tweet, ...) are raised
+    straight away because retrying them cannot help.
+    """
+    for attempt in range(max_attempts):
+        rate_limits.wait(endpoint)
+        try:
+            result = call()
+        except tweepy.TooManyRequests as e:
+            rate_limits.record(endpoint, _response_headers(e.response))
+            if endpoint not in rate_limits.limits:
+                time.sleep(2**attempt)
+            continue
+        except (tweepy.TwitterServerError, requests.ConnectionError) as e:
+            logging.warning(f"{endpoint} failed ({e.__class__}), retrying.")
+            time.sleep(2**attempt)
+            continue
+        rate_limits.record(endpoint, _response_headers(response_of(result)))
+        return result
+    raise tweepy.TweepyException(f"{endpoint} failed after {max_attempts} attempts")
+
+
+def _is_permanent(error: Exception) -> bool:
+    # client errors other than 429, retrying the same request cannot help
+    return isinstance(
+        error,
+        (tweepy.BadRequest, tweepy.Unauthorized, tweepy.Forbidden, tweepy.NotFound),
+    )
+
+
+def _upload_media(
+    paths: list[str],
+    api: Any,
+    queue_dir: str,
+    rate_limits: _RateLimits,
+    max_workers: int,
+    max_attempts: int,
+) -> tuple[dict[str, str], dict[str, Exception]]:
+    """
+    Uploads every media file the queue needs, several at a time. Files are
+    keyed by content hash, so the same image used in several posts (or
+    already uploaded by an earlier run, within the media id lifetime) is
+    only uploaded once. A file that cannot be uploaded does not stop the
+    others.
+
+    @returns
+        tuple of a dictionary of file path -> media id for the files that
+        were uploaded, and file path -> error for the ones that were not.
+    """
+    cache_path = os.path.join(queue_dir, "media_cache.json")
+    cache: dict[str, dict[str, Any]] = _read_json(cache_path, {})
+    cache_lock = threading.Lock()
+
+    # queued media is named after its hash, see _copy_media
+    digests = {path: os.path.splitext(os.path.basename(path))[0] for path in set(paths)}
+    now = time.time()
+    to_upload = {
+        digest: path
+        for path, digest in digests.items()
+        if digest not in cache
+        or now - cache[digest]["uploaded_at"] > MEDIA_ID_TTL_SECONDS
+    }
+
+    def _upload(digest: str, path: str) -> None:
+        media = _with_retries(
+            UPLOAD_ENDPOINT,
+            lambda: api.media_upload(filename=path),
+            rate_limits,
+            max_attempts,
+            # tweepy.API keeps the raw response of its last request
+            response_of=lambda _: getattr(api, "last_response", None),
+        )
+        with cache_lock:
+            cache[digest] = dict(
+                media_id=str(media.media_id), uploaded_at=time.time()
+            )
+            _write_json_atomic(cache_path, cache)
+
+    errors: dict[str, Exception] = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            digest: executor.submit(_upload, digest, path)
+            for digest, path in to_upload.items()
+        }
+        for digest, future in futures.items():
+            try:
+                future.result()
+            except (tweepy.TweepyException, requests.RequestException, OSError) as e:
+                logging.error(
+                    f"Failed to upload {to_upload[digest]}: {e.__class__} -> {e}"
+                )
+                errors[digest] = e
+
+    media_ids = {
+        path: cache[digest]["media_id"]
+        for path, digest in digests.items()
+        if digest not in errors
+    }
+    upload_errors = {
+        path: errors[digest] for path, digest in digests.items() if digest in errors
+    }
+    return media_ids, upload_errors
+
+
+def publish(
+    queue_dir: str = PUBLISH_QUEUE_DIR,
+    api: Optional[Any] = None,
+    client: Optional[Any] = None,
+    max_workers: int = PUBLISH_UPLOAD_WORKERS,
+    max_attempts: int = PUBLISH_MAX_ATTEMPTS,
+) -> list[str]:
+    """
+    Sends everything in the publishing queue that has not been sent yet.
+    Media is uploaded concurrently first, then posts are created thread by
+    thread. Safe to call again after a crash. A post whose media could not
+    be uploaded counts an attempt and waits for the next call, together with
+    the rest of its thread, and is marked failed once the error is a client
+    error or max_attempts is used up. Other posts are sent either way.
+
+    @params
+        queue_dir: directory of the publishing queue.
+        api: object with tweepy.API's media_upload, defaults to x_api_info.api.
+        client: object with tweepy.Client's create_tweet, defaults to
+                x_api_info.publish_client. Passing stand-ins for api and
+                client lets the queue run against a local fake of X.
+        max_workers: number of concurrent media uploads.
+        max_attempts: attempts per request before a post is marked failed.
+
+    @returns
+        list of the tweet ids sent in this call.
+    """
+    if api is None or client is None:
+        from .x_api_info import api as default_api, publish_client
+
+        api = api or default_api
+        client = client or publish_client
+
+    posts_dir = _posts_dir(queue_dir)
+    if not os.path.isdir(posts_dir):
+        return []
+
+    rate_limits = _RateLimits(queue_dir)
+    posts: list[dict[str, Any]] = [
+        _read_json(os.path.join(posts_dir, name), None)
+        for name in sorted(os.listdir(posts_dir))
+        if name.endswith(".json")
+    ]
+    unsent = [post for post in posts if post["status"] in (PENDING, SENDING)]
+    if not unsent:
+        return []
+
+    media_ids, upload_errors = _upload_media(
+        [path for post in unsent for path in post["media"]],
+        api,
+        queue_dir,
+        rate_limits,
+        max_workers,
+        max_attempts,
+    )
+
+    sent_ids: dict[tuple[str, int], str] = {
+        (post["thread_id"], post["position"]): post["tweet_id"]
+        for post in posts
+        if post["status"] == SENT
+    }
+    failed_threads = {post["thread_id"] for post in posts if post["status"] == FAILED}
+
+    # threads with a post waiting for its media, the rest of them waits too
+    waiting_threads: set[str] = set()
+
+    sent: list[str] = []
+    for post in unsent:
+        post_path = os.path.join(posts_dir, f"{post['post_id']}.json")
+        if post["thread_id"] in failed_threads:
+            # a reply to a post that never went out would break the thread
+            post["status"] = FAILED
+            _write_json_atomic(post_path, post)
+            continue
+        if post["thread_id"] in waiting_threads:
+            continue
+
+        errors = [upload_errors[p] for p in post["media"] if p in upload_errors]
+        if errors:
+            post["attempts"] += 1
+            if _is_permanent(errors[0]) or post["attempts"] >= max_attempts:
+                logging.error(f"Failed to send post {post['post_id']}: {errors[0]}")
+                post["status"] = FAILED
+                failed_threads.add(post["thread_id"])
+            else:
+                post["status"] = PENDING
+                waiting_threads.add(post["thread_id"])
+            _write_json_atomic(post_path, post)
+            continue
+
+        reply_to = sent_ids.get((post["thread_id"], post["position"] - 1))
+        post["status"] = SENDING
+        post["attempts"] += 1
+        _write_json_atomic(post_path, post)
+
+        try:
+            response = _with_retries(
+                TWEET_ENDPOINT,
+                lambda: client.create_tweet(
+                    text=post["text"],
+                    media_ids=[media_ids[path] for path in post["media"]] or None,
+                    in_reply_to_tweet_id=reply_to,
+                ),
+                rate_limits,
+                max_attempts,
+            )
+        except tweepy.TweepyException as e:
+            logging.error(
+                f"Failed to send post {post['post_id']}: {e.__class__} -> {e}"
+            )
+            post["status"] = FAILED
+            failed_threads.add(post["thread_id"])
+            _write_json_atomic(post_path, post)
+            continue
+
+        post["status"] = SENT
+        post["tweet_id"] = _tweet_id(response)
+        _write_json_atomic(post_path, post)
+        sent_ids[(post["thread_id"], post["position"])] = post["tweet_id"]
+        sent.append(post["tweet_id"])
+
+    return sent
+
+
+def thread_statuses(thread_id: str, queue_dir: str = PUBLISH_QUEUE_DIR) -> list[str]:
+    """
+    Returns the status of every post in a thread, in thread order.
+    """
+    posts_dir = _posts_dir(queue_dir)
+    return [
+        _read_json(os.path.join(posts_dir, name), {})["status"]
+        for name in sorted(os.listdir(posts_dir))
+        if thread_id in name and name.endswith(".json")
+    ]
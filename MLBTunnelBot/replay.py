@@ -0,0 +1,244 @@
+from typing import Any, Callable, Iterator, Optional
+import contextlib
+import tempfile
+import datetime
+import itertools
+import cProfile
+import hashlib
+import logging
+import pickle
+import random
+import gzip
+import time
+import os
+
+from . import compute_tscore, x
+from .fake_x import FakeX, UPLOAD_ENDPOINT, TWEET_ENDPOINT
+from .exceptions import FixtureMissingException, PostNotSentException
+from .consts import REPLAY_FIXTURE_DIR
+
+# Record/replay for every network boundary of the write() path, so the full
+# pipeline can be benchmarked and profiled offline:
+#
+#   statcast        compute_tscore._fetch_statcast     Baseball Savant
+#   player_lookup   compute_tscore._lookup_players     Chadwick register
+#   headshot        x._fetch_url                       img.mlbstatic.com
+#
+# In "record" mode the real call is made and its result is pickled into a
+# gzip compressed fixture, keyed by boundary and arguments. In "replay" mode
+# the fixture is returned instead, after sleeping for the configured latency
+# of that boundary, so concurrency changes can be measured against realistic
+# I/O delays.
+#
+# X (x.api and x.publish_client) is never called in either mode. It is
+# served by fake_x.FakeX, with the latency of its "media_upload" and
+# "create_tweet" endpoints, and can be made to answer with random 429s and
+# 503s or to run out of its rate limit window, so the publishing queue's
+# backoff and rate limit waits show up in the timings.
+BOUNDARIES: list[str] = ["statcast", "player_lookup", "headshot"]
+RECORD = "record"
+REPLAY = "replay"
+
+
+def _fixture_path(fixture_dir: str, boundary: str, key: Any) -> str:
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()
+    return os.path.join(fixture_dir, boundary, f"{digest}.pkl.gz")
+
+
+def _save_fixture(path: str, value: Any) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp_path, "wb") as f:
+        pickle.dump(value, f)
+    os.replace(tmp_path, path)
+
+
+def _load_fixture(path: str) -> Any:
+    with gzip.open(path, "rb") as f:
+        return pickle.load(f)
+
+
+class _Boundary:
+    """
+    Wraps one boundary. Records results of the real call, or replays them
+    with artificial latency (latency seconds, +/- jitter as a fraction).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        mode: str,
+        fixture_dir: str,
+        latency: float,
+        jitter: float,
+        rng: random.Random,
+    ) -> None:
+        self.name = name
+        self.mode = mode
+        self.fixture_dir = fixture_dir
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = rng
+
+    def _sleep(self) -> None:
+        if self.latency > 0:
+            spread = self.rng.uniform(-self.jitter, self.jitter)
+            time.sleep(max(self.latency * (1 + spread), 0.0))
+
+    def call(self, key: Any, real: Callable[[], Any]) -> Any:
+        path = _fixture_path(self.fixture_dir, self.name, key)
+        if self.mode == RECORD:
+            value = real()
+            _save_fixture(path, value)
+            return value
+
+        if not os.path.exists(path):
+            raise FixtureMissingException(f"no {self.name} fixture for {key!r}")
+        self._sleep()
+        return _load_fixture(path)
+
+
+@contextlib.contextmanager
+def replay_session(
+    fixture_dir: str = REPLAY_FIXTURE_DIR,
+    mode: str = REPLAY,
+    latency: Optional[dict[str, float]] = None,
+    jitter: float = 0.0,
+    seed: int = 0,
+    x_failure_rate: float = 0.0,
+    x_rate_limit: Optional[int] = None,
+) -> Iterator[FakeX]:
+    """
+    Puts every network boundary of the write() path behind record/replay, and
+    X behind a local fake, for the duration of the with block.
+
+    @params
+        fixture_dir: directory the compressed fixtures are kept in.
+        mode: "record" to call the real services and save their responses,
+              "replay" to serve saved responses without any network access.
+        latency: seconds to sleep per replayed call, by boundary name (see
+                 BOUNDARIES) or X endpoint ("media_upload", "create_tweet"),
+                 e.g. {"statcast": 0.8, "headshot": 0.1}.
+        jitter: fraction the latency is randomly varied by, e.g. 0.2 for +/- 20%.
+        seed: seed of the latency jitter and X failures, so runs are reproducible.
+        x_failure_rate: probability of every X request failing with a 429 or 503.
+        x_rate_limit: requests per 15 minute window of each X endpoint, X
+                      answers 429 until the window resets once it is used up.
+
+    @returns
+        the FakeX standing in for X, to inspect its calls and tweets.
+    """
+    assert mode in (RECORD, REPLAY), f"unknown replay mode {mode}"
+
+    rng = random.Random(seed)
+    latency = latency or {}
+    boundaries = {
+        name: _Boundary(name, mode, fixture_dir, latency.get(name, 0.0), jitter, rng)
+        for name in BOUNDARIES
+    }
+
+    real_fetch_statcast = compute_tscore._fetch_statcast
+    real_lookup_players = compute_tscore._lookup_players
+    real_fetch_url = x._fetch_url
+    real_api = x.api
+    real_client = x.publish_client
+
+    x_endpoints = [UPLOAD_ENDPOINT, TWEET_ENDPOINT]
+    fake_x = FakeX(
+        failure_rate={endpoint: x_failure_rate for endpoint in x_endpoints},
+        rate_limit=(
+            {endpoint: x_rate_limit for endpoint in x_endpoints}
+            if x_rate_limit is not None
+            else None
+        ),
+        latency={endpoint: latency.get(endpoint, 0.0) for endpoint in x_endpoints},
+        jitter=jitter,
+        seed=seed,
+    )
+    compute_tscore._fetch_statcast = lambda start_dt, end_dt: boundaries[
+        "statcast"
+    ].call((start_dt, end_dt), lambda: real_fetch_statcast(start_dt, end_dt))
+    compute_tscore._lookup_players = lambda player_ids: boundaries[
+        "player_lookup"
+    ].call(tuple(player_ids), lambda: real_lookup_players(player_ids))
+    x._fetch_url = lambda url: boundaries["headshot"].call(
+        url, lambda: real_fetch_url(url)
+    )
+    x.api = x.publish_client = fake_x
+    try:
+        yield fake_x
+    finally:
+        compute_tscore._fetch_statcast = real_fetch_statcast
+        compute_tscore._lookup_players = real_lookup_players
+        x._fetch_url = real_fetch_url
+        x.api = real_api
+        x.publish_client = real_client
+
+
+def benchmark_write(
+    dates: list[datetime.date],
+    fixture_dir: str = REPLAY_FIXTURE_DIR,
+    mode: str = REPLAY,
+    latency: Optional[dict[str, float]] = None,
+    jitter: float = 0.0,
+    repeat: int = 1,
+    profile_path: Optional[str] = None,
+    x_failure_rate: float = 0.0,
+    x_rate_limit: Optional[int] = None,
+) -> list[dict[str, Any]]:
+    """
+    Runs the full write() path (scoring, plotting and posting through the
+    publishing queue) for every date, inside a replay session, and times it.
+    Run once in "record" mode to capture the fixtures, after that "replay"
+    runs on any box without network access.
+
+    @params
+        dates: dates to run write() for.
+        fixture_dir: directory the compressed fixtures are kept in.
+        mode: "record" or "replay" (see replay_session).
+        latency: seconds of artificial latency per boundary (see replay_session).
+        jitter: fraction the latency is randomly varied by.
+        repeat: number of times to run every date.
+        profile_path: if given, cProfile stats of all runs are written here.
+        x_failure_rate: probability of an X request failing (see replay_session).
+        x_rate_limit: X requests per window and endpoint (see replay_session).
+
+    @returns
+        list of dictionaries with the date, the run number, the seconds the
+        run took and whether the tweet was sent (False once the publishing
+        queue gave up on it).
+    """
+    profiler = cProfile.Profile() if profile_path is not None else None
+    timings: list[dict[str, Any]] = []
+
+    with replay_session(
+        fixture_dir,
+        mode=mode,
+        latency=latency,
+        jitter=jitter,
+        x_failure_rate=x_failure_rate,
+        x_rate_limit=x_rate_limit,
+    ):
+        for run, date in itertools.product(range(repeat), dates):
+            # a fresh queue per run, so every run really posts
+            with tempfile.TemporaryDirectory() as queue_dir:
+                start = time.perf_counter()
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    _ = x.write(yesterday=date, queue_dir=queue_dir)
+                    sent = True
+                except PostNotSentException as e:
+                    logging.warning(f"write({date}) run {run}: {e}")
+                    sent = False
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+                seconds = time.perf_counter() - start
+
+            timings.append(dict(date=date, run=run, seconds=seconds, sent=sent))
+            logging.info(f"write({date}) run {run} took {seconds:.3f}s")
+
+    if profiler is not None:
+        profiler.dump_stats(profile_path)
+    return timings
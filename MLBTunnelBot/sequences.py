@@ -0,0 +1,354 @@
+import polars as pl
+
+from typing import Callable, Optional
+import datetime
+import logging
+import os
+
+from .store import write_ipc_atomic, IPC_SUFFIX
+from .exceptions import EmptyStatcastDFException
+from .consts import (
+    AT_BAT_COLS,
+    SEQUENCE_DIR,
+    SEQUENCE_LENGTHS,
+    PITCH_TYPE_CODES,
+    WHIFF_DESCRIPTIONS,
+    SWING_DESCRIPTIONS,
+)
+
+# Mines each pitcher's pitch type sequences out of every pitch pair, not only
+# the ones that passed the tunnel score guards, so short relief outings and
+# pairs with a masked score still count as thrown. A pitch type is encoded as
+# a small integer (its position in PITCH_TYPE_CODES + 1, anything else is
+# OTHER_CODE), and an n pitch sequence as the base SEQUENCE_BASE number of its
+# pitch type codes, so "SL -> SL -> CH" is one UInt32 instead of a list of
+# strings. Every pair of back to back pitches ends one 2 pitch sequence, and
+# one 3 pitch sequence when the pitch before it was back to back too (a pitch
+# missing from statcast breaks the sequence). The n-grams of every row are
+# stacked and counted in a single group by. Only sequences whose pairs all
+# have a valid tunnel score go into tunnel_score_sum, counted by n_scored.
+#
+#   <sequence_dir>/daily/<YYYY-MM-DD>.arrow   one file of counts per day
+#
+# Counts, score sums, whiffs and swings merge by addition, so a season is a
+# group by over its daily files and a new day never touches the old ones.
+DAILY = "daily"
+OTHER_CODE = len(PITCH_TYPE_CODES) + 1
+SEQUENCE_BASE = len(PITCH_TYPE_CODES) + 2
+
+SEQUENCE_KEYS: list[str] = ["pitcher", "n", "sequence_code"]
+
+SEQUENCE_INPUT_COLS: list[str] = [
+    "game_pk",
+    "game_date",
+    "pitcher",
+    "at_bat_number",
+    "pitch_number",
+    "prev_pitch_number",
+    "pitch_type",
+    "prev_pitch_type",
+    "description",
+    "tunnel_score",
+    "tunnel_score_valid",
+]
+
+SUM_COLS: list[str] = [
+    "n_sequences",
+    "n_scored",
+    "tunnel_score_sum",
+    "whiffs",
+    "swings",
+]
+
+
+def _pitch_type_code(col: str) -> pl.Expr:
+    return pl.col(col).replace(
+        {pitch_type: i + 1 for i, pitch_type in enumerate(PITCH_TYPE_CODES)},
+        default=OTHER_CODE,
+        return_dtype=pl.UInt32,
+    )
+
+
+def _code_pitch_type(code: pl.Expr) -> pl.Expr:
+    return code.replace(
+        {i + 1: pitch_type for i, pitch_type in enumerate(PITCH_TYPE_CODES)},
+        default="UN",
+        return_dtype=pl.Utf8,
+    )
+
+
+def decode_sequence(code: pl.Expr, n: pl.Expr) -> pl.Expr:
+    """
+    Turns sequence codes back into readable sequences like "SL-SL-CH".
+    """
+    return pl.coalesce(
+        [
+            pl.when(n == length).then(
+                pl.concat_str(
+                    [
+                        _code_pitch_type(
+                            (code // SEQUENCE_BASE**position) % SEQUENCE_BASE
+                        )
+                        for position in reversed(range(length))
+                    ],
+                    separator="-",
+                )
+            )
+            for length in SEQUENCE_LENGTHS
+        ]
+    )
+
+
+def encode_sequences(pairs_df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Lists every 2 and 3 pitch sequence in a frame of pitch pairs, one row per
+    sequence, keyed by the pitch that ends it. The tunnel score of a sequence
+    is the mean of the scores of the pairs in it, null unless every one of
+    them is valid, and its outcome is the description of its last pitch.
+
+    @params
+        pairs_df: polars dataframe of every pitch with the previous pitch
+                  tied to it, valid or not (see compute_tscore.score_pitch_pairs).
+
+    @returns
+        polars dataframe with game_date, pitcher, n, sequence_code,
+        tunnel_score, whiff and swing columns.
+    """
+    coded_df = (
+        pairs_df.select(SEQUENCE_INPUT_COLS)
+        .sort(AT_BAT_COLS + ["pitch_number"])
+        .with_columns(
+            game_date=pl.col("game_date").cast(pl.Date),
+            code=_pitch_type_code("pitch_type"),
+            prev_code=_pitch_type_code("prev_pitch_type"),
+            whiff=pl.col("description").is_in(WHIFF_DESCRIPTIONS),
+            swing=pl.col("description").is_in(SWING_DESCRIPTIONS),
+            # the previous pitch is the one right before this one
+            back_to_back=(
+                pl.col("prev_pitch_number") == pl.col("pitch_number") - 1
+            ).fill_null(False),
+            tunnel_score=pl.when(pl.col("tunnel_score_valid")).then(
+                pl.col("tunnel_score")
+            ),
+        )
+        .with_columns(
+            # the pair before this one in the at bat
+            before_code=pl.col("prev_code").shift(1).over(AT_BAT_COLS),
+            before_score=pl.col("tunnel_score").shift(1).over(AT_BAT_COLS),
+            before_back_to_back=pl.col("back_to_back").shift(1).over(AT_BAT_COLS),
+        )
+        .filter(pl.col("back_to_back"))
+    )
+
+    out_cols = ["game_date", "pitcher", "n", "sequence_code", "tunnel_score"]
+    out_cols += ["whiff", "swing"]
+    grams: dict[int, pl.DataFrame] = {
+        2: coded_df.with_columns(
+            n=pl.lit(2, dtype=pl.UInt8),
+            sequence_code=(
+                pl.col("prev_code") * SEQUENCE_BASE + pl.col("code")
+            ).cast(pl.UInt32),
+        ),
+        3: coded_df.filter(
+            pl.col("before_back_to_back").fill_null(False)
+        ).with_columns(
+            n=pl.lit(3, dtype=pl.UInt8),
+            sequence_code=(
+                pl.col("before_code") * SEQUENCE_BASE**2
+                + pl.col("prev_code") * SEQUENCE_BASE
+                + pl.col("code")
+            ).cast(pl.UInt32),
+            tunnel_score=(pl.col("before_score") + pl.col("tunnel_score")) / 2,
+        ),
+    }
+    return pl.concat(
+        [grams[length].select(out_cols) for length in SEQUENCE_LENGTHS],
+        how="vertical",
+    )
+
+
+def count_sequences(pairs_df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Counts every pitcher's 2 and 3 pitch sequences per game date, with their
+    whiffs and swings, and the number and sum of the valid tunnel scores.
+
+    @params
+        pairs_df: polars dataframe of every pitch with the previous pitch
+                  tied to it (see compute_tscore.score_pitch_pairs).
+
+    @returns
+        polars dataframe keyed by game_date and SEQUENCE_KEYS.
+    """
+    return (
+        encode_sequences(pairs_df)
+        .group_by(["game_date"] + SEQUENCE_KEYS)
+        .agg(
+            n_sequences=pl.len().cast(pl.UInt32),
+            n_scored=pl.col("tunnel_score").is_not_null().sum().cast(pl.UInt32),
+            tunnel_score_sum=pl.col("tunnel_score").sum(),
+            whiffs=pl.col("whiff").sum().cast(pl.UInt32),
+            swings=pl.col("swing").sum().cast(pl.UInt32),
+        )
+        .sort(["game_date"] + SEQUENCE_KEYS)
+    )
+
+
+def _daily_dir(sequence_dir: str) -> str:
+    return os.path.join(sequence_dir, DAILY)
+
+
+def sequence_dates(sequence_dir: str = SEQUENCE_DIR) -> list[datetime.date]:
+    """
+    Lists the game dates that already have sequence counts.
+    """
+    directory = _daily_dir(sequence_dir)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        datetime.date.fromisoformat(name[: -len(IPC_SUFFIX)])
+        for name in os.listdir(directory)
+        if name.endswith(IPC_SUFFIX)
+    )
+
+
+def append_sequence_counts(
+    pairs_df: pl.DataFrame,
+    game_date: datetime.date,
+    sequence_dir: str = SEQUENCE_DIR,
+) -> str:
+    """
+    Counts one day's pitch sequences and writes them to the sequence store.
+    Writing the same day again replaces it.
+
+    @params
+        pairs_df: polars dataframe of one day's pitch pairs, valid or not
+                  (see compute_tscore.score_pitch_pairs).
+        game_date: the date the pitches were thrown.
+        sequence_dir: root directory of the sequence store.
+
+    @returns
+        path of the daily file that was written.
+    """
+    directory = _daily_dir(sequence_dir)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{game_date}{IPC_SUFFIX}")
+    write_ipc_atomic(count_sequences(pairs_df), path)
+    return path
+
+
+def backfill_sequences(
+    days: list[datetime.date],
+    fetch_pairs: Callable[[datetime.date], pl.DataFrame],
+    sequence_dir: str = SEQUENCE_DIR,
+) -> list[str]:
+    """
+    Counts the pitch sequences of every day that is not in the sequence
+    store yet. The scored pair store only keeps the pairs that passed the
+    tunnel score guards, so the pairs are fetched again through fetch_pairs.
+
+    @params
+        days: game dates to count.
+        fetch_pairs: returns one day's pitch pairs, valid or not (see
+                     compute_tscore.score_pitch_pairs), and raises
+                     EmptyStatcastDFException on days without games.
+        sequence_dir: root directory of the sequence store.
+
+    @returns
+        list of the dates that were counted.
+    """
+    counted_days = set(sequence_dates(sequence_dir))
+
+    counted: list[str] = []
+    for day in sorted(set(days) - counted_days):
+        try:
+            pairs_df = fetch_pairs(day)
+        except EmptyStatcastDFException:
+            logging.info(f"No pitches on {day}, no sequences to count")
+            continue
+        _ = append_sequence_counts(pairs_df, day, sequence_dir=sequence_dir)
+        counted.append(str(day))
+    return counted
+
+
+def scan_sequence_counts(
+    sequence_dir: str = SEQUENCE_DIR,
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+) -> Optional[pl.LazyFrame]:
+    """
+    Lazily scans the daily sequence counts between start and end (inclusive,
+    either can be None for an open range). Files outside of the range are
+    never opened.
+
+    @returns
+        polars LazyFrame of the daily counts, or None if there are none.
+    """
+    paths = [
+        os.path.join(_daily_dir(sequence_dir), f"{day}{IPC_SUFFIX}")
+        for day in sequence_dates(sequence_dir)
+        if (start is None or day >= start) and (end is None or day <= end)
+    ]
+    if not paths:
+        return None
+    return pl.concat(
+        [pl.scan_ipc(path, memory_map=True) for path in paths], how="vertical"
+    )
+
+
+def top_sequences(
+    sequence_dir: str = SEQUENCE_DIR,
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+    pitcher: Optional[int] = None,
+    n: Optional[int] = None,
+    min_sequences: int = 10,
+    top_n: int = 10,
+    sort_by: str = "tunnel_score_mean",
+) -> pl.DataFrame:
+    """
+    Ranks pitchers' pitch sequences over a date range, e.g. a full season,
+    by mean tunnel score or whiff rate.
+
+    @params
+        sequence_dir: root directory of the sequence store.
+        start: first game date to include, None for no lower bound.
+        end: last game date to include, None for no upper bound.
+        pitcher: only this pitcher's sequences (mlbam id).
+        n: only sequences of this many pitches (see SEQUENCE_LENGTHS).
+        min_sequences: sequences thrown fewer times than this are left out.
+        top_n: number of rows to return.
+        sort_by: "tunnel_score_mean", "whiff_rate" or "n_sequences".
+
+    @returns
+        polars dataframe of the top_n sequences, best first, with the
+        readable sequence in the "sequence" column.
+    """
+    assert sort_by in ("tunnel_score_mean", "whiff_rate", "n_sequences"), sort_by
+    assert n is None or n in SEQUENCE_LENGTHS, f"unknown sequence length {n}"
+
+    lazy_df = scan_sequence_counts(sequence_dir, start=start, end=end)
+    if lazy_df is None:
+        return pl.DataFrame()
+
+    if pitcher is not None:
+        lazy_df = lazy_df.filter(pl.col("pitcher") == pitcher)
+    if n is not None:
+        lazy_df = lazy_df.filter(pl.col("n") == n)
+
+    return (
+        lazy_df.group_by(SEQUENCE_KEYS)
+        .agg(pl.col(SUM_COLS).sum())
+        .filter(pl.col("n_sequences") >= min_sequences)
+        .with_columns(
+            sequence=decode_sequence(pl.col("sequence_code"), pl.col("n")),
+            tunnel_score_mean=pl.when(pl.col("n_scored") > 0).then(
+                pl.col("tunnel_score_sum") / pl.col("n_scored")
+            ),
+            whiff_rate=pl.when(pl.col("swings") > 0).then(
+                pl.col("whiffs") / pl.col("swings")
+            ),
+        )
+        .sort(sort_by, descending=True, nulls_last=True)
+        .head(top_n)
+        .collect()
+    )
@@ -0,0 +1,586 @@
+import polars as pl
+import numpy as np
+
+from typing import Any, Callable, Optional
+import multiprocessing
+import threading
+import datetime
+import logging
+import socket
+import shutil
+import json
+import time
+import os
+
+from .compute_tscore import _get_yesterdays_pitches, score_pitches
+from .store import append_scored_pairs
+from .exceptions import EmptyStatcastDFException, ShardQueueIncompleteException
+from .partials import (
+    top_k,
+    merge_top_k,
+    pitcher_aggregates,
+    merge_pitcher_aggregates,
+    score_sketch,
+    merge_score_sketches,
+)
+from .consts import (
+    SHARD_DAYS_PER_UNIT,
+    SHARD_TOP_K,
+    SHARD_LEASE_SECONDS,
+    SHARD_STRAGGLER_SECONDS,
+    SHARD_MAX_ATTEMPTS,
+    TUNNEL_DISTANCE_FLOOR,
+    MIN_PITCHER_PITCHES,
+)
+
+# The shard root is a plain directory on a filesystem every node can see.
+# Work units move between the queue directories with os.rename, which is
+# atomic on a single filesystem, so whoever wins the rename owns the unit.
+#
+#   <root>/queue/pending/<unit_id>.json   waiting to be claimed
+#   <root>/queue/claimed/<unit_id>.json   owned by a worker, mtime is its heartbeat
+#   <root>/queue/done/<unit_id>.json      partial results written
+#   <root>/queue/failed/<unit_id>.json    gave up after SHARD_MAX_ATTEMPTS
+#   <root>/partials/<unit_id>/            daily_top_k.parquet (the top k of every
+#                                         day), pitchers.parquet, sketch.npy
+#   <root>/results/                       merged outputs written by reduce()
+#
+# Workers fetch through a plain function passed in by the caller, and local
+# workers are started with spawn rather than fork: a forked child of a process
+# that already used polars can deadlock on a lock held by one of its threads.
+PENDING = "pending"
+CLAIMED = "claimed"
+DONE = "done"
+FAILED = "failed"
+QUEUE_STATES: list[str] = [PENDING, CLAIMED, DONE, FAILED]
+
+TOP_K_FILE = "top_k.parquet"
+DAILY_TOP_K_FILE = "daily_top_k.parquet"
+PITCHERS_FILE = "pitchers.parquet"
+SKETCH_FILE = "sketch.npy"
+
+
+def _queue_dir(root: str, state: str) -> str:
+    return os.path.join(root, "queue", state)
+
+
+def _unit_path(root: str, state: str, unit_id: str) -> str:
+    return os.path.join(_queue_dir(root, state), f"{unit_id}.json")
+
+
+def _partials_dir(root: str) -> str:
+    return os.path.join(root, "partials")
+
+
+def _backup_marker(root: str, unit_id: str) -> str:
+    return os.path.join(_queue_dir(root, CLAIMED), f"{unit_id}.backup")
+
+
+def _results_dir(root: str) -> str:
+    return os.path.join(root, "results")
+
+
+def _write_json_atomic(path: str, payload: dict[str, Any]) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, path)
+
+
+def _read_unit(path: str) -> Optional[dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _list_units(root: str, state: str) -> list[str]:
+    directory = _queue_dir(root, state)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        name[: -len(".json")]
+        for name in os.listdir(directory)
+        if name.endswith(".json")
+    )
+
+
+def _move(root: str, unit_id: str, src: str, dst: str) -> bool:
+    """
+    Atomically moves a unit between queue states. Returns False when another
+    worker got there first.
+    """
+    try:
+        os.rename(_unit_path(root, src, unit_id), _unit_path(root, dst, unit_id))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def plan(
+    root: str,
+    start: datetime.date,
+    end: datetime.date,
+    days_per_unit: int = SHARD_DAYS_PER_UNIT,
+) -> list[str]:
+    """
+    Coordinator step. Splits the inclusive date range into work units of
+    days_per_unit days each and drops them into the pending queue. Units that
+    are pending, claimed or done are left alone so plan() can be re-run, and
+    units in the range that failed go back to pending with their attempts
+    reset (e.g. after a day Savant could not serve has been fixed).
+
+    @params
+        root: shard root directory on the shared filesystem.
+        start: first date to process.
+        end: last date to process.
+        days_per_unit: number of days of statcast data per work unit.
+
+    @returns
+        list of the unit ids that were added to the queue or retried.
+    """
+    assert start <= end, f"start {start} is after end {end}."
+    assert days_per_unit > 0, "days_per_unit must be positive."
+
+    for state in QUEUE_STATES:
+        os.makedirs(_queue_dir(root, state), exist_ok=True)
+    os.makedirs(_partials_dir(root), exist_ok=True)
+
+    existing = {unit for state in QUEUE_STATES for unit in _list_units(root, state)}
+    failed = set(_list_units(root, FAILED))
+    added: list[str] = []
+
+    unit_start = start
+    while unit_start <= end:
+        unit_end = min(unit_start + datetime.timedelta(days=days_per_unit - 1), end)
+        unit_id = f"{unit_start}_{unit_end}"
+        if unit_id in failed:
+            # reset while still in failed, so no worker can claim it with the
+            # old attempt count
+            failed_path = _unit_path(root, FAILED, unit_id)
+            unit = _read_unit(failed_path)
+            if unit is not None:
+                unit["attempts"] = 0
+                _write_json_atomic(failed_path, unit)
+                if _move(root, unit_id, FAILED, PENDING):
+                    added.append(unit_id)
+        elif unit_id not in existing:
+            _write_json_atomic(
+                _unit_path(root, PENDING, unit_id),
+                dict(
+                    unit_id=unit_id,
+                    start=str(unit_start),
+                    end=str(unit_end),
+                    attempts=0,
+                ),
+            )
+            added.append(unit_id)
+        unit_start = unit_end + datetime.timedelta(days=1)
+
+    return added
+
+
+def _claim(root: str, unit_id: str, worker_id: str) -> Optional[dict[str, Any]]:
+    """
+    Tries to move a pending unit into claimed. Units that have used up their
+    attempts go to failed instead.
+    """
+    # the rename keeps the pending file's mtime, which _release_expired reads
+    # as the heartbeat. Touching it first means the unit lands in claimed with
+    # a fresh lease, so it cannot be released before the claim is written.
+    try:
+        os.utime(_unit_path(root, PENDING, unit_id))
+    except FileNotFoundError:
+        return None
+    if not _move(root, unit_id, PENDING, CLAIMED):
+        return None
+
+    claimed_path = _unit_path(root, CLAIMED, unit_id)
+    unit = _read_unit(claimed_path)
+    if unit is None:
+        return None
+
+    unit["attempts"] = unit.get("attempts", 0) + 1
+    if unit["attempts"] > SHARD_MAX_ATTEMPTS:
+        logging.error(f"Shard {unit_id} failed {SHARD_MAX_ATTEMPTS} times, giving up")
+        _move(root, unit_id, CLAIMED, FAILED)
+        return None
+
+    unit["worker_id"] = worker_id
+    unit["claimed_at"] = time.time()
+    _write_json_atomic(claimed_path, unit)
+    return unit
+
+
+def _release_expired(root: str, lease_seconds: float) -> None:
+    """
+    Puts claimed units whose heartbeat is older than lease_seconds back in
+    the pending queue so another worker can steal them. This is how units
+    held by crashed workers or dead nodes get retried.
+    """
+    now = time.time()
+    for unit_id in _list_units(root, CLAIMED):
+        try:
+            heartbeat = os.path.getmtime(_unit_path(root, CLAIMED, unit_id))
+        except FileNotFoundError:
+            continue
+        if now - heartbeat > lease_seconds and _move(root, unit_id, CLAIMED, PENDING):
+            logging.warning(f"Lease on shard {unit_id} expired, returned to queue.")
+
+
+def _backup_candidate(
+    root: str, worker_id: str, straggler_seconds: float
+) -> Optional[dict[str, Any]]:
+    """
+    When nothing is pending, an idle worker runs a backup copy of a unit that
+    has been claimed for longer than straggler_seconds. A marker file made
+    with O_EXCL makes sure each straggler gets at most one backup.
+    """
+    now = time.time()
+    for unit_id in _list_units(root, CLAIMED):
+        unit = _read_unit(_unit_path(root, CLAIMED, unit_id))
+        if unit is None or unit.get("worker_id") == worker_id:
+            continue
+        if now - unit.get("claimed_at", now) < straggler_seconds:
+            continue
+
+        marker = _backup_marker(root, unit_id)
+        try:
+            os.close(os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            continue
+
+        logging.info(f"Worker {worker_id} running backup of straggler {unit_id}.")
+        return unit
+    return None
+
+
+def _heartbeat(root: str, unit_id: str, stop: threading.Event, interval: float) -> None:
+    while not stop.wait(interval):
+        try:
+            os.utime(_unit_path(root, CLAIMED, unit_id))
+        except FileNotFoundError:
+            # finished by a backup worker or the lease was lost
+            return
+
+
+def _process_unit(
+    unit: dict[str, Any],
+    k: int,
+    store_dir: Optional[str] = None,
+    fetch: Callable[[datetime.date], pl.DataFrame] = _get_yesterdays_pitches,
+    distance_floor: float = TUNNEL_DISTANCE_FLOOR,
+    min_pitcher_pitches: int = MIN_PITCHER_PITCHES,
+) -> tuple[pl.DataFrame, pl.DataFrame, np.ndarray]:
+    """
+    Runs fetch/tie/score for every day in a unit and reduces the scored
+    pitch pairs to partial results: the top k of every day, per pitcher
+    aggregates and a score sketch. When store_dir is given every day's
+    scored pitch pairs are also appended to the scored pair store.
+    distance_floor and min_pitcher_pitches go to score_pitches.
+    """
+    start = datetime.date.fromisoformat(unit["start"])
+    end = datetime.date.fromisoformat(unit["end"])
+
+    top_k_frames: list[pl.DataFrame] = []
+    agg_frames: list[pl.DataFrame] = []
+    sketches: list[np.ndarray] = []
+
+    day = start
+    while day <= end:
+        try:
+            scored_df = score_pitches(
+                fetch(day),
+                distance_floor=distance_floor,
+                min_pitcher_pitches=min_pitcher_pitches,
+            )
+        except EmptyStatcastDFException:
+            # no games that day
+            scored_df = None
+
+        if scored_df is not None and store_dir is not None:
+            _ = append_scored_pairs(scored_df, day, store_dir=store_dir)
+
+        if scored_df is not None and not scored_df.is_empty():
+            top_k_frames.append(top_k(scored_df, k))
+            agg_frames.append(pitcher_aggregates(scored_df))
+            sketches.append(score_sketch(scored_df))
+        day += datetime.timedelta(days=1)
+
+    daily_top_k_df = (
+        pl.concat(top_k_frames, how="diagonal_relaxed")
+        if top_k_frames
+        else pl.DataFrame()
+    )
+    return (
+        daily_top_k_df,
+        merge_pitcher_aggregates(agg_frames),
+        merge_score_sketches(sketches),
+    )
+
+
+def _commit_partials(
+    root: str,
+    unit_id: str,
+    worker_id: str,
+    partials: tuple[pl.DataFrame, pl.DataFrame, np.ndarray],
+) -> bool:
+    """
+    Writes partial results into a private directory and renames it into
+    place. If a backup copy of the unit already committed, the rename fails
+    and this copy is thrown away, so each unit is counted exactly once.
+    """
+    daily_top_k_df, agg_df, sketch = partials
+    tmp_dir = os.path.join(_partials_dir(root), f".{unit_id}.{worker_id}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    daily_top_k_df.write_parquet(os.path.join(tmp_dir, DAILY_TOP_K_FILE))
+    agg_df.write_parquet(os.path.join(tmp_dir, PITCHERS_FILE))
+    np.save(os.path.join(tmp_dir, SKETCH_FILE), sketch)
+
+    try:
+        os.rename(tmp_dir, os.path.join(_partials_dir(root), unit_id))
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return False
+    return True
+
+
+def _finish(root: str, unit_id: str) -> None:
+    _move(root, unit_id, CLAIMED, DONE)
+    marker = _backup_marker(root, unit_id)
+    if os.path.exists(marker):
+        os.remove(marker)
+
+
+def run_worker(
+    root: str,
+    worker_id: Optional[str] = None,
+    k: int = SHARD_TOP_K,
+    lease_seconds: float = SHARD_LEASE_SECONDS,
+    straggler_seconds: float = SHARD_STRAGGLER_SECONDS,
+    poll_seconds: float = 5.0,
+    store_dir: Optional[str] = None,
+    fetch: Callable[[datetime.date], pl.DataFrame] = _get_yesterdays_pitches,
+    distance_floor: float = TUNNEL_DISTANCE_FLOOR,
+    min_pitcher_pitches: int = MIN_PITCHER_PITCHES,
+) -> int:
+    """
+    Worker loop. Claims units from the shared queue, processes them and
+    writes their partial results until no unit is pending or claimed.
+    Can run on any node that can see root.
+
+    @params
+        root: shard root directory on the shared filesystem.
+        worker_id: unique name for this worker, defaults to hostname-pid.
+        k: number of top pitch pairs to keep per day.
+        lease_seconds: heartbeat age after which a claimed unit is stolen.
+        straggler_seconds: claim age after which an idle worker runs a backup copy.
+        poll_seconds: how long to sleep when there is nothing to do.
+        store_dir: if given, scored pitch pairs are appended to this store.
+        fetch: returns one day of raw statcast pitches, a module level
+               function so it can be sent to spawned worker processes.
+        distance_floor: see compute_tscore.score_pitches.
+        min_pitcher_pitches: see compute_tscore.score_pitches.
+
+    @returns
+        the number of units this worker committed.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    committed = 0
+
+    while True:
+        _release_expired(root, lease_seconds)
+
+        unit = None
+        is_backup = False
+        for unit_id in _list_units(root, PENDING):
+            unit = _claim(root, unit_id, worker_id)
+            if unit is not None:
+                break
+
+        if unit is None:
+            if not _list_units(root, PENDING) and not _list_units(root, CLAIMED):
+                return committed
+            unit = _backup_candidate(root, worker_id, straggler_seconds)
+            if unit is None:
+                time.sleep(poll_seconds)
+                continue
+            is_backup = True
+
+        unit_id = unit["unit_id"]
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=_heartbeat,
+            args=(root, unit_id, stop, lease_seconds / 3),
+            daemon=True,
+        )
+        if not is_backup:
+            heartbeat.start()
+        try:
+            partials = _process_unit(
+                unit,
+                k,
+                store_dir=store_dir,
+                fetch=fetch,
+                distance_floor=distance_floor,
+                min_pitcher_pitches=min_pitcher_pitches,
+            )
+        except Exception as e:
+            logging.error(
+                f"Worker {worker_id} failed shard {unit_id}: {e.__class__} -> {e}"
+            )
+            # hand it back for a retry, attempts were counted when claimed.
+            # a failed backup leaves the unit with its original owner, and
+            # drops its marker so the straggler can get another backup later.
+            if not is_backup:
+                _move(root, unit_id, CLAIMED, PENDING)
+            else:
+                try:
+                    os.remove(_backup_marker(root, unit_id))
+                except FileNotFoundError:
+                    # the owner finished the unit in the meantime
+                    pass
+                time.sleep(poll_seconds)
+            continue
+        finally:
+            stop.set()
+            if heartbeat.is_alive():
+                heartbeat.join()
+
+        if _commit_partials(root, unit_id, worker_id, partials):
+            committed += 1
+            logging.info(f"Worker {worker_id} committed shard {unit_id}.")
+        _finish(root, unit_id)
+
+
+def reduce(
+    root: str, k: int = SHARD_TOP_K, allow_incomplete: bool = False
+) -> tuple[pl.DataFrame, pl.DataFrame, np.ndarray]:
+    """
+    Merges every committed partial into the final outputs and writes them to
+    <root>/results, along with the top k of every day in daily_top_k.parquet.
+
+    @params
+        root: shard root directory on the shared filesystem.
+        k: number of top pitch pairs to keep overall.
+        allow_incomplete: merge whatever is committed even if some units
+                          are not done yet.
+
+    @returns
+        tuple of the top k pitch pairs, per pitcher aggregates and the
+        merged log_2 tunnel score sketch.
+    """
+    if not os.path.isdir(_partials_dir(root)):
+        raise ShardQueueIncompleteException(
+            f"cannot reduce {root}, it was never planned (see plan)"
+        )
+
+    if not allow_incomplete:
+        unfinished = {
+            state: _list_units(root, state) for state in (PENDING, CLAIMED, FAILED)
+        }
+        if any(unfinished.values()):
+            raise ShardQueueIncompleteException(
+                f"cannot reduce {root}, unfinished units: {unfinished}"
+            )
+
+    unit_dirs = [
+        os.path.join(_partials_dir(root), name)
+        for name in sorted(os.listdir(_partials_dir(root)))
+        if not name.startswith(".")
+    ]
+
+    daily_frames = [
+        pl.read_parquet(os.path.join(d, DAILY_TOP_K_FILE)) for d in unit_dirs
+    ]
+    daily_frames = [frame for frame in daily_frames if not frame.is_empty()]
+    daily_top_k_df = (
+        pl.concat(daily_frames, how="diagonal_relaxed").sort(
+            ["game_date", "tunnel_score"], descending=[False, True]
+        )
+        if daily_frames
+        else pl.DataFrame()
+    )
+    # every day keeps its own best k, so the best k overall is among them
+    top_k_df = merge_top_k([daily_top_k_df], k)
+    agg_df = merge_pitcher_aggregates(
+        [pl.read_parquet(os.path.join(d, PITCHERS_FILE)) for d in unit_dirs]
+    )
+    sketch = merge_score_sketches(
+        [np.load(os.path.join(d, SKETCH_FILE)) for d in unit_dirs]
+    )
+
+    results_dir = _results_dir(root)
+    os.makedirs(results_dir, exist_ok=True)
+    top_k_df.write_parquet(os.path.join(results_dir, TOP_K_FILE))
+    daily_top_k_df.write_parquet(os.path.join(results_dir, DAILY_TOP_K_FILE))
+    agg_df.write_parquet(os.path.join(results_dir, PITCHERS_FILE))
+    np.save(os.path.join(results_dir, SKETCH_FILE), sketch)
+
+    return top_k_df, agg_df, sketch
+
+
+def run_local(
+    root: str,
+    start: datetime.date,
+    end: datetime.date,
+    n_workers: int = 4,
+    days_per_unit: int = SHARD_DAYS_PER_UNIT,
+    k: int = SHARD_TOP_K,
+    store_dir: Optional[str] = None,
+    fetch: Callable[[datetime.date], pl.DataFrame] = _get_yesterdays_pitches,
+    distance_floor: float = TUNNEL_DISTANCE_FLOOR,
+    min_pitcher_pitches: int = MIN_PITCHER_PITCHES,
+    allow_incomplete: bool = False,
+) -> tuple[pl.DataFrame, pl.DataFrame, np.ndarray]:
+    """
+    Runs plan, n_workers local worker processes and reduce on one box. This
+    goes through the exact same filesystem queue as a multi-node run. The
+    workers are spawned, so this is safe to call from a process (or notebook)
+    that has already used polars.
+
+    @params
+        root: shard root directory.
+        start: first date to process.
+        end: last date to process.
+        n_workers: number of worker processes to start.
+        days_per_unit: number of days of statcast data per work unit.
+        k: number of top pitch pairs to keep.
+        store_dir: if given, scored pitch pairs are appended to this store.
+        fetch: returns one day of raw statcast pitches, must be a module
+               level function (see run_worker).
+        distance_floor: see compute_tscore.score_pitches.
+        min_pitcher_pitches: see compute_tscore.score_pitches.
+        allow_incomplete: see reduce, e.g. to merge around units that failed.
+
+    @returns
+        the outputs of reduce().
+    """
+    plan(root, start, end, days_per_unit=days_per_unit)
+
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(
+            target=run_worker,
+            kwargs=dict(
+                root=root,
+                worker_id=f"local-{i}",
+                k=k,
+                poll_seconds=1.0,
+                store_dir=store_dir,
+                fetch=fetch,
+                distance_floor=distance_floor,
+                min_pitcher_pitches=min_pitcher_pitches,
+            ),
+        )
+        for i in range(n_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    return reduce(root, k=k, allow_incomplete=allow_incomplete)
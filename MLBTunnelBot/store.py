@@ -0,0 +1,220 @@
+import polars as pl
+
+from typing import Optional
+import datetime
+import os
+
+from .consts import SCORED_PAIRS_STORE_DIR
+
+# Scored pitch pairs are kept as uncompressed Arrow IPC (Feather v2) files so
+# readers can memory map them and only touch the columns they select.
+# Compressed IPC buffers have to be decompressed into fresh memory, which
+# would defeat the point, so compression is deliberately off.
+#
+#   <store_dir>/daily/<YYYY-MM-DD>.arrow    one file per day, written by append
+#   <store_dir>/compacted/<YYYY-MM>.arrow   one file per month, written by compact
+#
+# A daily file always wins over the same date inside a compacted file, so
+# re-running a day after its month was compacted does not double count it.
+DAILY = "daily"
+COMPACTED = "compacted"
+IPC_SUFFIX = ".arrow"
+
+
+def _partition_dir(store_dir: str, kind: str) -> str:
+    return os.path.join(store_dir, kind)
+
+
+def _list_partitions(store_dir: str, kind: str) -> list[str]:
+    directory = _partition_dir(store_dir, kind)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        name[: -len(IPC_SUFFIX)]
+        for name in os.listdir(directory)
+        if name.endswith(IPC_SUFFIX)
+    )
+
+
+def _month_bounds(month: str) -> tuple[datetime.date, datetime.date]:
+    first = datetime.date.fromisoformat(f"{month}-01")
+    next_month = (first + datetime.timedelta(days=32)).replace(day=1)
+    return first, next_month - datetime.timedelta(days=1)
+
+
+def _overlaps(
+    bounds: tuple[datetime.date, datetime.date],
+    start: Optional[datetime.date],
+    end: Optional[datetime.date],
+) -> bool:
+    first, last = bounds
+    return (start is None or last >= start) and (end is None or first <= end)
+
+
+def write_ipc_atomic(df: pl.DataFrame, path: str) -> None:
+    """
+    Writes an uncompressed Arrow IPC file through a temporary file, so a
+    reader never sees a half written file.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    df.write_ipc(tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+
+def _game_date_expr() -> pl.Expr:
+    # statcast game_date comes through pandas as a datetime
+    return pl.col("game_date").cast(pl.Date)
+
+
+def append_scored_pairs(
+    scored_df: pl.DataFrame,
+    game_date: datetime.date,
+    store_dir: str = SCORED_PAIRS_STORE_DIR,
+) -> str:
+    """
+    Writes one day's scored pitch pairs to the store. Writing the same day
+    again replaces it.
+
+    @params
+        scored_df: polars dataframe of scored pitch pairs (see
+                   compute_tscore.score_pitches).
+        game_date: the date the pitches were thrown.
+        store_dir: root directory of the scored pair store.
+
+    @returns
+        path of the daily file that was written.
+    """
+    directory = _partition_dir(store_dir, DAILY)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{game_date}{IPC_SUFFIX}")
+    write_ipc_atomic(scored_df, path)
+    return path
+
+
+def scored_pair_files(
+    store_dir: str = SCORED_PAIRS_STORE_DIR,
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+) -> list[str]:
+    """
+    Lists the store files that can contain pitch pairs between start and end
+    (inclusive, either can be None for an open range). Files outside of the
+    range are never opened.
+    """
+    files: list[str] = []
+    for month in _list_partitions(store_dir, COMPACTED):
+        if _overlaps(_month_bounds(month), start, end):
+            files.append(
+                os.path.join(
+                    _partition_dir(store_dir, COMPACTED), f"{month}{IPC_SUFFIX}"
+                )
+            )
+    for day in _list_partitions(store_dir, DAILY):
+        date = datetime.date.fromisoformat(day)
+        if _overlaps((date, date), start, end):
+            files.append(
+                os.path.join(_partition_dir(store_dir, DAILY), f"{day}{IPC_SUFFIX}")
+            )
+    return files
+
+
+def scan_scored_pairs(
+    store_dir: str = SCORED_PAIRS_STORE_DIR,
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+    columns: Optional[list[str]] = None,
+) -> pl.LazyFrame:
+    """
+    Lazily scans the scored pair store. Every file is memory mapped, only the
+    files that overlap the date range are scanned, and the date filter and
+    column projection are pushed into the scans so nothing else is read.
+
+    @params
+        store_dir: root directory of the scored pair store.
+        start: first game date to include, None for no lower bound.
+        end: last game date to include, None for no upper bound.
+        columns: columns to read, None for all of them.
+
+    @returns
+        polars LazyFrame over the selected pitch pairs.
+    """
+    daily_dates = [
+        datetime.date.fromisoformat(day) for day in _list_partitions(store_dir, DAILY)
+    ]
+
+    scans: list[pl.LazyFrame] = []
+    for path in scored_pair_files(store_dir, start, end):
+        scan = pl.scan_ipc(path, memory_map=True)
+        if os.path.basename(os.path.dirname(path)) == COMPACTED and daily_dates:
+            scan = scan.filter(~_game_date_expr().is_in(daily_dates))
+        scans.append(scan)
+
+    if not scans:
+        return pl.LazyFrame(schema={col: pl.Null for col in columns or []})
+
+    lazy_df = pl.concat(scans, how="diagonal_relaxed")
+    if start is not None:
+        lazy_df = lazy_df.filter(_game_date_expr() >= start)
+    if end is not None:
+        lazy_df = lazy_df.filter(_game_date_expr() <= end)
+    if columns is not None:
+        lazy_df = lazy_df.select(columns)
+    return lazy_df
+
+
+def compact(
+    store_dir: str = SCORED_PAIRS_STORE_DIR,
+    before: Optional[datetime.date] = None,
+) -> list[str]:
+    """
+    Merges the daily files of every month that ends before the given date
+    (default: the current month is left alone) into that month's compacted
+    file and removes the daily files.
+
+    @params
+        store_dir: root directory of the scored pair store.
+        before: only months that end before this date are compacted.
+
+    @returns
+        list of the months that were compacted.
+    """
+    before = before or datetime.date.today().replace(day=1)
+
+    months: dict[str, list[str]] = {}
+    for day in _list_partitions(store_dir, DAILY):
+        months.setdefault(day[:7], []).append(day)
+
+    compacted_dir = _partition_dir(store_dir, COMPACTED)
+    os.makedirs(compacted_dir, exist_ok=True)
+
+    compacted: list[str] = []
+    for month, days in sorted(months.items()):
+        if _month_bounds(month)[1] >= before:
+            continue
+
+        daily_paths = [
+            os.path.join(_partition_dir(store_dir, DAILY), f"{day}{IPC_SUFFIX}")
+            for day in days
+        ]
+        month_path = os.path.join(compacted_dir, f"{month}{IPC_SUFFIX}")
+
+        frames = [pl.read_ipc(path, memory_map=False) for path in daily_paths]
+        if os.path.exists(month_path):
+            replaced = [datetime.date.fromisoformat(day) for day in days]
+            frames.insert(
+                0,
+                pl.read_ipc(month_path, memory_map=False).filter(
+                    ~_game_date_expr().is_in(replaced)
+                ),
+            )
+
+        merged = pl.concat(frames, how="diagonal_relaxed").sort(
+            ["game_date", "pitcher", "at_bat_number", "pitch_number"]
+        )
+        write_ipc_atomic(merged, month_path)
+
+        for path in daily_paths:
+            os.remove(path)
+        compacted.append(month)
+
+    return compacted
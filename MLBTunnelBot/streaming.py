@@ -0,0 +1,200 @@
+import polars as pl
+import numpy as np
+
+from typing import Iterator, Optional
+import datetime
+import logging
+
+from .compute_tscore import _get_yesterdays_pitches, score_pitches
+from .exceptions import EmptyStatcastDFException
+from .partials import (
+    top_k,
+    merge_top_k,
+    pitcher_aggregates,
+    merge_pitcher_aggregates,
+    score_sketch,
+    merge_score_sketches,
+)
+from .consts import (
+    KEEPER_COLS,
+    STREAM_MEMORY_BUDGET_MB,
+    STREAM_TOP_K,
+    TUNNEL_DISTANCE_FLOOR,
+    MIN_PITCHER_PITCHES,
+)
+
+# Pitch pairs never cross a game (see compute_tscore._tie_pitches_to_previous),
+# so scoring a season one batch of games at a time gives exactly the same
+# pairs as scoring it all at once. Only the running top k, the per pitcher
+# aggregates and the score sketch are carried between batches, and all of
+# them are bounded by the number of pitchers, not the number of pitches.
+
+# columns computed by _compute_tunnel_score rather than read from statcast
+_COMPUTED_COLS: set[str] = {
+    "tunnel_distance",
+    "actual_distance",
+    "tunnel_score",
+    "plate_x_no_movement",
+    "plate_z_no_movement",
+}
+
+# the raw statcast columns score_pitches actually needs. Reading only these
+# keeps the prev_ columns added by the tie step from doubling the whole frame.
+SCORE_INPUT_COLS: list[str] = [
+    col
+    for col in dict.fromkeys(
+        [col.removeprefix("prev_") for col in KEEPER_COLS] + ["pfx_x", "pfx_z"]
+    )
+    if col not in _COMPUTED_COLS
+]
+
+# scoring holds the input, the sorted copy with prev_ columns and the
+# distance columns at the same time, roughly this many times the input size
+PEAK_MEMORY_FACTOR = 4
+
+
+def _plan_batches(
+    source: pl.LazyFrame, partition_col: str, memory_budget_bytes: int
+) -> Iterator[pl.Series]:
+    """
+    Groups the values of partition_col into batches whose estimated peak
+    scoring memory fits in the budget. The per row size is measured on the
+    first partition. A partition that is bigger than the budget on its own
+    is still processed, as its own batch. Batches are slices of the key
+    column, so they keep its dtype (is_in with python datetimes does not
+    match a Datetime(ns) game_date).
+    """
+    counts = (
+        source.group_by(partition_col)
+        .agg(n_rows=pl.len())
+        .sort(partition_col)
+        .collect(streaming=True)
+    )
+    if counts.is_empty():
+        return
+
+    keys = counts.get_column(partition_col)
+    sample = source.filter(pl.col(partition_col) == keys[0]).collect(streaming=True)
+    bytes_per_row = PEAK_MEMORY_FACTOR * sample.estimated_size() / max(len(sample), 1)
+    del sample
+
+    batch_start = 0
+    batch_bytes = 0.0
+    for i, (key, n_rows) in enumerate(counts.iter_rows()):
+        partition_bytes = n_rows * bytes_per_row
+        if i > batch_start and batch_bytes + partition_bytes > memory_budget_bytes:
+            yield keys.slice(batch_start, i - batch_start)
+            batch_start, batch_bytes = i, 0.0
+        if partition_bytes > memory_budget_bytes:
+            logging.warning(
+                f"{partition_col} {key} needs about {partition_bytes / 2**20:.0f}MB, "
+                f"more than the {memory_budget_bytes / 2**20:.0f}MB budget."
+            )
+        batch_bytes += partition_bytes
+    yield keys.slice(batch_start)
+
+
+def stream_scored_pairs(
+    source: pl.LazyFrame,
+    partition_col: str = "game_pk",
+    memory_budget_mb: float = STREAM_MEMORY_BUDGET_MB,
+    baselines: Optional[pl.DataFrame] = None,
+    distance_floor: float = TUNNEL_DISTANCE_FLOOR,
+    min_pitcher_pitches: int = MIN_PITCHER_PITCHES,
+) -> Iterator[pl.DataFrame]:
+    """
+    Scores a lazily scanned frame of raw statcast pitches (for example
+    pl.scan_parquet over a season of cached pitches) a batch of games at a
+    time. Reading a batch uses the Polars streaming engine, and only the
+    columns scoring needs are read.
+
+    @params
+        source: polars LazyFrame of raw statcast pitch data.
+        partition_col: "game_pk" or "game_date", pairs never cross either one.
+        memory_budget_mb: target peak memory of one batch.
+        baselines: optional arsenal baseline table (see baselines.load_baselines).
+        distance_floor: see compute_tscore.score_pitches.
+        min_pitcher_pitches: see compute_tscore.score_pitches.
+
+    @returns
+        iterator of scored pitch pair frames (see compute_tscore.score_pitches),
+        one per batch.
+    """
+    assert partition_col in ("game_pk", "game_date"), "pairs can cross this column."
+
+    projected = source.select(SCORE_INPUT_COLS)
+    budget_bytes = int(memory_budget_mb * 2**20)
+    for batch in _plan_batches(projected, partition_col, budget_bytes):
+        batch_df = projected.filter(pl.col(partition_col).is_in(batch)).collect(
+            streaming=True
+        )
+        yield score_pitches(
+            batch_df,
+            baselines=baselines,
+            distance_floor=distance_floor,
+            min_pitcher_pitches=min_pitcher_pitches,
+        )
+
+
+def stream_statcast_dates(
+    start: datetime.date,
+    end: datetime.date,
+    baselines: Optional[pl.DataFrame] = None,
+    distance_floor: float = TUNNEL_DISTANCE_FLOOR,
+    min_pitcher_pitches: int = MIN_PITCHER_PITCHES,
+) -> Iterator[pl.DataFrame]:
+    """
+    Fetches and scores one date at a time, for when the pitches are not
+    cached locally. Days without games are skipped. The keyword arguments
+    are those of stream_scored_pairs.
+
+    @returns
+        iterator of scored pitch pair frames, one per date.
+    """
+    day = start
+    while day <= end:
+        try:
+            pitches_df = _get_yesterdays_pitches(day)
+        except EmptyStatcastDFException:
+            pitches_df = None
+
+        if pitches_df is not None:
+            yield score_pitches(
+                pitches_df.select(SCORE_INPUT_COLS),
+                baselines=baselines,
+                distance_floor=distance_floor,
+                min_pitcher_pitches=min_pitcher_pitches,
+            )
+        day += datetime.timedelta(days=1)
+
+
+def run_streaming(
+    scored_batches: Iterator[pl.DataFrame], k: int = STREAM_TOP_K
+) -> tuple[pl.DataFrame, pl.DataFrame, np.ndarray]:
+    """
+    Folds scored batches (see stream_scored_pairs and stream_statcast_dates)
+    into a running top k, per pitcher aggregates and score sketch. The result
+    is the same as running partials.top_k, pitcher_aggregates and score_sketch
+    on the whole input scored in memory.
+
+    @params
+        scored_batches: iterator of scored pitch pair frames.
+        k: number of top pitch pairs to keep.
+
+    @returns
+        tuple of the top k pitch pairs, per pitcher aggregates and the
+        log_2 tunnel score sketch.
+    """
+    top_k_df = pl.DataFrame()
+    agg_df = merge_pitcher_aggregates([])
+    sketch = merge_score_sketches([])
+
+    # merge after every batch so the state never grows with the input
+    for scored_df in scored_batches:
+        if scored_df.is_empty():
+            continue
+        top_k_df = merge_top_k([top_k_df, top_k(scored_df, k)], k)
+        agg_df = merge_pitcher_aggregates([agg_df, pitcher_aggregates(scored_df)])
+        sketch = merge_score_sketches([sketch, score_sketch(scored_df)])
+
+    return top_k_df, agg_df, sketch
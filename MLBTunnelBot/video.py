@@ -0,0 +1,282 @@
+import imageio.v2 as imageio
+import imageio_ffmpeg
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterator, Optional
+import contextlib
+import itertools
+import subprocess
+import os
+
+from .consts import (
+    OVERLAY_ALPHA,
+    OVERLAY_CHUNK_FRAMES,
+    RELEASE_SEARCH_FRAMES,
+    OVERLAY_WORKERS,
+)
+from .exceptions import ClipFrameRateMismatchException
+
+# Overlays the film room clips of the tunneled pitch and the previous pitch
+# (see compute_tscore._get_film_room_videos) into one GIF/MP4, like the Sam
+# Long overlay in the README. Both clips are decoded lazily and blended
+# OVERLAY_CHUNK_FRAMES frames at a time and every output frame is streamed
+# into ffmpeg as soon as it is blended, so memory stays flat no matter how
+# long the clips are. Fetching the clips is left to the caller.
+
+
+def _motion(frames: Iterator[np.ndarray]) -> Iterator[float]:
+    """
+    Mean absolute difference between consecutive frames, on a downsampled
+    grayscale copy so it stays cheap.
+    """
+    prev = None
+    for frame in frames:
+        gray = frame[::4, ::4, :3].mean(axis=2, dtype=np.float32)
+        if prev is not None:
+            yield float(np.abs(gray - prev).mean())
+        prev = gray
+
+
+def find_release_frame(path: str, search_frames: int = RELEASE_SEARCH_FRAMES) -> int:
+    """
+    Estimates the frame the ball is released on, as the biggest spike in
+    motion over the first search_frames frames of the clip. On the center
+    field broadcast view the arm whip at release is by far the biggest
+    motion before the ball reaches the plate. This is a heuristic, so
+    overlay_clips also takes the release frames directly.
+
+    @params
+        path: path of a local video clip.
+        search_frames: number of frames from the start of the clip to search.
+
+    @returns
+        index of the estimated release frame.
+    """
+    reader = imageio.get_reader(path)
+    try:
+        motion = np.fromiter(
+            _motion(itertools.islice(reader.iter_data(), search_frames)),
+            dtype=np.float32,
+        )
+    finally:
+        reader.close()
+    return int(motion.argmax()) + 1 if len(motion) else 0
+
+
+def _chunks(frames: Iterator[np.ndarray], chunk_size: int) -> Iterator[np.ndarray]:
+    while True:
+        chunk = list(itertools.islice(frames, chunk_size))
+        if not chunk:
+            return
+        yield np.stack(chunk)
+
+
+def _blend(tunneled: np.ndarray, previous: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    Blends two chunks of frames. Clips of different sizes are cropped to the
+    size they share, and the chunks are cut to the shorter one.
+    """
+    n = min(len(tunneled), len(previous))
+    h = min(tunneled.shape[1], previous.shape[1])
+    w = min(tunneled.shape[2], previous.shape[2])
+    blended = tunneled[:n, :h, :w, :3].astype(np.float32) * alpha
+    blended += previous[:n, :h, :w, :3].astype(np.float32) * (1 - alpha)
+    return blended.round().astype(np.uint8)
+
+
+class _GifWriter:
+    """
+    Streams frames into a GIF through ffmpeg. imageio's GIF writer (Pillow)
+    keeps every frame until it is closed, so instead the frames are piped
+    into a lossless intermediate clip next to out_path, and ffmpeg builds a
+    palette from it and encodes the GIF in two more passes over the file.
+    """
+
+    def __init__(self, out_path: str, fps: float) -> None:
+        self.out_path = out_path
+        self.fps = fps
+        self._clip_path = f"{out_path}.tmp.mov"
+        self._palette_path = f"{out_path}.palette.png"
+        self._frames: Optional[Any] = None
+
+    def append_data(self, frame: np.ndarray) -> None:
+        if self._frames is None:
+            self._frames = imageio_ffmpeg.write_frames(
+                self._clip_path,
+                (frame.shape[1], frame.shape[0]),
+                fps=self.fps,
+                codec="qtrle",
+                pix_fmt_out="rgb24",
+                quality=None,
+                macro_block_size=1,
+            )
+            self._frames.send(None)
+        self._frames.send(np.ascontiguousarray(frame))
+
+    def _remove_tmp_files(self) -> None:
+        for path in [self._clip_path, self._palette_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def abort(self) -> None:
+        """
+        Stops ffmpeg and removes the intermediate clip without encoding the
+        GIF, for when the overlay failed part way.
+        """
+        try:
+            if self._frames is not None:
+                # the original error is the one worth raising
+                with contextlib.suppress(Exception):
+                    self._frames.close()
+        finally:
+            self._frames = None
+            self._remove_tmp_files()
+
+    def close(self) -> None:
+        if self._frames is None:
+            return
+        self._frames.close()
+        self._frames = None
+
+        ffmpeg = [imageio_ffmpeg.get_ffmpeg_exe(), "-y", "-loglevel", "error"]
+        try:
+            subprocess.run(
+                ffmpeg
+                + ["-i", self._clip_path, "-vf", "palettegen", self._palette_path],
+                check=True,
+            )
+            subprocess.run(
+                ffmpeg
+                + ["-i", self._clip_path, "-i", self._palette_path]
+                + ["-lavfi", "paletteuse", "-loop", "0", self.out_path],
+                check=True,
+            )
+        finally:
+            self._remove_tmp_files()
+
+
+def _get_writer(out_path: str, fps: float) -> Any:
+    if out_path.lower().endswith(".gif"):
+        return _GifWriter(out_path, fps)
+    # the ffmpeg writer pipes every frame straight into the encoder
+    return imageio.get_writer(out_path, fps=fps, macro_block_size=1)
+
+
+def _abort_writer(writer: Any, out_path: str) -> None:
+    """
+    Closes the ffmpeg pipe of a writer whose overlay failed and removes what
+    it wrote, so no truncated overlay is left at out_path.
+    """
+    if isinstance(writer, _GifWriter):
+        writer.abort()
+        return
+    with contextlib.suppress(Exception):
+        writer.close()
+    if os.path.exists(out_path):
+        os.remove(out_path)
+
+
+def _clip_fps(tunneled_reader: Any, previous_reader: Any) -> float:
+    tunneled_fps = tunneled_reader.get_meta_data().get("fps", 30)
+    previous_fps = previous_reader.get_meta_data().get("fps", 30)
+    # frames are blended one to one, so the clips have to share a frame rate
+    # or the clips drift apart after the release frame
+    if abs(tunneled_fps - previous_fps) > 1e-3:
+        raise ClipFrameRateMismatchException(
+            f"tunneled clip is {tunneled_fps} fps, previous clip is {previous_fps} fps"
+        )
+    return tunneled_fps
+
+
+def overlay_clips(
+    tunneled_path: str,
+    previous_path: str,
+    out_path: str,
+    tunneled_release: Optional[int] = None,
+    previous_release: Optional[int] = None,
+    alpha: float = OVERLAY_ALPHA,
+    chunk_size: int = OVERLAY_CHUNK_FRAMES,
+) -> str:
+    """
+    Aligns two local clips on their release frame and blends them frame by
+    frame into a GIF or MP4 (picked by the extension of out_path). Both
+    clips must have the same frame rate, which is used for the output.
+
+    @params
+        tunneled_path: clip of the pitch with the high tunnel score.
+        previous_path: clip of the previous pitch in the at bat.
+        out_path: where to write the overlay, .gif or .mp4.
+        tunneled_release: release frame of the tunneled clip, estimated if None.
+        previous_release: release frame of the previous clip, estimated if None.
+        alpha: weight of the tunneled clip in the blend.
+        chunk_size: number of frames of each clip held in memory at once.
+
+    @returns
+        out_path.
+    """
+    if tunneled_release is None:
+        tunneled_release = find_release_frame(tunneled_path)
+    if previous_release is None:
+        previous_release = find_release_frame(previous_path)
+
+    # drop frames from the start of the clip that releases later so that both
+    # release frames land on the same output frame
+    lead = min(tunneled_release, previous_release)
+    tunneled_skip = tunneled_release - lead
+    previous_skip = previous_release - lead
+
+    tunneled_reader = imageio.get_reader(tunneled_path)
+    previous_reader = imageio.get_reader(previous_path)
+    writer = None
+    try:
+        writer = _get_writer(out_path, _clip_fps(tunneled_reader, previous_reader))
+        tunneled_chunks = _chunks(
+            itertools.islice(tunneled_reader.iter_data(), tunneled_skip, None),
+            chunk_size,
+        )
+        previous_chunks = _chunks(
+            itertools.islice(previous_reader.iter_data(), previous_skip, None),
+            chunk_size,
+        )
+        # zip stops at the end of the shorter clip
+        for tunneled, previous in zip(tunneled_chunks, previous_chunks):
+            for frame in _blend(tunneled, previous, alpha):
+                writer.append_data(frame)
+    except BaseException:
+        if writer is not None:
+            _abort_writer(writer, out_path)
+        raise
+    else:
+        # only a finished overlay is encoded
+        writer.close()
+    finally:
+        tunneled_reader.close()
+        previous_reader.close()
+
+    return out_path
+
+
+def _overlay_pair(kwargs: dict[str, Any]) -> str:
+    return overlay_clips(**kwargs)
+
+
+def overlay_clip_pairs(
+    pairs: list[dict[str, Any]], max_workers: int = OVERLAY_WORKERS
+) -> list[str]:
+    """
+    Renders several overlays in parallel worker processes. Each process
+    streams its own pair, so total memory is max_workers times one pair.
+
+    @params
+        pairs: list of keyword arguments for overlay_clips.
+        max_workers: number of worker processes.
+
+    @returns
+        list of the written out paths, in the same order as pairs.
+    """
+    for pair in pairs:
+        os.makedirs(os.path.dirname(os.path.abspath(pair["out_path"])), exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_overlay_pair, pairs))
@@ -8,13 +8,24 @@ import requests
 import logging
 
 from .plot_tunnel import plot_strike_zone
-from .x_api_info import api, client
+from .x_api_info import api, publish_client
+from .publish import enqueue_thread, publish, thread_statuses
+from .exceptions import PostNotSentException
 from .compute_tscore import yesterdays_top_tunnel
 from .consts import *
 
 HEADSHOT_BASE_URL = "https://img.mlbstatic.com/mlb-photos/image/upload/d_people:generic:headshot:67:current.png/w_426,q_auto:best/v1/people/{player_mlbam_id}/headshot/67/current"
 
 
+def _fetch_url(url: str) -> tuple[int, bytes]:
+    """
+    The only place images are requested from mlbstatic, kept separate so
+    it can be recorded and replayed (see replay.py).
+    """
+    r = requests.get(url)
+    return r.status_code, r.content
+
+
 def _get_player_headshot(player_mlbam_id: str | float) -> np.ndarray:
     """
     Scrapes the players headshot with the given mlbam id from the
@@ -31,10 +42,10 @@ def _get_player_headshot(player_mlbam_id: str | float) -> np.ndarray:
 
     url = HEADSHOT_BASE_URL.format(player_mlbam_id=player_mlbam_id)
 
-    r = requests.get(url)
-    if r.status_code == 200:
+    status_code, content = _fetch_url(url)
+    if status_code == 200:
         with open(PROFILE_PIC_DIR, "wb") as f:
-            f.write(r.content)
+            f.write(content)
     else:
         logging.warning(
             f"Failed to update profile picture image from {url}. \nPlayer id: {player_mlbam_id}\nUsing Default."
@@ -76,6 +87,10 @@ def _build_tweet_text(**kwargs) -> str:
 
     title = f"TOP PITCH BY TUNNEL SCORE {kwargs['yesterday']}"
     t_score = f"{kwargs['pitcher_name']} {kwargs['pitch_name']}: {kwargs['tunnel_score']:.3f}🔥"
+    relative_score = kwargs.get("relative_tunnel_score")
+    if kwargs.get("score") == "relative" and relative_score is not None:
+        title = f"TOP PITCH BY RELATIVE TUNNEL SCORE {kwargs['yesterday']}"
+        t_score += f" (relative {relative_score:+.2f})"
     home_hashtag = HASHTAG_MAP.get(kwargs["home_team"], None)
     away_hashtag = HASHTAG_MAP.get(kwargs["away_team"], None)
 
@@ -94,6 +109,111 @@ def _build_tweet_text(**kwargs) -> str:
     )
 
 
+def _tweet_length(text: str) -> int:
+    """
+    Length of a tweet the way X counts it (see consts.TWEET_LIGHT_CHAR_RANGES).
+    """
+    return sum(
+        1
+        if any(low <= ord(char) <= high for low, high in TWEET_LIGHT_CHAR_RANGES)
+        else 2
+        for char in text
+    )
+
+
+def _leaderboard_parts(kwargs: dict[str, Any]) -> tuple[str, list[str], str]:
+    """
+    Splits a leaderboard into its title, one line per row and hashtags.
+    """
+    assert kwargs is not None, "No kwargs passed to _build_leaderboard_text"
+    assert isinstance(kwargs, dict), "kwargs is not a dictionary in _build_leaderboard_text"
+
+    for arg in ["title", "leaderboard_df"]:
+        assert kwargs.get(arg) is not None, f"{arg} not in build leaderboard kwargs."
+
+    leaderboard_df: pl.DataFrame = kwargs["leaderboard_df"]
+    score_col = SCORE_COLS[kwargs.get("score", "raw")]
+    rows = []
+    for rank, row in enumerate(leaderboard_df.iter_rows(named=True), start=1):
+        label = [
+            str(row.get("pitcher_name") or row.get("pitcher") or ""),
+            row.get("pitcher_team") or "",
+            (
+                f"{row['prev_pitch_type']}→{row['pitch_type']}"
+                if row.get("pitch_type")
+                else ""
+            ),
+            str(row.get("game_date") or ""),
+        ]
+        score = f"{row.get(score_col, row.get(f'{score_col}_max')):.3f}"
+        rows.append(f"{rank}. {' '.join(part for part in label if part)}: {score}")
+
+    teams = (
+        leaderboard_df.get_column("pitcher_team").to_list()
+        if "pitcher_team" in leaderboard_df.columns
+        else []
+    )
+    hashtags = {HASHTAG_MAP[team] for team in teams if team in HASHTAG_MAP}
+    return (
+        kwargs["title"],
+        rows,
+        " ".join(f"#{hashtag}" for hashtag in sorted(hashtags)),
+    )
+
+
+def _build_leaderboard_text(**kwargs) -> str:
+    """
+    takes in a leaderboard from leaderboard.query_leaderboard (optionally
+    with names from leaderboard.add_pitcher_names) and builds the text
+    for it, one line per row. This can be longer than one tweet, use
+    _build_leaderboard_posts to post it.
+
+    @params
+        kwargs: dictionary of key word arguments which
+                must have the keys "title" and "leaderboard_df"
+                or else an assertion error will be raised.
+                "score" (see consts.SCORE_COLS) picks the score
+                that is shown, default "raw".
+
+    @returns
+        final leaderboard text in string format.
+    """
+    title, rows, hashtags = _leaderboard_parts(kwargs.get("kwargs", None))
+    return "\n\n".join([title, "\n".join(rows), hashtags]).strip()
+
+
+def _build_leaderboard_posts(**kwargs) -> list[str]:
+    """
+    same as _build_leaderboard_text, but splits the rows over as many posts
+    as it takes to keep every post within TWEET_MAX_LENGTH, for posting as
+    a thread. Every post after the first one continues the numbering, and
+    the posts are marked (1/n), (2/n), ... when there is more than one.
+
+    @params
+        kwargs: dictionary of key word arguments which
+                must have the keys "title" and "leaderboard_df"
+                or else an assertion error will be raised.
+
+    @returns
+        list of tweet texts in thread order.
+    """
+    title, rows, hashtags = _leaderboard_parts(kwargs.get("kwargs", None))
+
+    # the blank lines after the title and before the hashtags are kept by
+    # making them part of those lines. Leaves room for a " (10/10)" marker.
+    limit = TWEET_MAX_LENGTH - len(" (10/10)")
+    posts: list[list[str]] = [[f"{title}\n"]]
+    for line in rows + ([f"\n{hashtags}"] if hashtags else []):
+        if posts[-1] and _tweet_length("\n".join(posts[-1] + [line])) > limit:
+            posts.append([])
+        posts[-1].append(line.lstrip("\n") if not posts[-1] else line)
+
+    texts = ["\n".join(post) for post in posts]
+    if len(texts) == 1:
+        return texts
+    return [f"{text} ({i}/{len(texts)})" for i, text in enumerate(texts, start=1)]
+
+
 def _plot_pitches(
     tunneled_pitch: pl.DataFrame, yesterday: datetime.date, player_headshot: np.ndarray
 ) -> None:
@@ -164,7 +284,17 @@ def _plot_pitches(
     )
 
 
-def write(yesterday: datetime.date, debug: bool = False) -> str:
+def write(
+    yesterday: datetime.date,
+    debug: bool = False,
+    store_dir: Optional[str] = None,
+    baseline_dir: Optional[str] = None,
+    sequence_dir: Optional[str] = None,
+    queue_dir: str = PUBLISH_QUEUE_DIR,
+    distance_floor: float = TUNNEL_DISTANCE_FLOOR,
+    min_pitcher_pitches: int = MIN_PITCHER_PITCHES,
+    score: str = "raw",
+) -> str:
     """
     serves as the main function for this entire program.
     write() will post the tweet to x depending on the value
@@ -173,12 +303,29 @@ def write(yesterday: datetime.date, debug: bool = False) -> str:
     @params
         yesterday: datetime.date object of yesterday's date.
         debug: boolean value, if true will not post to x.
+        store_dir: if given, yesterday's scored pitch pairs are appended to
+                   the scored pair store in this directory.
+        baseline_dir: if given, pitch pairs are also scored relative to the
+                      arsenal baselines in this directory.
+        sequence_dir: if given, yesterday's pitch sequence counts are written
+                      to the sequence store in this directory.
+        queue_dir: directory of the publishing queue the tweet goes through.
+        distance_floor: see compute_tscore.score_pitches.
+        min_pitcher_pitches: see compute_tscore.score_pitches.
+        score: score the pitch pair is picked by, see
+               compute_tscore.yesterdays_top_tunnel.
 
     @returns
         the generated tweet text.
     """
     pitch_info: dict[str, Any] = yesterdays_top_tunnel(
         yesterday=yesterday,
+        store_dir=store_dir,
+        baseline_dir=baseline_dir,
+        sequence_dir=sequence_dir,
+        distance_floor=distance_floor,
+        min_pitcher_pitches=min_pitcher_pitches,
+        score=score,
     )
 
 
@@ -189,10 +336,6 @@ def write(yesterday: datetime.date, debug: bool = False) -> str:
     tunnel_df: Optional[pl.DataFrame] = pitch_info.get("tunnel_df", None)
     assert tunnel_df is not None
 
-    tunnel_df = tunnel_df.with_columns(
-        tunnel_score=pl.col("tunnel_score").log(base=2),
-    )
-
     headshot_img = _get_player_headshot(player_mlbam_id=pitcher_id)
     _ = _plot_pitches(
         tunneled_pitch=tunnel_df,
@@ -204,12 +347,13 @@ def write(yesterday: datetime.date, debug: bool = False) -> str:
     if debug:
         return tweet_text
 
-    tunnel_plot = api.media_upload(filename=TUNNEL_PLOT_DIR)
-    assert tunnel_plot is not None, f"tunnel_plot is None."
+    # goes through the publishing queue so rate limits and server errors are
+    # retried, and anything left over from a crashed run is sent first
+    thread_id = enqueue_thread([(tweet_text, [TUNNEL_PLOT_DIR])], queue_dir=queue_dir)
+    _ = publish(queue_dir=queue_dir, api=api, client=publish_client)
 
-    client.create_tweet(
-        text=tweet_text,
-        media_ids=[tunnel_plot.media_id],
-    )
+    statuses = thread_statuses(thread_id, queue_dir=queue_dir)
+    if statuses != ["sent"]:
+        raise PostNotSentException(f"tweet for {yesterday} was not sent: {statuses}")
 
     return tweet_text
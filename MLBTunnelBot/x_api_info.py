@@ -1,3 +1,4 @@
+import requests
 import tweepy
 import os
 
@@ -25,3 +26,13 @@ client = tweepy.Client(
     access_token=ACCESS_TOKEN,
     access_token_secret=ACCESS_TOKEN_SECRET,
 )
+
+# same as client, but returns the raw requests.Response so the publishing
+# queue can read the x-rate-limit-* headers of every request
+publish_client = tweepy.Client(
+    consumer_key=CONSUMER_KEY,
+    consumer_secret=CONSUMER_SECRET,
+    access_token=ACCESS_TOKEN,
+    access_token_secret=ACCESS_TOKEN_SECRET,
+    return_type=requests.Response,
+)
@@ -2,20 +2,342 @@ import MLBTunnelBot
 import datetime
 import logging
 
+from typing import Optional
+import functools
+import polars as pl
+
+from MLBTunnelBot import (
+    compute_tscore,
+    shard,
+    store,
+    baselines,
+    streaming,
+    leaderboard,
+    publish,
+    video,
+    replay,
+    sequences,
+)
+from MLBTunnelBot.x import _build_leaderboard_text, _build_leaderboard_posts
+from MLBTunnelBot.consts import (
+    SHARD_ROOT_DIR,
+    SHARD_DAYS_PER_UNIT,
+    SHARD_TOP_K,
+    STREAM_MEMORY_BUDGET_MB,
+    STREAM_TOP_K,
+    SCORED_PAIRS_STORE_DIR,
+    ARSENAL_BASELINE_DIR,
+    OVERLAY_DIR,
+    OVERLAY_ALPHA,
+    REPLAY_FIXTURE_DIR,
+    REPLAY_LATENCY,
+    SEQUENCE_DIR,
+    SEQUENCE_LENGTHS,
+    TUNNEL_DISTANCE_FLOOR,
+    MIN_PITCHER_PITCHES,
+    SCORE_COLS,
+)
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(message)s",
 )
 
 
-def write_tweet(date: datetime.date, debug: bool) -> None:
+def write_tweet(
+    date: datetime.date,
+    debug: bool,
+    store_dir: Optional[str],
+    baseline_dir: Optional[str],
+    sequence_dir: Optional[str],
+    distance_floor: float,
+    min_pitcher_pitches: int,
+    score: str,
+) -> None:
     try:
-        tweet = MLBTunnelBot.write(yesterday=date, debug=debug)
+        tweet = MLBTunnelBot.write(
+            yesterday=date,
+            debug=debug,
+            store_dir=store_dir,
+            baseline_dir=baseline_dir,
+            sequence_dir=sequence_dir,
+            distance_floor=distance_floor,
+            min_pitcher_pitches=min_pitcher_pitches,
+            score=score,
+        )
         logging.info(f"Successful write for {date}\n{tweet}")
     except Exception as e:
         logging.error(f"Error for {date} due to exception: {e.__class__} -> {e}")
 
 
+def run_shard(
+    action: str,
+    root: str,
+    start: Optional[datetime.date],
+    end: Optional[datetime.date],
+    days_per_unit: int,
+    workers: int,
+    top_k: int,
+    store_dir: Optional[str],
+    distance_floor: float,
+    min_pitcher_pitches: int,
+    allow_incomplete: bool,
+    **_,
+) -> None:
+    if action in ("plan", "local"):
+        assert start is not None and end is not None, f"{action} needs dates"
+
+    if action == "plan":
+        added = shard.plan(root, start, end, days_per_unit=days_per_unit)
+        logging.info(f"Queued {len(added)} shards in {root}")
+    elif action == "work":
+        committed = shard.run_worker(
+            root,
+            k=top_k,
+            store_dir=store_dir,
+            distance_floor=distance_floor,
+            min_pitcher_pitches=min_pitcher_pitches,
+        )
+        logging.info(f"Worker committed {committed} shards in {root}")
+    elif action == "reduce":
+        top_df, _, _ = shard.reduce(
+            root, k=top_k, allow_incomplete=allow_incomplete
+        )
+        logging.info(f"Reduced shards in {root}\n{top_df}")
+    elif action == "local":
+        top_df, _, _ = shard.run_local(
+            root,
+            start,
+            end,
+            n_workers=workers,
+            days_per_unit=days_per_unit,
+            k=top_k,
+            store_dir=store_dir,
+            distance_floor=distance_floor,
+            min_pitcher_pitches=min_pitcher_pitches,
+            allow_incomplete=allow_incomplete,
+        )
+        logging.info(f"Reprocessed {start} to {end} in {root}\n{top_df}")
+
+
+def run_store(action: str, store_dir: Optional[str], **_) -> None:
+    if action == "compact":
+        months = store.compact(store_dir or SCORED_PAIRS_STORE_DIR)
+        logging.info(f"Compacted {len(months)} months: {months}")
+
+
+def run_baselines(
+    action: str,
+    start: Optional[datetime.date],
+    end: Optional[datetime.date],
+    store_dir: Optional[str],
+    baseline_dir: Optional[str],
+    **_,
+) -> None:
+    if action == "backfill":
+        dates = baselines.backfill_baselines(
+            store_dir or SCORED_PAIRS_STORE_DIR,
+            baseline_dir or ARSENAL_BASELINE_DIR,
+            start=start,
+            end=end,
+        )
+        logging.info(f"Folded {len(dates)} days into the arsenal baselines")
+
+
+def run_sequences(
+    action: str,
+    start: Optional[datetime.date],
+    end: Optional[datetime.date],
+    pitcher: Optional[int],
+    n: Optional[int],
+    min_sequences: int,
+    top_n: int,
+    sort_by: str,
+    sequence_dir: Optional[str],
+    distance_floor: float,
+    min_pitcher_pitches: int,
+    **_,
+) -> None:
+    if action == "backfill":
+        assert start is not None and end is not None, f"{action} needs dates"
+        dates = sequences.backfill_sequences(
+            [start + datetime.timedelta(days=i) for i in range((end - start).days + 1)],
+            functools.partial(
+                compute_tscore.fetch_pitch_pairs,
+                distance_floor=distance_floor,
+                min_pitcher_pitches=min_pitcher_pitches,
+            ),
+            sequence_dir=sequence_dir or SEQUENCE_DIR,
+        )
+        logging.info(f"Counted the pitch sequences of {len(dates)} days")
+    elif action == "top":
+        top_df = sequences.top_sequences(
+            sequence_dir or SEQUENCE_DIR,
+            start=start,
+            end=end,
+            pitcher=pitcher,
+            n=n,
+            min_sequences=min_sequences,
+            top_n=top_n,
+            sort_by=sort_by,
+        )
+        logging.info(f"Top {top_n} pitch sequences by {sort_by}\n{top_df}")
+
+
+def run_stream(
+    source: Optional[str],
+    start: Optional[datetime.date],
+    end: Optional[datetime.date],
+    partition: str,
+    memory_budget_mb: float,
+    top_k: int,
+    baseline_dir: Optional[str],
+    distance_floor: float,
+    min_pitcher_pitches: int,
+    **_,
+) -> None:
+    guards = dict(
+        distance_floor=distance_floor, min_pitcher_pitches=min_pitcher_pitches
+    )
+    arsenal = baselines.load_baselines(baseline_dir) if baseline_dir else None
+    if source is not None:
+        scan = pl.scan_ipc if source.endswith((".arrow", ".ipc")) else pl.scan_parquet
+        scored_batches = streaming.stream_scored_pairs(
+            scan(source),
+            partition_col=partition,
+            memory_budget_mb=memory_budget_mb,
+            baselines=arsenal,
+            **guards,
+        )
+    else:
+        assert start is not None and end is not None, "stream needs --source or dates"
+        scored_batches = streaming.stream_statcast_dates(
+            start, end, baselines=arsenal, **guards
+        )
+
+    top_df, _, _ = streaming.run_streaming(scored_batches, k=top_k)
+    logging.info(f"Top {top_k} tunnels\n{top_df}")
+
+
+def run_query(
+    start: Optional[datetime.date],
+    end: Optional[datetime.date],
+    days: Optional[int],
+    team: Optional[str],
+    pitcher: Optional[int],
+    pitch_type: Optional[str],
+    prev_pitch_type: Optional[str],
+    top_n: int,
+    group_by: Optional[str],
+    min_pairs: int,
+    names: bool,
+    post: bool,
+    store_dir: Optional[str],
+    score: str,
+    **_,
+) -> None:
+    if days is not None:
+        end = end or yesterday()
+        start = end - datetime.timedelta(days=days - 1)
+
+    leaderboard_df = leaderboard.query_leaderboard(
+        store_dir or SCORED_PAIRS_STORE_DIR,
+        start=start,
+        end=end,
+        team=team,
+        pitcher=pitcher,
+        pitch_type=pitch_type,
+        prev_pitch_type=prev_pitch_type,
+        top_n=top_n,
+        group_by=group_by,
+        min_pairs=min_pairs,
+        score=score,
+    )
+    if leaderboard_df.is_empty():
+        logging.info("No scored pitch pairs match the query")
+        return
+
+    if names:
+        leaderboard_df = leaderboard.add_pitcher_names(leaderboard_df)
+
+    pitch_pair = f"{prev_pitch_type or ''}→{pitch_type or ''}"
+    filters = " ".join(
+        str(part)
+        for part in [team, pitcher, pitch_pair if pitch_pair != "→" else None]
+        if part
+    )
+    score_name = "RELATIVE TUNNEL SCORE" if score == "relative" else "TUNNEL SCORE"
+    title = f"TOP {top_n} BY {score_name} {filters} {start or ''} - {end or ''}"
+    text_kwargs = dict(
+        title=" ".join(title.split()), leaderboard_df=leaderboard_df, score=score
+    )
+    text = _build_leaderboard_text(kwargs=text_kwargs)
+    logging.info(f"{leaderboard_df}\n{text}")
+
+    if post:
+        # one post per chunk of rows that fits in a tweet, as a thread
+        posts = _build_leaderboard_posts(kwargs=text_kwargs)
+        _ = publish.enqueue_thread([(post_text, []) for post_text in posts])
+        run_publish()
+
+
+def run_publish(**_) -> None:
+    sent = publish.publish()
+    logging.info(f"Sent {len(sent)} posts from the publishing queue: {sent}")
+
+
+def run_overlay(
+    tunneled: str,
+    previous: str,
+    out: str,
+    tunneled_release: Optional[int],
+    previous_release: Optional[int],
+    alpha: float,
+    **_,
+) -> None:
+    out_path = video.overlay_clips(
+        tunneled,
+        previous,
+        out,
+        tunneled_release=tunneled_release,
+        previous_release=previous_release,
+        alpha=alpha,
+    )
+    logging.info(f"Wrote pitch overlay to {out_path}")
+
+
+def run_replay(
+    mode: str,
+    dates: list[datetime.date],
+    fixtures: str,
+    latency_scale: float,
+    jitter: float,
+    repeat: int,
+    profile: Optional[str],
+    x_failure_rate: float,
+    x_rate_limit: Optional[int],
+    **_,
+) -> None:
+    timings = replay.benchmark_write(
+        dates,
+        fixture_dir=fixtures,
+        mode=mode,
+        latency={name: s * latency_scale for name, s in REPLAY_LATENCY.items()},
+        jitter=jitter,
+        repeat=repeat if mode == replay.REPLAY else 1,
+        profile_path=profile,
+        x_failure_rate=x_failure_rate,
+        x_rate_limit=x_rate_limit,
+    )
+    seconds = sorted(timing["seconds"] for timing in timings)
+    unsent = sum(not timing["sent"] for timing in timings)
+    logging.info(
+        f"{len(seconds)} runs of write(), total {sum(seconds):.3f}s, "
+        f"median {seconds[len(seconds) // 2]:.3f}s, max {seconds[-1]:.3f}s, "
+        f"{unsent} not sent"
+    )
+
+
 def yesterday() -> datetime.date:
     return datetime.date.today() - datetime.timedelta(days=1)
 
@@ -36,4 +358,388 @@ if __name__ == "__main__":
         default=yesterday(),
     )
 
-    _ = write_tweet(**vars(parser.parse_args()))
+    # these take a required DIR, an optional value would swallow the subcommand
+    # that follows (e.g. "--store shard local")
+    parser.add_argument(
+        "--store",
+        help=f"append every scored pitch pair to the scored pair store in this "
+        f"directory, e.g. {SCORED_PAIRS_STORE_DIR} (which the store, baselines "
+        f"and query commands read when it is not given)",
+        dest="store_dir",
+        metavar="DIR",
+        default=None,
+    )
+    parser.add_argument(
+        "--baselines",
+        help=f"also score pitch pairs relative to the arsenal baselines in this "
+        f"directory, e.g. {ARSENAL_BASELINE_DIR} (which the baselines command "
+        f"uses when it is not given)",
+        dest="baseline_dir",
+        metavar="DIR",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--sequences",
+        help=f"count the day's pitch type sequences into the sequence store in this "
+        f"directory, e.g. {SEQUENCE_DIR} (which the sequences command uses when "
+        f"it is not given)",
+        dest="sequence_dir",
+        metavar="DIR",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--distance-floor",
+        help=f"smallest tunnel distance in feet a tunnel score divides by "
+        f"(default: {TUNNEL_DISTANCE_FLOOR:.4f}, one inch)",
+        type=float,
+        default=TUNNEL_DISTANCE_FLOOR,
+    )
+    parser.add_argument(
+        "--min-pitcher-pitches",
+        help=f"pitchers with fewer pitches in a game are not scored "
+        f"(default: {MIN_PITCHER_PITCHES})",
+        type=int,
+        default=MIN_PITCHER_PITCHES,
+    )
+    parser.add_argument(
+        "--score",
+        help="rank the daily tweet and query leaderboards by the raw tunnel score "
+        "or by the tunnel score relative to the pitcher's arsenal baselines "
+        "(relative needs --baselines for the tweet)",
+        choices=list(SCORE_COLS),
+        default="raw",
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+    shard_parser = subparsers.add_parser(
+        "shard",
+        help="sharded reprocessing of a date range through a shared filesystem queue",
+    )
+    shard_parser.add_argument(
+        "action",
+        choices=["plan", "work", "reduce", "local"],
+        help="plan: queue work units, work: run a worker, reduce: merge partial "
+        "results, local: plan + local worker processes + reduce",
+    )
+    shard_parser.add_argument(
+        "--root",
+        help="shard root directory, must be shared by every node",
+        default=SHARD_ROOT_DIR,
+    )
+    shard_parser.add_argument(
+        "--start",
+        help="first date to process (ISO 8601 format: YYYY-MM-DD)",
+        type=datetime.date.fromisoformat,
+    )
+    shard_parser.add_argument(
+        "--end",
+        help="last date to process (ISO 8601 format: YYYY-MM-DD)",
+        type=datetime.date.fromisoformat,
+    )
+    shard_parser.add_argument(
+        "--days-per-unit",
+        help="days of statcast data per work unit",
+        type=int,
+        default=SHARD_DAYS_PER_UNIT,
+    )
+    shard_parser.add_argument(
+        "--workers",
+        help="number of local worker processes (local only)",
+        type=int,
+        default=4,
+    )
+    shard_parser.add_argument(
+        "--top-k",
+        help="number of top pitch pairs to keep",
+        type=int,
+        default=SHARD_TOP_K,
+    )
+    shard_parser.add_argument(
+        "--allow-incomplete",
+        help="reduce/local: merge the committed units even if some are still "
+        "pending, claimed or failed",
+        action="store_true",
+    )
+
+    store_parser = subparsers.add_parser(
+        "store",
+        help="maintenance of the scored pair store (see --store)",
+    )
+    store_parser.add_argument(
+        "action",
+        choices=["compact"],
+        help="compact: merge the daily files of finished months",
+    )
+
+    baselines_parser = subparsers.add_parser(
+        "baselines",
+        help="maintenance of the arsenal baselines (see --baselines)",
+    )
+    baselines_parser.add_argument(
+        "action",
+        choices=["backfill"],
+        help="backfill: fold every day in the scored pair store into the baselines",
+    )
+    baselines_parser.add_argument(
+        "--start",
+        help="first date to fold in (ISO 8601 format: YYYY-MM-DD)",
+        type=datetime.date.fromisoformat,
+    )
+    baselines_parser.add_argument(
+        "--end",
+        help="last date to fold in (ISO 8601 format: YYYY-MM-DD)",
+        type=datetime.date.fromisoformat,
+    )
+
+    sequences_parser = subparsers.add_parser(
+        "sequences",
+        help="pitchers' most effective 2 and 3 pitch sequences (see --sequences)",
+    )
+    sequences_parser.add_argument(
+        "action",
+        choices=["backfill", "top"],
+        help="backfill: fetch and count the sequences of every day from --start to "
+        "--end that is not counted yet, top: rank the sequences over a date range",
+    )
+    sequences_parser.add_argument(
+        "--start",
+        help="first game date to include (ISO 8601 format: YYYY-MM-DD)",
+        type=datetime.date.fromisoformat,
+    )
+    sequences_parser.add_argument(
+        "--end",
+        help="last game date to include (ISO 8601 format: YYYY-MM-DD)",
+        type=datetime.date.fromisoformat,
+    )
+    sequences_parser.add_argument("--pitcher", help="pitcher mlbam id", type=int)
+    sequences_parser.add_argument(
+        "--n",
+        help="only sequences of this many pitches",
+        type=int,
+        choices=SEQUENCE_LENGTHS,
+    )
+    sequences_parser.add_argument(
+        "--min-sequences",
+        help="leave out sequences thrown fewer times than this",
+        type=int,
+        default=10,
+    )
+    sequences_parser.add_argument(
+        "--top-n",
+        help="number of rows to show",
+        type=int,
+        default=10,
+    )
+    sequences_parser.add_argument(
+        "--sort-by",
+        help="what to rank the sequences by",
+        choices=["tunnel_score_mean", "whiff_rate", "n_sequences"],
+        default="tunnel_score_mean",
+    )
+
+    stream_parser = subparsers.add_parser(
+        "stream",
+        help="score a large date range one game (or date) at a time in bounded memory",
+    )
+    stream_parser.add_argument(
+        "--source",
+        help="parquet or arrow file (or glob) of raw statcast pitches, "
+        "if not given pitches are fetched one date at a time",
+    )
+    stream_parser.add_argument(
+        "--start",
+        help="first date to fetch when there is no --source (YYYY-MM-DD)",
+        type=datetime.date.fromisoformat,
+    )
+    stream_parser.add_argument(
+        "--end",
+        help="last date to fetch when there is no --source (YYYY-MM-DD)",
+        type=datetime.date.fromisoformat,
+    )
+    stream_parser.add_argument(
+        "--partition",
+        help="column the --source is processed by",
+        choices=["game_pk", "game_date"],
+        default="game_pk",
+    )
+    stream_parser.add_argument(
+        "--memory-budget-mb",
+        help="target peak memory of one batch of games",
+        type=float,
+        default=STREAM_MEMORY_BUDGET_MB,
+    )
+    stream_parser.add_argument(
+        "--top-k",
+        help="number of top pitch pairs to keep",
+        type=int,
+        default=STREAM_TOP_K,
+    )
+
+    query_parser = subparsers.add_parser(
+        "query",
+        help="leaderboards over the scored pair store (see --store)",
+    )
+    query_parser.add_argument(
+        "--start",
+        help="first game date to include (ISO 8601 format: YYYY-MM-DD)",
+        type=datetime.date.fromisoformat,
+    )
+    query_parser.add_argument(
+        "--end",
+        help="last game date to include (ISO 8601 format: YYYY-MM-DD)",
+        type=datetime.date.fromisoformat,
+    )
+    query_parser.add_argument(
+        "--days",
+        help="the last N days up to --end (default yesterday), e.g. 7 for the week",
+        type=int,
+    )
+    query_parser.add_argument("--team", help="pitcher's team, e.g. NYY")
+    query_parser.add_argument("--pitcher", help="pitcher mlbam id", type=int)
+    query_parser.add_argument("--pitch-type", help="tunneled pitch type, e.g. CH")
+    query_parser.add_argument("--prev-pitch-type", help="previous pitch type, e.g. SL")
+    query_parser.add_argument(
+        "--top-n",
+        help="number of rows to show",
+        type=int,
+        default=10,
+    )
+    query_parser.add_argument(
+        "--group-by",
+        help="aggregate by this instead of listing single pitch pairs",
+        choices=list(leaderboard.GROUP_BY_COLS),
+    )
+    query_parser.add_argument(
+        "--min-pairs",
+        help="leave out groups with fewer pitch pairs than this",
+        type=int,
+        default=1,
+    )
+    query_parser.add_argument(
+        "--names",
+        help="look up pitcher names for the rows on the leaderboard",
+        action="store_true",
+    )
+    query_parser.add_argument(
+        "--post",
+        help="post the leaderboard to x through the publishing queue",
+        action="store_true",
+    )
+
+    subparsers.add_parser(
+        "publish",
+        help="send everything left in the publishing queue (e.g. after a crash)",
+    )
+
+    overlay_parser = subparsers.add_parser(
+        "overlay",
+        help="overlay the clips of the tunneled pitch and the previous pitch",
+    )
+    overlay_parser.add_argument(
+        "--tunneled", help="local clip of the tunneled pitch", required=True
+    )
+    overlay_parser.add_argument(
+        "--previous", help="local clip of the previous pitch", required=True
+    )
+    overlay_parser.add_argument(
+        "--out", help="output .gif or .mp4 path", default=OVERLAY_DIR
+    )
+    overlay_parser.add_argument(
+        "--tunneled-release",
+        help="release frame of the tunneled clip, estimated if not given",
+        type=int,
+    )
+    overlay_parser.add_argument(
+        "--previous-release",
+        help="release frame of the previous clip, estimated if not given",
+        type=int,
+    )
+    overlay_parser.add_argument(
+        "--alpha",
+        help="weight of the tunneled clip in the blend",
+        type=float,
+        default=OVERLAY_ALPHA,
+    )
+
+    replay_parser = subparsers.add_parser(
+        "replay",
+        help="record the responses of every service write() calls, or replay "
+        "them offline to benchmark and profile the whole pipeline",
+    )
+    replay_parser.add_argument(
+        "mode",
+        choices=[replay.RECORD, replay.REPLAY],
+        help="record: call the real services (X is always faked) and save the "
+        "responses, replay: serve the saved responses with artificial latency",
+    )
+    replay_parser.add_argument(
+        "dates",
+        help="dates to run write() for (ISO 8601 format: YYYY-MM-DD)",
+        type=datetime.date.fromisoformat,
+        nargs="+",
+    )
+    replay_parser.add_argument(
+        "--fixtures",
+        help="directory of the recorded responses",
+        default=REPLAY_FIXTURE_DIR,
+    )
+    replay_parser.add_argument(
+        "--latency-scale",
+        help="multiplier of the typical latency of every service, 0 for none",
+        type=float,
+        default=1.0,
+    )
+    replay_parser.add_argument(
+        "--jitter",
+        help="fraction the latency is randomly varied by, e.g. 0.2",
+        type=float,
+        default=0.0,
+    )
+    replay_parser.add_argument(
+        "--repeat",
+        help="number of times to run every date (replay only)",
+        type=int,
+        default=1,
+    )
+    replay_parser.add_argument(
+        "--profile",
+        help="write cProfile stats of the runs to this file",
+    )
+    replay_parser.add_argument(
+        "--x-failure-rate",
+        help="probability of the fake X answering a request with a 429 or 503",
+        type=float,
+        default=0.0,
+    )
+    replay_parser.add_argument(
+        "--x-rate-limit",
+        help="requests per 15 minute window of each fake X endpoint, after "
+        "which it answers 429 until the window resets",
+        type=int,
+        default=None,
+    )
+
+    args = vars(parser.parse_args())
+    command = args.pop("command")
+    if command == "shard":
+        _ = run_shard(**args)
+    elif command == "store":
+        _ = run_store(**args)
+    elif command == "baselines":
+        _ = run_baselines(**args)
+    elif command == "sequences":
+        _ = run_sequences(**args)
+    elif command == "stream":
+        _ = run_stream(**args)
+    elif command == "query":
+        _ = run_query(**args)
+    elif command == "publish":
+        _ = run_publish(**args)
+    elif command == "overlay":
+        _ = run_overlay(**args)
+    elif command == "replay":
+        _ = run_replay(**args)
+    else:
+        _ = write_tweet(**args)
@@ -0,0 +1,77 @@
+import polars as pl
+import numpy as np
+import pytest
+
+import datetime
+import os
+
+# x_api_info builds the tweepy clients at import time, the tests never use them
+for _key in ["CONSUMER_KEY", "CONSUMER_SECRET", "ACCESS_TOKEN", "ACCESS_TOKEN_SECRET"]:
+    os.environ.setdefault(_key, "test")
+
+PITCH_TYPES = [("FF", "4-Seam Fastball"), ("SL", "Slider"), ("CH", "Changeup")]
+DESCRIPTIONS = ["ball", "called_strike", "swinging_strike", "foul", "hit_into_play"]
+TEAMS = ["NYY", "BOS", "LAD", "SF", "CHC", "STL"]
+
+
+def make_statcast(
+    start: datetime.date,
+    days: int = 3,
+    games_per_day: int = 2,
+    at_bats_per_game: int = 20,
+    seed: int = 0,
+) -> pl.DataFrame:
+    """
+    Synthetic statcast pitches with the columns and dtypes pybaseball
+    returns (game_date is a Datetime(ns)). Two pitchers per game, so every
+    pitcher throws more than MIN_PITCHER_PITCHES.
+    """
+    rng = np.random.default_rng(seed)
+    rows: list[dict] = []
+    for day in range(days):
+        date = start + datetime.timedelta(days=day)
+        game_date = datetime.datetime.combine(date, datetime.time())
+        for game in range(games_per_day):
+            game_pk = date.toordinal() * 100 + game
+            home, away = TEAMS[game % 3 * 2], TEAMS[game % 3 * 2 + 1]
+            for at_bat in range(1, at_bats_per_game + 1):
+                top = at_bat % 2 == 1
+                pitcher = 600_000 + game * 2 + int(top)
+                release_x, release_z = rng.normal(-1.5, 0.1), rng.normal(6.0, 0.1)
+                for pitch_number in range(1, int(rng.integers(2, 7)) + 1):
+                    pitch_type, pitch_name = PITCH_TYPES[rng.integers(len(PITCH_TYPES))]
+                    rows.append(
+                        dict(
+                            game_pk=game_pk,
+                            pitcher=pitcher,
+                            batter=500_000 + at_bat,
+                            home_team=home,
+                            away_team=away,
+                            inning=(at_bat + 1) // 2,
+                            balls=int(rng.integers(0, 4)),
+                            strikes=int(rng.integers(0, 3)),
+                            outs_when_up=int(rng.integers(0, 3)),
+                            des="",
+                            description=DESCRIPTIONS[rng.integers(len(DESCRIPTIONS))],
+                            pitch_type=pitch_type,
+                            pitch_name=pitch_name,
+                            game_date=game_date,
+                            p_throws="R",
+                            stand="L",
+                            inning_topbot="Top" if top else "Bot",
+                            plate_x=rng.normal(0, 0.8),
+                            plate_z=rng.normal(2.5, 0.8),
+                            at_bat_number=at_bat,
+                            pitch_number=pitch_number,
+                            release_pos_x=release_x + rng.normal(0, 0.05),
+                            release_pos_z=release_z + rng.normal(0, 0.05),
+                            pfx_x=rng.normal(0, 0.8),
+                            pfx_z=rng.normal(0.5, 0.8),
+                        )
+                    )
+    return pl.DataFrame(rows).with_columns(pl.col("game_date").cast(pl.Datetime("ns")))
+
+
+@pytest.fixture
+def statcast_df() -> pl.DataFrame:
+    return make_statcast(datetime.date(2024, 6, 3), days=7)
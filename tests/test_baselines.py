@@ -0,0 +1,154 @@
+import polars as pl
+import numpy as np
+import pandas as pd
+
+from polars.testing import assert_frame_equal
+import datetime
+import os
+
+from conftest import make_statcast
+from MLBTunnelBot import compute_tscore
+from MLBTunnelBot.baselines import (
+    BASELINE_KEYS,
+    GEOMETRIES,
+    _pair_deltas,
+    backfill_baselines,
+    load_baselines,
+    update_baselines,
+)
+from MLBTunnelBot.store import append_scored_pairs
+from MLBTunnelBot.compute_tscore import (
+    _compute_tunnel_score,
+    _tie_pitches_to_previous,
+    score_pitches,
+)
+
+
+def test_release_distance_matches_release_baseline(statcast_df):
+    # the relative score divides release_distance by the release RMS, so both
+    # have to measure the same (x, z) offset from the previous release point
+    scored_df = _compute_tunnel_score(_tie_pitches_to_previous(statcast_df))
+    deltas = _pair_deltas(scored_df.drop_nulls("prev_release_pos_x"))
+
+    np.testing.assert_allclose(
+        deltas.get_column("release_distance").to_numpy(),
+        np.hypot(
+            deltas.get_column("release_dx").to_numpy(),
+            deltas.get_column("release_dz").to_numpy(),
+        ),
+    )
+
+
+def test_relative_score_is_added(tmp_path, statcast_df):
+    scored_df = score_pitches(statcast_df)
+    game_date = scored_df.get_column("game_date")[0].date()
+    assert update_baselines(scored_df, game_date, baseline_dir=str(tmp_path))
+
+    relative_df = score_pitches(
+        statcast_df, baselines=load_baselines(str(tmp_path), min_pairs=1)
+    )
+    relative = relative_df.get_column("relative_tunnel_score")
+    assert relative.drop_nulls().len() > 0
+    assert relative.drop_nulls().is_finite().all()
+
+
+def test_relative_tweet_without_baselines_falls_back_to_raw(tmp_path, monkeypatch):
+    day = datetime.date(2024, 6, 3)
+    statcast_df = make_statcast(day, days=1)
+    monkeypatch.setattr(
+        compute_tscore, "_fetch_statcast", lambda **_: statcast_df.to_pandas()
+    )
+    monkeypatch.setattr(
+        compute_tscore,
+        "_lookup_players",
+        lambda ids: pd.DataFrame(
+            dict(
+                key_mlbam=ids,
+                name_first=["first"] * len(ids),
+                name_last=["last"] * len(ids),
+            )
+        ),
+    )
+    baseline_dir = str(tmp_path / "baselines")
+
+    pitch_info = compute_tscore.yesterdays_top_tunnel(
+        day, baseline_dir=baseline_dir, score="relative"
+    )
+
+    assert pitch_info["relative_tunnel_score"] is None
+    assert pitch_info["tunnel_score"] == score_pitches(statcast_df).get_column(
+        "tunnel_score"
+    ).max()
+    # the day was still folded into the (new) baselines
+    assert load_baselines(baseline_dir, min_pairs=1) is not None
+
+
+def _fold_daily(scored_df: pl.DataFrame, baseline_dir: str) -> list[datetime.date]:
+    days = sorted(scored_df.get_column("game_date").cast(pl.Date).unique().to_list())
+    for day in days:
+        day_df = scored_df.filter(pl.col("game_date").cast(pl.Date) == day)
+        assert update_baselines(day_df, day, baseline_dir=baseline_dir)
+    return days
+
+
+def test_refolding_a_day_is_skipped(tmp_path, statcast_df):
+    scored_df = score_pitches(statcast_df)
+    baseline_dir = str(tmp_path)
+    days = _fold_daily(scored_df, baseline_dir)
+    before = load_baselines(baseline_dir, min_pairs=1)
+
+    day_df = scored_df.filter(pl.col("game_date").cast(pl.Date) == days[0])
+    assert not update_baselines(day_df, days[0], baseline_dir=baseline_dir)
+
+    assert_frame_equal(load_baselines(baseline_dir, min_pairs=1), before)
+    assert before.get_column("n_pairs").sum() == scored_df.height
+    # only the current table version is kept
+    tables = [name for name in os.listdir(baseline_dir) if name.endswith(".arrow")]
+    assert len(tables) == 1
+
+
+def test_daily_folds_match_backfill(tmp_path, statcast_df):
+    scored_df = score_pitches(statcast_df)
+    store_dir = str(tmp_path / "store")
+    for (game_date,), day_df in scored_df.group_by(["game_date"]):
+        _ = append_scored_pairs(day_df, game_date.date(), store_dir=store_dir)
+
+    days = _fold_daily(scored_df, str(tmp_path / "daily"))
+    assert backfill_baselines(store_dir, str(tmp_path / "backfill")) == [
+        str(day) for day in days
+    ]
+    assert backfill_baselines(store_dir, str(tmp_path / "backfill")) == []
+
+    assert_frame_equal(
+        load_baselines(str(tmp_path / "daily"), min_pairs=1).sort(BASELINE_KEYS),
+        load_baselines(str(tmp_path / "backfill"), min_pairs=1).sort(BASELINE_KEYS),
+        check_exact=False,
+    )
+
+
+def test_stats_match_numpy(tmp_path, statcast_df):
+    scored_df = score_pitches(statcast_df)
+    _ = _fold_daily(scored_df, str(tmp_path))
+    baselines_df = load_baselines(str(tmp_path), min_pairs=1)
+    deltas = _pair_deltas(scored_df)
+
+    for row in baselines_df.sort("n_pairs", descending=True).head(3).iter_rows(
+        named=True
+    ):
+        group = deltas.filter(*[pl.col(key) == row[key] for key in BASELINE_KEYS])
+        assert row["n_pairs"] == group.height
+        for geom in GEOMETRIES:
+            offsets = group.select([f"{geom}_dx", f"{geom}_dz"]).to_numpy()
+            mean = offsets.mean(axis=0)
+            cov = np.cov(offsets, rowvar=False, bias=True)
+            np.testing.assert_allclose(
+                [row[f"{geom}_mean_x"], row[f"{geom}_mean_z"]], mean, atol=1e-9
+            )
+            np.testing.assert_allclose(
+                [row[f"{geom}_cov_xx"], row[f"{geom}_cov_xz"], row[f"{geom}_cov_zz"]],
+                [cov[0, 0], cov[0, 1], cov[1, 1]],
+                atol=1e-9,
+            )
+            np.testing.assert_allclose(
+                row[f"{geom}_rms"], np.sqrt((offsets**2).sum(axis=1).mean())
+            )
@@ -0,0 +1,112 @@
+import polars as pl
+import numpy as np
+import pytest
+
+import math
+
+from MLBTunnelBot.compute_tscore import _compute_tunnel_score
+from MLBTunnelBot.consts import TUNNEL_DISTANCE_FLOOR
+
+MIN_PITCHES = 4
+PITCH_COLS = ["plate_x", "plate_z", "pfx_x", "pfx_z", "release_pos_x", "release_pos_z"]
+
+
+def _row(pitcher: int, pitch: tuple, prev_pitch: tuple) -> dict:
+    """
+    One tied pitch pair, pitch and prev_pitch are
+    (plate_x, plate_z, pfx_x, pfx_z, release_pos_x, release_pos_z).
+    """
+    return dict(
+        game_pk=1,
+        pitcher=pitcher,
+        **dict(zip(PITCH_COLS, pitch)),
+        **{f"prev_{col}": value for col, value in zip(PITCH_COLS, prev_pitch)},
+    )
+
+
+def _tied_pairs() -> pl.DataFrame:
+    """
+    Pitcher 1 throws MIN_PITCHES pitches, pitcher 2 throws fewer. The at bat
+    columns are left out, _compute_tunnel_score only needs the pair geometry.
+    """
+    ordinary = ((0.5, 2.0, 0.2, 0.5, -1.5, 6.0), (-0.5, 3.0, -0.6, 1.4, -1.4, 6.1))
+    rows = [
+        # a perfect tunnel: both pitches start on the same no movement line
+        _row(1, (0.0, 2.0, 0.0, 0.0, -1.5, 6.0), (1.0, 2.0, 1.0, 0.0, -1.5, 6.1)),
+        # same plate location and different releases: raw score is negative
+        _row(1, (0.0, 2.0, 0.5, 0.0, -1.5, 6.0), (0.0, 2.0, -0.5, 0.0, -1.0, 6.0)),
+        _row(1, *ordinary),
+        # first pitch of an at bat, nothing to pair it with
+        _row(1, (0.0, 2.0, 0.0, 0.0, -1.5, 6.0), (None,) * len(PITCH_COLS)),
+        _row(2, *ordinary),
+        _row(2, *ordinary),
+    ]
+    schema = {col: pl.Float64 for col in rows[0]} | dict(
+        game_pk=pl.Int64, pitcher=pl.Int64
+    )
+    return pl.DataFrame(rows, schema=schema)
+
+
+def _score() -> pl.DataFrame:
+    return _compute_tunnel_score(_tied_pairs(), min_pitcher_pitches=MIN_PITCHES)
+
+
+def test_perfect_tunnel_is_floored():
+    row = _score().row(0, named=True)
+
+    assert row["tunnel_distance"] == 0.0
+    # actual distance 1 ft, release distance 0.1 ft
+    assert row["raw_tunnel_score"] == pytest.approx(1.0 / TUNNEL_DISTANCE_FLOOR - 0.1)
+    assert row["tunnel_score_valid"]
+    assert math.isfinite(row["tunnel_score"])
+
+
+def test_non_positive_raw_score_is_invalid():
+    row = _score().row(1, named=True)
+
+    assert row["raw_tunnel_score"] == pytest.approx(-0.5)
+    assert not row["tunnel_score_valid"]
+    assert row["tunnel_score"] is None
+
+
+def test_unpaired_pitch_is_invalid():
+    row = _score().row(3, named=True)
+
+    assert not row["tunnel_score_valid"]
+    assert row["tunnel_score"] is None
+
+
+def test_pitcher_under_min_pitches_is_invalid():
+    scored_df = _score()
+    pitcher_1, pitcher_2 = scored_df.row(2, named=True), scored_df.row(4, named=True)
+
+    # the same pair geometry, only pitcher 1 threw enough pitches
+    assert pitcher_1["raw_tunnel_score"] == pitcher_2["raw_tunnel_score"]
+    assert pitcher_1["tunnel_score_valid"]
+    assert scored_df.filter(pl.col("pitcher") == 2).get_column(
+        "tunnel_score_valid"
+    ).to_list() == [False, False]
+    assert scored_df.filter(pl.col("pitcher") == 2).get_column(
+        "tunnel_score"
+    ).null_count() == 2
+
+    # and with a low enough minimum, pitcher 2 is scored too
+    relaxed_df = _compute_tunnel_score(_tied_pairs(), min_pitcher_pitches=2)
+    assert relaxed_df.row(4, named=True)["tunnel_score"] == pitcher_1["tunnel_score"]
+
+
+def test_tunnel_score_is_log2_of_raw_score():
+    row = _score().row(2, named=True)
+
+    tunnel = math.hypot(0.3 - 0.1, 1.5 - 1.6)
+    actual = math.hypot(0.5 + 0.5, 2.0 - 3.0)
+    release = math.hypot(-1.5 + 1.4, 6.0 - 6.1)
+    assert row["tunnel_distance"] == pytest.approx(tunnel)
+    assert row["raw_tunnel_score"] == pytest.approx(actual / tunnel - release)
+    assert row["tunnel_score"] == pytest.approx(math.log2(actual / tunnel - release))
+
+    valid_df = _score().filter(pl.col("tunnel_score_valid"))
+    np.testing.assert_allclose(
+        valid_df.get_column("tunnel_score").to_numpy(),
+        np.log2(valid_df.get_column("raw_tunnel_score").to_numpy()),
+    )
@@ -0,0 +1,112 @@
+import polars as pl
+import pytest
+
+import datetime
+
+from MLBTunnelBot.baselines import load_baselines, update_baselines
+from MLBTunnelBot.compute_tscore import score_pitches
+from MLBTunnelBot.leaderboard import PITCHER_TEAM_EXPR, query_leaderboard
+from MLBTunnelBot.store import append_scored_pairs
+from MLBTunnelBot.x import (
+    _build_leaderboard_posts,
+    _build_leaderboard_text,
+    _tweet_length,
+)
+from MLBTunnelBot.consts import TWEET_MAX_LENGTH
+
+
+@pytest.fixture
+def store_dir(tmp_path, statcast_df) -> str:
+    scored_df = score_pitches(statcast_df)
+    for (game_date,), day_df in scored_df.group_by(["game_date"]):
+        _ = append_scored_pairs(day_df, game_date.date(), store_dir=str(tmp_path))
+    return str(tmp_path)
+
+
+@pytest.mark.parametrize("team", ["NYY", "BOS"])
+def test_team_filter(store_dir, statcast_df, team):
+    expected = (
+        score_pitches(statcast_df)
+        .filter(PITCHER_TEAM_EXPR == team)
+        .sort("tunnel_score", descending=True)
+        .head(5)
+    )
+    leaderboard_df = query_leaderboard(store_dir, team=team, top_n=5)
+
+    assert leaderboard_df.get_column("pitcher_team").to_list() == [team] * 5
+    assert (
+        leaderboard_df.get_column("tunnel_score").to_list()
+        == expected.get_column("tunnel_score").to_list()
+    )
+
+
+def test_leaderboard_posts_fit_in_a_tweet(store_dir):
+    leaderboard_df = query_leaderboard(store_dir, top_n=10).with_columns(
+        pitcher_name=pl.lit("Christopher Longnamesson-Whitfield")
+    )
+    kwargs = dict(
+        title=f"TOP 10 BY TUNNEL SCORE {datetime.date(2024, 6, 3)}",
+        leaderboard_df=leaderboard_df,
+    )
+
+    text = _build_leaderboard_text(kwargs=kwargs)
+    posts = _build_leaderboard_posts(kwargs=kwargs)
+
+    assert _tweet_length(text) > TWEET_MAX_LENGTH
+    assert len(posts) > 1
+    assert all(_tweet_length(post) <= TWEET_MAX_LENGTH for post in posts)
+    assert posts[0].startswith(f"{kwargs['title']}\n\n1. ")
+    assert posts[-1].endswith(f"({len(posts)}/{len(posts)})")
+    # every row made it into the thread, in order
+    rows = [line for post in posts for line in post.split("\n") if ". " in line]
+    assert [row.split(".")[0] for row in rows] == [str(i) for i in range(1, 11)]
+
+
+def test_short_leaderboard_is_one_post(store_dir):
+    kwargs = dict(title="TOP 2", leaderboard_df=query_leaderboard(store_dir, top_n=2))
+    assert _build_leaderboard_posts(kwargs=kwargs) == [
+        _build_leaderboard_text(kwargs=kwargs)
+    ]
+
+
+def test_relative_leaderboard(tmp_path, statcast_df):
+    scored_df = score_pitches(statcast_df)
+    first_day = scored_df.get_column("game_date").min()
+    baseline_dir, store_dir = str(tmp_path / "baselines"), str(tmp_path / "store")
+    assert update_baselines(
+        scored_df.filter(pl.col("game_date") == first_day),
+        first_day.date(),
+        baseline_dir=baseline_dir,
+    )
+
+    relative_df = score_pitches(
+        statcast_df, baselines=load_baselines(baseline_dir, min_pairs=1)
+    )
+    for (game_date,), day_df in relative_df.group_by(["game_date"]):
+        _ = append_scored_pairs(day_df, game_date.date(), store_dir=store_dir)
+
+    expected = (
+        relative_df.drop_nulls("relative_tunnel_score")
+        .sort("relative_tunnel_score", descending=True)
+        .head(5)
+    )
+    leaderboard_df = query_leaderboard(store_dir, top_n=5, score="relative")
+    assert (
+        leaderboard_df.get_column("relative_tunnel_score").to_list()
+        == expected.get_column("relative_tunnel_score").to_list()
+    )
+
+    text = _build_leaderboard_text(
+        kwargs=dict(title="TOP 5", leaderboard_df=leaderboard_df, score="relative")
+    )
+    assert f"{expected.get_column('relative_tunnel_score')[0]:.3f}" in text
+
+    grouped_df = query_leaderboard(
+        store_dir, group_by="pitcher", top_n=3, score="relative"
+    )
+    assert "relative_tunnel_score_max" in grouped_df.columns
+
+
+def test_relative_leaderboard_without_relative_scores(store_dir):
+    assert query_leaderboard(store_dir, score="relative").is_empty()
+    assert "relative_tunnel_score" not in query_leaderboard(store_dir).columns
@@ -0,0 +1,183 @@
+import pytest
+
+import time
+
+from MLBTunnelBot import publish
+from MLBTunnelBot.fake_x import FakeX, UPLOAD_ENDPOINT, TWEET_ENDPOINT
+
+
+@pytest.fixture
+def sleeps(monkeypatch) -> list[float]:
+    """
+    Records every backoff and rate limit wait instead of sleeping, and moves
+    a virtual clock (read by both the queue and the fake) forward by it.
+    """
+    delays: list[float] = []
+    start = time.time()
+
+    def _sleep(seconds: float) -> None:
+        delays.append(seconds)
+
+    monkeypatch.setattr(time, "sleep", _sleep)
+    monkeypatch.setattr(time, "time", lambda: start + sum(delays))
+    return delays
+
+
+@pytest.fixture
+def images(tmp_path) -> list[str]:
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"plot_{i}.png"
+        path.write_bytes(f"image {i}".encode())
+        paths.append(str(path))
+    return paths
+
+
+def _publish(queue_dir, x: FakeX) -> list[str]:
+    return publish.publish(queue_dir=queue_dir, api=x, client=x, max_workers=2)
+
+
+def test_thread_replies_chain(tmp_path, images):
+    queue_dir = str(tmp_path / "queue")
+    x = FakeX()
+    thread_id = publish.enqueue_thread(
+        [("first", [images[0]]), ("second", []), ("third", [images[1]])],
+        queue_dir=queue_dir,
+    )
+
+    sent = _publish(queue_dir, x)
+
+    assert publish.thread_statuses(thread_id, queue_dir) == ["sent"] * 3
+    assert sent == [tweet["id"] for tweet in x.tweets]
+    assert [tweet["in_reply_to_tweet_id"] for tweet in x.tweets] == [
+        None,
+        x.tweets[0]["id"],
+        x.tweets[1]["id"],
+    ]
+    assert x.tweets[1]["media_ids"] is None
+
+
+def test_media_ids_are_reused(tmp_path, images):
+    queue_dir = str(tmp_path / "queue")
+    x = FakeX()
+    publish.enqueue_batch(
+        [("a", [images[0]]), ("b", [images[0]]), ("c", [images[1]])],
+        queue_dir=queue_dir,
+    )
+    _ = _publish(queue_dir, x)
+    assert x.calls[UPLOAD_ENDPOINT] == 2
+    assert x.tweets[0]["media_ids"] == x.tweets[1]["media_ids"]
+
+    # a later run within the media id lifetime does not upload again
+    publish.enqueue_thread([("d", [images[0]])], queue_dir=queue_dir)
+    _ = _publish(queue_dir, x)
+    assert x.calls[UPLOAD_ENDPOINT] == 2
+    assert x.tweets[-1]["media_ids"] == x.tweets[0]["media_ids"]
+
+
+def test_server_errors_back_off(tmp_path, images, sleeps):
+    queue_dir = str(tmp_path / "queue")
+    x = FakeX(failures={TWEET_ENDPOINT: [503, 500], UPLOAD_ENDPOINT: [503]})
+    thread_id = publish.enqueue_thread([("a", [images[0]])], queue_dir=queue_dir)
+
+    _ = _publish(queue_dir, x)
+
+    assert publish.thread_statuses(thread_id, queue_dir) == ["sent"]
+    assert x.calls == {UPLOAD_ENDPOINT: 2, TWEET_ENDPOINT: 3}
+    # one upload retry, then two exponential tweet retries
+    assert sleeps == [1, 1, 2]
+
+
+def test_rate_limit_waits_for_reset(tmp_path, sleeps):
+    queue_dir = str(tmp_path / "queue")
+    x = FakeX(failures={TWEET_ENDPOINT: [429]}, retry_after=30.0)
+    thread_id = publish.enqueue_thread([("a", [])], queue_dir=queue_dir)
+
+    _ = _publish(queue_dir, x)
+
+    assert publish.thread_statuses(thread_id, queue_dir) == ["sent"]
+    assert len(sleeps) == 1 and 25 < sleeps[0] <= 31
+
+
+def test_exhausted_window_is_respected_after_restart(tmp_path, sleeps):
+    queue_dir = str(tmp_path / "queue")
+    x = FakeX(rate_limit={TWEET_ENDPOINT: 2}, window_seconds=60.0)
+    publish.enqueue_batch([("a", []), ("b", [])], queue_dir=queue_dir)
+    _ = _publish(queue_dir, x)
+    assert sleeps == []
+
+    # the next publisher reads the persisted window and waits for its reset
+    # instead of sending a request that would come back 429
+    thread_id = publish.enqueue_thread([("c", [])], queue_dir=queue_dir)
+    _ = _publish(queue_dir, x)
+    assert len(sleeps) == 1 and 50 < sleeps[0] <= 61
+    assert publish.thread_statuses(thread_id, queue_dir) == ["sent"]
+
+
+def test_resume_after_crash(tmp_path, images):
+    queue_dir = str(tmp_path / "queue")
+    thread_id = publish.enqueue_thread(
+        [("first", [images[0]]), ("second", []), ("third", [])],
+        queue_dir=queue_dir,
+    )
+
+    class Crash(Exception):
+        pass
+
+    crashing = FakeX()
+    create_tweet = crashing.create_tweet
+
+    def _crash_on_second(**kwargs):
+        if crashing.tweets:
+            raise Crash()
+        return create_tweet(**kwargs)
+
+    crashing.create_tweet = _crash_on_second
+    with pytest.raises(Crash):
+        _ = _publish(queue_dir, crashing)
+    assert publish.thread_statuses(thread_id, queue_dir) == [
+        "sent",
+        "sending",
+        "pending",
+    ]
+
+    x = FakeX()
+    _ = _publish(queue_dir, x)
+    assert publish.thread_statuses(thread_id, queue_dir) == ["sent"] * 3
+    assert x.calls[UPLOAD_ENDPOINT] == 0
+    assert [tweet["text"] for tweet in x.tweets] == ["second", "third"]
+    assert x.tweets[0]["in_reply_to_tweet_id"] == crashing.tweets[0]["id"]
+
+
+def test_bad_media_only_fails_its_own_post(tmp_path, images, sleeps):
+    queue_dir = str(tmp_path / "queue")
+    bad, good = images[0], images[1]
+    x = FakeX(media_failures={publish._file_digest(bad): 403})
+    bad_thread = publish.enqueue_thread([("bad", [bad])], queue_dir=queue_dir)
+    good_thread = publish.enqueue_thread([("good", [good])], queue_dir=queue_dir)
+
+    _ = _publish(queue_dir, x)
+    assert publish.thread_statuses(bad_thread, queue_dir) == ["failed"]
+    assert publish.thread_statuses(good_thread, queue_dir) == ["sent"]
+
+    # the failed post does not block later ones
+    later = publish.enqueue_thread([("later", [])], queue_dir=queue_dir)
+    _ = _publish(queue_dir, x)
+    assert publish.thread_statuses(later, queue_dir) == ["sent"]
+
+
+def test_transient_upload_error_is_retried_next_call(tmp_path, images, sleeps):
+    queue_dir = str(tmp_path / "queue")
+    thread_id = publish.enqueue_thread(
+        [("first", [images[0]]), ("reply", [])], queue_dir=queue_dir
+    )
+
+    # every attempt of the first call fails, the thread waits for the next one
+    failing = FakeX(failures={UPLOAD_ENDPOINT: [503] * publish.PUBLISH_MAX_ATTEMPTS})
+    assert _publish(queue_dir, failing) == []
+    assert publish.thread_statuses(thread_id, queue_dir) == ["pending", "pending"]
+
+    x = FakeX()
+    _ = _publish(queue_dir, x)
+    assert publish.thread_statuses(thread_id, queue_dir) == ["sent", "sent"]
+    assert x.tweets[1]["in_reply_to_tweet_id"] == x.tweets[0]["id"]
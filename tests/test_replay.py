@@ -0,0 +1,56 @@
+import pytest
+
+import time
+
+from MLBTunnelBot import compute_tscore, publish, replay, x
+from MLBTunnelBot.fake_x import FakeX, TWEET_ENDPOINT
+from MLBTunnelBot.exceptions import FixtureMissingException
+
+
+def test_record_then_replay_offline(tmp_path, monkeypatch):
+    fixture_dir = str(tmp_path / "fixtures")
+    monkeypatch.setattr(compute_tscore, "_fetch_statcast", lambda s, e: f"{s}..{e}")
+    monkeypatch.setattr(x, "_fetch_url", lambda url: url.encode())
+
+    with replay.replay_session(fixture_dir, mode=replay.RECORD):
+        assert compute_tscore._fetch_statcast("2024-07-02", "2024-07-02") == (
+            "2024-07-02..2024-07-02"
+        )
+        assert x._fetch_url("headshot.png") == b"headshot.png"
+
+    def _offline(*args):
+        raise AssertionError("replay went to the network")
+
+    monkeypatch.setattr(compute_tscore, "_fetch_statcast", _offline)
+    monkeypatch.setattr(x, "_fetch_url", _offline)
+    with replay.replay_session(fixture_dir, mode=replay.REPLAY):
+        assert compute_tscore._fetch_statcast("2024-07-02", "2024-07-02") == (
+            "2024-07-02..2024-07-02"
+        )
+        assert x._fetch_url("headshot.png") == b"headshot.png"
+        with pytest.raises(FixtureMissingException):
+            _ = compute_tscore._fetch_statcast("2024-07-03", "2024-07-03")
+
+    # the real functions are back once the session ends
+    assert compute_tscore._fetch_statcast is _offline
+
+
+def test_x_is_always_faked(tmp_path, monkeypatch):
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+    real_api, real_client = x.api, x.publish_client
+    queue_dir = str(tmp_path / "queue")
+    thread_id = publish.enqueue_thread([("a", [])], queue_dir=queue_dir)
+
+    with replay.replay_session(
+        str(tmp_path), mode=replay.RECORD, x_failure_rate=1.0
+    ) as fake_x:
+        assert isinstance(fake_x, FakeX)
+        assert x.api is fake_x and x.publish_client is fake_x
+        sent = publish.publish(
+            queue_dir=queue_dir, api=x.api, client=x.publish_client, max_attempts=3
+        )
+
+    assert sent == []
+    assert fake_x.calls[TWEET_ENDPOINT] == 3
+    assert publish.thread_statuses(thread_id, queue_dir) != ["sent"]
+    assert (x.api, x.publish_client) == (real_api, real_client)
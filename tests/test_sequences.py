@@ -0,0 +1,186 @@
+import polars as pl
+
+from polars.testing import assert_frame_equal
+import datetime
+
+from conftest import make_statcast
+from MLBTunnelBot.compute_tscore import score_pitch_pairs
+from MLBTunnelBot.exceptions import EmptyStatcastDFException
+from MLBTunnelBot.sequences import (
+    SEQUENCE_KEYS,
+    SEQUENCE_INPUT_COLS,
+    SUM_COLS,
+    append_sequence_counts,
+    backfill_sequences,
+    count_sequences,
+    decode_sequence,
+    top_sequences,
+)
+
+GAME_DATE = datetime.datetime(2024, 6, 3)
+
+
+def _at_bat_pairs() -> pl.DataFrame:
+    """
+    Pitch pairs of two at bats. The first is FF SL SL CH FF, where the
+    SL -> CH pair (pitch 4) has no valid tunnel score. The second is
+    CU CU _ CH SL, where pitch 3 is missing from the data.
+    """
+    cols = [
+        "at_bat_number",
+        "pitch_number",
+        "prev_pitch_number",
+        "pitch_type",
+        "prev_pitch_type",
+        "description",
+        "tunnel_score",  # None is not valid
+    ]
+    pairs = [
+        (1, 1, None, "FF", None, "called_strike", None),
+        (1, 2, 1, "SL", "FF", "ball", 1.0),
+        (1, 3, 2, "SL", "SL", "swinging_strike", 3.0),
+        (1, 4, 3, "CH", "SL", "ball", None),
+        (1, 5, 4, "FF", "CH", "foul", 4.0),
+        (2, 1, None, "CU", None, "ball", None),
+        (2, 2, 1, "CU", "CU", "ball", 1.0),
+        (2, 4, 2, "CH", "CU", "ball", 2.0),
+        (2, 5, 4, "SL", "CH", "swinging_strike", 5.0),
+    ]
+    return pl.DataFrame(
+        [
+            dict(
+                game_pk=1,
+                game_date=GAME_DATE,
+                pitcher=600_000,
+                tunnel_score_valid=pair[-1] is not None,
+                **dict(zip(cols, pair)),
+            )
+            for pair in pairs
+        ],
+        schema_overrides=dict(prev_pitch_number=pl.Int64, tunnel_score=pl.Float64),
+    ).select(SEQUENCE_INPUT_COLS)
+
+
+def _decoded(counts_df: pl.DataFrame) -> pl.DataFrame:
+    return counts_df.with_columns(
+        sequence=decode_sequence(pl.col("sequence_code"), pl.col("n"))
+    )
+
+
+def test_count_sequences_by_hand():
+    counts_df = _decoded(count_sequences(_at_bat_pairs()))
+
+    rows = {
+        row["sequence"]: row
+        for row in counts_df.select(["n", "sequence"] + SUM_COLS).to_dicts()
+    }
+    # the SL -> CH pair is counted, the missing pitch 3 breaks the second at
+    # bat, so there is no CU-CH and no 3 pitch sequence in it
+    assert sorted(rows) == [
+        "CH-FF",
+        "CH-SL",
+        "CU-CU",
+        "FF-SL",
+        "FF-SL-SL",
+        "SL-CH",
+        "SL-CH-FF",
+        "SL-SL",
+        "SL-SL-CH",
+    ]
+    assert rows["FF-SL-SL"] == dict(
+        n=3,
+        sequence="FF-SL-SL",
+        n_sequences=1,
+        n_scored=1,
+        tunnel_score_sum=2.0,
+        whiffs=1,
+        swings=1,
+    )
+    # thrown, but without a valid score
+    for sequence in ["SL-CH", "SL-SL-CH", "SL-CH-FF"]:
+        assert rows[sequence]["n_sequences"] == 1
+        assert rows[sequence]["n_scored"] == 0
+        assert rows[sequence]["tunnel_score_sum"] == 0.0
+    assert rows["SL-SL"]["tunnel_score_sum"] == 3.0
+    assert rows["CH-SL"]["tunnel_score_sum"] == 5.0
+    assert (rows["CH-FF"]["whiffs"], rows["CH-FF"]["swings"]) == (0, 1)
+    assert counts_df.get_column("game_date").to_list() == [GAME_DATE.date()] * 9
+
+
+def test_decode_round_trip():
+    pairs_df = _at_bat_pairs().filter(pl.col("at_bat_number") == 1)
+    pairs_df = pairs_df.with_columns(
+        pitch_type=pl.Series(["EP", "SL", "KN", "XX", "SL"]),
+        prev_pitch_type=pl.Series([None, "EP", "SL", "KN", "XX"], dtype=pl.Utf8),
+    )
+
+    sequences = _decoded(count_sequences(pairs_df)).get_column("sequence")
+
+    # pitch types missing from PITCH_TYPE_CODES come back as "UN"
+    assert sorted(sequences.to_list()) == [
+        "EP-SL",
+        "EP-SL-KN",
+        "KN-UN",
+        "KN-UN-SL",
+        "SL-KN",
+        "SL-KN-UN",
+        "UN-SL",
+    ]
+
+
+def test_unscored_pitchers_are_counted():
+    statcast_df = make_statcast(datetime.date(2024, 6, 3), days=1)
+
+    counts_df = count_sequences(score_pitch_pairs(statcast_df))
+    # no pitcher threw enough pitches to be scored
+    unscored_df = count_sequences(
+        score_pitch_pairs(statcast_df, min_pitcher_pitches=10_000)
+    )
+
+    assert unscored_df.get_column("n_scored").sum() == 0
+    assert unscored_df.get_column("tunnel_score_sum").sum() == 0.0
+    assert counts_df.get_column("n_scored").sum() > 0
+    assert_frame_equal(
+        unscored_df.select(["game_date"] + SEQUENCE_KEYS + ["n_sequences", "whiffs"]),
+        counts_df.select(["game_date"] + SEQUENCE_KEYS + ["n_sequences", "whiffs"]),
+    )
+
+
+def test_daily_files_merge_to_one_count(tmp_path):
+    statcast_df = make_statcast(datetime.date(2024, 6, 3), days=4)
+    sequence_dir = str(tmp_path / "sequences")
+
+    def fetch_pairs(day: datetime.date) -> pl.DataFrame:
+        day_df = statcast_df.filter(pl.col("game_date").cast(pl.Date) == day)
+        if day_df.is_empty():
+            raise EmptyStatcastDFException(f"no games on {day}")
+        return score_pitch_pairs(day_df)
+
+    days = [datetime.date(2024, 6, 3) + datetime.timedelta(days=i) for i in range(5)]
+
+    # the first day is counted on its own, backfill only counts the rest and
+    # skips the last one, which has no games
+    _ = append_sequence_counts(fetch_pairs(days[0]), days[0], sequence_dir=sequence_dir)
+    assert backfill_sequences(days, fetch_pairs, sequence_dir=sequence_dir) == [
+        str(d) for d in days[1:4]
+    ]
+
+    def fail(day: datetime.date) -> pl.DataFrame:
+        raise AssertionError(f"{day} was already counted")
+
+    assert backfill_sequences(days[:4], fail, sequence_dir=sequence_dir) == []
+
+    expected = (
+        count_sequences(score_pitch_pairs(statcast_df))
+        .group_by(SEQUENCE_KEYS)
+        .agg(pl.col(SUM_COLS).sum())
+        .sort(SEQUENCE_KEYS)
+    )
+    top_df = top_sequences(sequence_dir, min_sequences=1, top_n=expected.height)
+
+    assert top_df.height == expected.height
+    assert_frame_equal(
+        top_df.select(expected.columns).sort(SEQUENCE_KEYS),
+        expected,
+        check_exact=False,
+    )
@@ -0,0 +1,125 @@
+import polars as pl
+import numpy as np
+import pytest
+
+from polars.testing import assert_frame_equal
+import datetime
+import time
+import os
+
+from conftest import make_statcast
+from MLBTunnelBot import shard
+from MLBTunnelBot.compute_tscore import score_pitches
+from MLBTunnelBot.exceptions import ShardQueueIncompleteException
+from MLBTunnelBot.partials import top_k, score_sketch
+
+START = datetime.date(2024, 6, 3)
+END = datetime.date(2024, 6, 8)
+
+
+def _fetch_synthetic(day: datetime.date) -> pl.DataFrame:
+    # module level, so spawned workers can unpickle it
+    return make_statcast(day, days=1, seed=day.toordinal())
+
+
+def _all_days() -> pl.DataFrame:
+    return pl.concat(
+        [
+            _fetch_synthetic(START + datetime.timedelta(days=i))
+            for i in range((END - START).days + 1)
+        ]
+    )
+
+
+def test_run_local_after_polars_was_used(tmp_path):
+    # with fork, workers of a process that already ran polars could deadlock
+    expected = score_pitches(_all_days())
+
+    top_df, _, sketch = shard.run_local(
+        str(tmp_path / "shards"),
+        START,
+        END,
+        n_workers=2,
+        days_per_unit=3,
+        k=5,
+        fetch=_fetch_synthetic,
+    )
+
+    assert_frame_equal(top_df, top_k(expected, 5))
+    np.testing.assert_array_equal(sketch, score_sketch(expected))
+
+    daily_df = pl.read_parquet(
+        tmp_path / "shards" / "results" / shard.DAILY_TOP_K_FILE
+    )
+    for (game_date,), day_df in daily_df.group_by(["game_date"]):
+        day_expected = expected.filter(pl.col("game_date") == game_date)
+        assert_frame_equal(
+            top_k(day_df, 5), top_k(day_expected, 5), check_row_order=True
+        )
+
+
+def test_fresh_claim_is_not_released(tmp_path):
+    root = str(tmp_path)
+    unit_id = shard.plan(root, START, START)[0]
+
+    # planned long before it was claimed
+    pending_path = shard._unit_path(root, shard.PENDING, unit_id)
+    os.utime(pending_path, (time.time() - 3600, time.time() - 3600))
+
+    assert shard._claim(root, unit_id, "worker") is not None
+    shard._release_expired(root, lease_seconds=60)
+
+    assert shard._list_units(root, shard.CLAIMED) == [unit_id]
+    assert shard._list_units(root, shard.PENDING) == []
+
+
+def test_reduce_unplanned_root(tmp_path):
+    with pytest.raises(ShardQueueIncompleteException):
+        shard.reduce(str(tmp_path / "never_planned"), allow_incomplete=True)
+
+
+def test_failed_backup_can_be_retried(tmp_path):
+    root = str(tmp_path)
+    unit_id = shard.plan(root, START, START)[0]
+    assert shard._claim(root, unit_id, "owner") is not None
+
+    calls: list[datetime.date] = []
+
+    def flaky_fetch(day: datetime.date) -> pl.DataFrame:
+        calls.append(day)
+        if len(calls) == 1:
+            raise ConnectionError("statcast is down")
+        return _fetch_synthetic(day)
+
+    # the owner never finishes, so the unit is only done if the second backup runs
+    committed = shard.run_worker(
+        root,
+        worker_id="backup",
+        lease_seconds=3600,
+        straggler_seconds=0,
+        poll_seconds=0,
+        fetch=flaky_fetch,
+    )
+
+    assert committed == 1
+    assert calls == [START, START]
+    assert shard._list_units(root, shard.DONE) == [unit_id]
+    assert not os.path.exists(shard._backup_marker(root, unit_id))
+
+
+def test_replanning_retries_failed_units(tmp_path):
+    root = str(tmp_path)
+    unit_id = shard.plan(root, START, START)[0]
+    for _ in range(shard.SHARD_MAX_ATTEMPTS):
+        assert shard._claim(root, unit_id, "worker") is not None
+        assert shard._move(root, unit_id, shard.CLAIMED, shard.PENDING)
+    # out of attempts
+    assert shard._claim(root, unit_id, "worker") is None
+    assert shard._list_units(root, shard.FAILED) == [unit_id]
+
+    with pytest.raises(ShardQueueIncompleteException):
+        shard.reduce(root)
+
+    assert shard.plan(root, START, START) == [unit_id]
+    assert shard._list_units(root, shard.FAILED) == []
+    assert shard._claim(root, unit_id, "worker")["attempts"] == 1
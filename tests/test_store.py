@@ -0,0 +1,113 @@
+import polars as pl
+import pytest
+
+from polars.testing import assert_frame_equal
+import datetime
+import os
+
+from conftest import make_statcast
+from MLBTunnelBot.compute_tscore import score_pitches
+from MLBTunnelBot.store import (
+    COMPACTED,
+    DAILY,
+    append_scored_pairs,
+    compact,
+    scan_scored_pairs,
+)
+
+# three days of May and three of June
+START = datetime.date(2024, 5, 29)
+DAYS = 6
+PAIR_ORDER = ["game_pk", "pitcher", "at_bat_number", "pitch_number"]
+
+
+@pytest.fixture
+def scored_df() -> pl.DataFrame:
+    return score_pitches(make_statcast(START, days=DAYS))
+
+
+def _day(scored_df: pl.DataFrame, day: datetime.date) -> pl.DataFrame:
+    return scored_df.filter(pl.col("game_date").cast(pl.Date) == day)
+
+
+def _append_all(scored_df: pl.DataFrame, store_dir: str) -> None:
+    for i in range(DAYS):
+        day = START + datetime.timedelta(days=i)
+        _ = append_scored_pairs(_day(scored_df, day), day, store_dir=store_dir)
+
+
+def _files(store_dir: str, kind: str) -> list[str]:
+    return sorted(os.listdir(os.path.join(store_dir, kind)))
+
+
+def test_compact_only_finished_months(tmp_path, scored_df):
+    store_dir = str(tmp_path)
+    _append_all(scored_df, store_dir)
+
+    assert compact(store_dir, before=datetime.date(2024, 6, 1)) == ["2024-05"]
+
+    assert _files(store_dir, COMPACTED) == ["2024-05.arrow"]
+    assert _files(store_dir, DAILY) == [
+        "2024-06-01.arrow",
+        "2024-06-02.arrow",
+        "2024-06-03.arrow",
+    ]
+    assert_frame_equal(
+        scan_scored_pairs(store_dir).collect().sort(PAIR_ORDER),
+        scored_df.sort(PAIR_ORDER),
+    )
+
+
+def test_reappended_day_is_not_double_counted(tmp_path, scored_df):
+    store_dir = str(tmp_path)
+    _append_all(scored_df, store_dir)
+    _ = compact(store_dir, before=datetime.date(2024, 6, 1))
+
+    # rerun a compacted day with only part of its pairs
+    day = datetime.date(2024, 5, 30)
+    rerun_df = _day(scored_df, day).head(5)
+    _ = append_scored_pairs(rerun_df, day, store_dir=store_dir)
+
+    expected = pl.concat(
+        [scored_df.filter(pl.col("game_date").cast(pl.Date) != day), rerun_df]
+    )
+    assert_frame_equal(
+        scan_scored_pairs(store_dir).collect().sort(PAIR_ORDER),
+        expected.sort(PAIR_ORDER),
+    )
+
+    # compacting again folds the rerun into the month, replacing the old day
+    assert compact(store_dir, before=datetime.date(2024, 6, 1)) == ["2024-05"]
+    assert_frame_equal(
+        scan_scored_pairs(store_dir).collect().sort(PAIR_ORDER),
+        expected.sort(PAIR_ORDER),
+    )
+
+
+def test_scan_day_range_and_columns(tmp_path, scored_df):
+    store_dir = str(tmp_path)
+    _append_all(scored_df, store_dir)
+    _ = compact(store_dir, before=datetime.date(2024, 6, 1))
+
+    start, end = datetime.date(2024, 5, 31), datetime.date(2024, 6, 1)
+    columns = ["game_date", "pitcher", "tunnel_score"]
+    scanned = scan_scored_pairs(store_dir, start=start, end=end, columns=columns)
+
+    expected = scored_df.filter(
+        pl.col("game_date").cast(pl.Date).is_between(start, end)
+    ).select(columns)
+    result = scanned.collect()
+    assert result.columns == columns
+    assert_frame_equal(result.sort(columns), expected.sort(columns))
+
+
+def test_empty_or_missing_store(tmp_path):
+    columns = ["game_date", "tunnel_score"]
+
+    missing = scan_scored_pairs(str(tmp_path / "missing"), columns=columns).collect()
+    assert missing.is_empty()
+    assert missing.columns == columns
+
+    os.makedirs(tmp_path / "empty" / DAILY)
+    assert scan_scored_pairs(str(tmp_path / "empty")).collect().is_empty()
+    assert compact(str(tmp_path / "empty"), before=datetime.date(2024, 6, 1)) == []
@@ -0,0 +1,52 @@
+import polars as pl
+import pytest
+
+from polars.testing import assert_frame_equal
+
+from MLBTunnelBot.compute_tscore import score_pitches
+from MLBTunnelBot.partials import top_k
+from MLBTunnelBot.streaming import stream_scored_pairs, run_streaming
+
+PAIR_ORDER = ["game_pk", "pitcher", "at_bat_number", "pitch_number"]
+
+
+@pytest.mark.parametrize("partition_col", ["game_pk", "game_date"])
+def test_streaming_matches_in_memory(statcast_df, partition_col):
+    expected = score_pitches(statcast_df)
+    assert not expected.is_empty()
+
+    # a tiny budget so every partition becomes its own batch
+    batches = list(
+        stream_scored_pairs(
+            statcast_df.lazy(), partition_col=partition_col, memory_budget_mb=0.01
+        )
+    )
+    assert len(batches) > 1
+
+    assert_frame_equal(
+        pl.concat(batches).sort(PAIR_ORDER),
+        expected.sort(PAIR_ORDER),
+    )
+
+
+@pytest.mark.parametrize("partition_col", ["game_pk", "game_date"])
+def test_streaming_top_k_matches_in_memory(statcast_df, partition_col):
+    top_df, _, _ = run_streaming(
+        stream_scored_pairs(
+            statcast_df.lazy(), partition_col=partition_col, memory_budget_mb=0.01
+        ),
+        k=10,
+    )
+    assert_frame_equal(top_df, top_k(score_pitches(statcast_df), 10))
+
+
+def test_streaming_passes_the_guards_through(statcast_df):
+    guards = dict(distance_floor=1.0, min_pitcher_pitches=40)
+    expected = score_pitches(statcast_df, **guards)
+    assert expected.height < score_pitches(statcast_df).height
+
+    batches = stream_scored_pairs(statcast_df.lazy(), memory_budget_mb=0.01, **guards)
+    assert_frame_equal(
+        pl.concat(list(batches)).sort(PAIR_ORDER),
+        expected.sort(PAIR_ORDER),
+    )
@@ -0,0 +1,172 @@
+import imageio.v2 as imageio
+import numpy as np
+import pytest
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import resource
+
+from MLBTunnelBot import video
+from MLBTunnelBot.exceptions import ClipFrameRateMismatchException
+
+# 25 fps is a whole number of GIF centiseconds per frame, so no frames are
+# dropped or repeated when the GIF is read back
+FPS = 25
+HEIGHT, WIDTH = 240, 320
+DIM, FLASH, AFTER = 20, 220, 110
+
+
+def _write_clip(path: str, n_frames: int, release: int, fps: int = FPS) -> None:
+    """
+    A dim clip with a full frame flash on the release frame that fades to a
+    steadier brightness, and a small square moving every frame so no two
+    frames are the same.
+    """
+    writer = imageio.get_writer(path, fps=fps, quality=10, macro_block_size=1)
+    try:
+        for i in range(n_frames):
+            level = DIM if i < release else FLASH if i == release else AFTER
+            frame = np.full((HEIGHT, WIDTH, 3), level, dtype=np.uint8)
+            x = i * 4 % (WIDTH - 8)
+            frame[:8, x : x + 8] = 255 - level
+            writer.append_data(frame)
+    finally:
+        writer.close()
+
+
+def _brightness(path: str) -> np.ndarray:
+    reader = imageio.get_reader(path)
+    try:
+        return np.array(
+            [frame[8:, :, :3].mean() for frame in reader.iter_data()],
+            dtype=np.float32,
+        )
+    finally:
+        reader.close()
+
+
+def test_find_release_frame(tmp_path):
+    _write_clip(str(tmp_path / "a.mp4"), 40, release=10)
+    _write_clip(str(tmp_path / "b.mp4"), 50, release=16)
+
+    assert video.find_release_frame(str(tmp_path / "a.mp4")) == 10
+    assert video.find_release_frame(str(tmp_path / "b.mp4")) == 16
+
+
+def test_blend_crops_to_the_shared_size():
+    tunneled = np.full((4, 6, 8, 3), 200, dtype=np.uint8)
+    previous = np.full((3, 5, 10, 4), 100, dtype=np.uint8)
+
+    blended = video._blend(tunneled, previous, alpha=0.25)
+
+    assert blended.shape == (3, 5, 8, 3)
+    assert blended.dtype == np.uint8
+    assert (blended == 125).all()
+
+
+@pytest.mark.parametrize("ext", [".gif", ".mp4"])
+def test_overlay_lines_up_the_release_frames(tmp_path, ext):
+    _write_clip(str(tmp_path / "a.mp4"), 40, release=10)
+    _write_clip(str(tmp_path / "b.mp4"), 50, release=16)
+
+    [out_path] = video.overlay_clip_pairs(
+        [
+            dict(
+                tunneled_path=str(tmp_path / "a.mp4"),
+                previous_path=str(tmp_path / "b.mp4"),
+                out_path=str(tmp_path / "out" / f"overlay{ext}"),
+            )
+        ],
+        max_workers=1,
+    )
+
+    brightness = _brightness(out_path)
+    # the previous clip drops its first 6 frames, leaving 44 against 40
+    assert len(brightness) == 40
+    assert int(brightness.argmax()) == 10
+    # both clips flash on the same output frame
+    assert brightness[10] == pytest.approx(FLASH, abs=12)
+    assert brightness[9] == pytest.approx(DIM, abs=12)
+    assert brightness[11] == pytest.approx(AFTER, abs=12)
+    assert not list(tmp_path.glob("out/*.tmp.mov"))
+
+
+def test_overlay_rejects_clips_with_different_frame_rates(tmp_path):
+    _write_clip(str(tmp_path / "a.mp4"), 20, release=5, fps=25)
+    _write_clip(str(tmp_path / "b.mp4"), 20, release=5, fps=30)
+
+    with pytest.raises(ClipFrameRateMismatchException):
+        video.overlay_clips(
+            str(tmp_path / "a.mp4"),
+            str(tmp_path / "b.mp4"),
+            str(tmp_path / "overlay.mp4"),
+        )
+
+
+@pytest.mark.parametrize("ext", [".gif", ".mp4"])
+def test_failed_overlay_leaves_nothing_behind(tmp_path, monkeypatch, ext):
+    _write_clip(str(tmp_path / "a.mp4"), 40, release=10)
+    _write_clip(str(tmp_path / "b.mp4"), 40, release=10)
+    blend = video._blend
+    chunks = iter(range(1))
+
+    def failing_blend(tunneled, previous, alpha):
+        # the first chunk is written, the second one fails
+        if next(chunks, None) is None:
+            raise ValueError("blend failed")
+        return blend(tunneled, previous, alpha)
+
+    def no_encoding(*args, **kwargs):
+        raise AssertionError("a failed overlay is not encoded")
+
+    monkeypatch.setattr(video, "_blend", failing_blend)
+    monkeypatch.setattr(video.subprocess, "run", no_encoding)
+
+    with pytest.raises(ValueError, match="blend failed"):
+        video.overlay_clips(
+            str(tmp_path / "a.mp4"),
+            str(tmp_path / "b.mp4"),
+            str(tmp_path / f"overlay{ext}"),
+            tunneled_release=10,
+            previous_release=10,
+            chunk_size=8,
+        )
+
+    assert not list(tmp_path.glob("overlay*"))
+
+
+def _overlay_peak_rss_mb(kwargs: dict) -> float:
+    # module level, so the spawned process can unpickle it
+    video.overlay_clips(**kwargs)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _peak_rss_mb(tmp_path, n_frames: int, ext: str) -> float:
+    tunneled_path = str(tmp_path / f"a_{n_frames}.mp4")
+    previous_path = str(tmp_path / f"b_{n_frames}.mp4")
+    _write_clip(tunneled_path, n_frames, release=10)
+    _write_clip(previous_path, n_frames + 6, release=16)
+
+    # a fresh process per overlay, so each peak only covers its own overlay
+    with ProcessPoolExecutor(
+        max_workers=1, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        return executor.submit(
+            _overlay_peak_rss_mb,
+            dict(
+                tunneled_path=tunneled_path,
+                previous_path=previous_path,
+                out_path=str(tmp_path / f"overlay_{n_frames}{ext}"),
+                tunneled_release=10,
+                previous_release=16,
+            ),
+        ).result()
+
+
+@pytest.mark.parametrize("ext", [".gif", ".mp4"])
+def test_overlay_memory_does_not_grow_with_clip_length(tmp_path, ext):
+    short_mb = _peak_rss_mb(tmp_path, 100, ext)
+    long_mb = _peak_rss_mb(tmp_path, 600, ext)
+
+    # holding the extra 500 output frames would take well over 100 MB
+    assert long_mb - short_mb < 25